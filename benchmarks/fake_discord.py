@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import discord
+
+from bot.member_cache import MemberCache
+
+# Snowflake-sized IDs so the code under test sees realistic values
+_ids = itertools.count(1100000000000000000)
+
+def next_id():
+    return next(_ids)
+
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.id = next_id()
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await self.channel.guild.gateway.api_call()
+        return self
+
+
+class FakeChannel:
+    def __init__(self, guild, name="general"):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.gateway.api_call()
+        return FakeMessage(self)
+
+
+class FakeVoiceChannel(FakeChannel):
+    async def connect(self):
+        """Join the channel like discord.VoiceChannel.connect, without a socket"""
+        bot = self.guild.gateway.bot
+        if discord.utils.get(bot.voice_clients, guild=self.guild):
+            raise discord.ClientException("Already connected to a voice channel.")
+        await self.guild.gateway.api_call()
+        voice_client = FakeVoiceClient(bot, self)
+        bot.voice_clients.append(voice_client)
+        return voice_client
+
+
+class FakeMember:
+    def __init__(self, guild, name, bot=False):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.voice = None
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeGuild:
+    def __init__(self, gateway, index, members_per_guild):
+        self.gateway = gateway
+        self.id = next_id()
+        self.name = f"Guild {index}"
+        self.text_channel = FakeChannel(self)
+        self.voice_channel = FakeVoiceChannel(self, "Date Night")
+        self._channels = {channel.id: channel for channel in (self.text_channel, self.voice_channel)}
+        self._members = {}
+        for number in range(members_per_guild):
+            member = FakeMember(self, f"user{index}-{number}")
+            member.voice = FakeVoiceState(self.voice_channel)
+            self._members[member.id] = member
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id):
+        # Like the real bot, which runs without the members intent
+        return None
+
+    async def fetch_member(self, user_id):
+        """REST lookup like discord.Guild.fetch_member"""
+        await self.gateway.api_call()
+        member = self._members.get(user_id)
+        if member is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+
+class StubAudioSource(discord.AudioSource):
+    """Silent PCM source used instead of an FFmpeg process"""
+
+    def __init__(self, duration):
+        self.frames = int(duration * 50)  # 20ms frames
+
+    def read(self):
+        if self.frames <= 0:
+            return b''
+        self.frames -= 1
+        return b'\x00' * discord.opus.Encoder.FRAME_SIZE
+
+
+class FakeVoiceClient:
+    """Voice client that 'plays' a track by waiting for its length"""
+
+    def __init__(self, bot, channel):
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self.source = None
+        self._after = None
+        self._handle = None
+        self._paused = False
+
+    def play(self, source, *, after=None):
+        if self.source is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._after = after
+        self._paused = False
+        self._handle = asyncio.get_running_loop().call_later(self.guild.gateway.track_seconds, self._finish)
+
+    def _finish(self, error=None):
+        if self._handle:
+            self._handle.cancel()
+        after, self._after, self.source, self._handle = self._after, None, None, None
+        if after:
+            after(error)
+
+    def is_playing(self):
+        return self.source is not None and not self._paused
+
+    def is_paused(self):
+        return self.source is not None and self._paused
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        if self.source is not None:
+            self._finish()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        if self in self.bot.voice_clients:
+            self.bot.voice_clients.remove(self)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, *, embed=None, ephemeral=False, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        self.interaction.record(content, embed)
+        await self.interaction.gateway.api_call()
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        await self.interaction.gateway.api_call()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, *, embed=None, file=None, ephemeral=False, **kwargs):
+        self.interaction.record(content, embed)
+        await self.interaction.gateway.api_call()
+
+
+class FakeInteraction:
+    """The parts of discord.Interaction the cogs use"""
+
+    def __init__(self, gateway, guild, user):
+        self.gateway = gateway
+        self.id = next_id()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = guild.text_channel
+        self.channel_id = guild.text_channel.id
+        self.created_at = datetime.now(timezone.utc)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+
+    def record(self, content, embed):
+        self.messages.append((content, embed))
+
+    @property
+    def failed(self):
+        """Whether the command answered with one of the bot's error messages"""
+        for content, embed in self.messages:
+            if content and content.startswith("❌"):
+                return True
+            if embed and embed.title and embed.title.startswith("❌"):
+                return True
+        return False
+
+
+class FakeGateway:
+    """Stands in for the Discord gateway and REST API: guilds, members and API latency"""
+
+    def __init__(self, guilds=1000, members_per_guild=2, api_latency=0.0, track_seconds=1.0):
+        self.api_latency = api_latency
+        self.track_seconds = track_seconds
+        self.bot = None
+        self.guilds = [FakeGuild(self, index, members_per_guild) for index in range(guilds)]
+        self._guilds = {guild.id: guild for guild in self.guilds}
+
+    async def api_call(self):
+        """Simulate a REST round trip to Discord"""
+        if self.api_latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.api_latency)
+        else:
+            await asyncio.sleep(0)
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def interaction(self, guild=None, user=None):
+        guild = guild or random.choice(self.guilds)
+        user = user or random.choice(guild.members)
+        return FakeInteraction(self, guild, user)
+
+
+class FakeBot:
+    """The parts of CoupleBot the cogs use, backed by a FakeGateway"""
+
+    def __init__(self, gateway, db):
+        self.gateway = gateway
+        self.db = db
+        self.voice_clients = []
+        self.music_handoff = None
+        self.member_cache = MemberCache()
+        self.cogs = {}
+        self.loop = asyncio.get_running_loop()
+        gateway.bot = self
+
+    @property
+    def guilds(self):
+        return self.gateway.guilds
+
+    def get_guild(self, guild_id):
+        return self.gateway.get_guild(guild_id)
+
+    def add_view(self, view, *, message_id=None):
+        pass
+
+    def add_cog(self, cog):
+        self.cogs[cog.qualified_name] = cog
+        return cog
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
@@ -0,0 +1,144 @@
+"""Run several leader elections sharing one SQLite file and kill the leader.
+
+Run from the repository root:
+
+    python -m benchmarks.leader_failover --processes 3 --kills 3 --ttl 3
+
+Each child process runs LeaderElection.run_once every renew interval, the
+way CoupleBot.leader_task does, and reports whenever is_leader changes.
+The parent SIGKILLs whoever leads, measures how long until another process
+takes over, and checks that leadership never overlapped and that every new
+leader got a higher fencing token.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+
+from bot.database import Database
+from bot.leader import LeaderElection
+
+
+def elect(db_path, ttl, events):
+    """Child process: compete for the lease until killed"""
+    logging.basicConfig(level=logging.WARNING)
+
+    async def run():
+        db = Database(db_path)
+        election = LeaderElection(db, holder=f"pid-{os.getpid()}", ttl=ttl)
+        leading = False
+        next_renewal = 0.0
+        while True:
+            if time.monotonic() >= next_renewal:
+                next_renewal = time.monotonic() + election.renew_interval
+                await election.run_once()
+            if election.is_leader != leading:
+                leading = election.is_leader
+                events.put((time.time(), os.getpid(), leading, election.token))
+            await asyncio.sleep(0.02)
+
+    asyncio.run(run())
+
+
+def wait_for_leader(events, leaders, history, timeout):
+    """Collect events until some process leads, returning its pid"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if leaders:
+            return next(iter(leaders))
+        try:
+            at, pid, leading, token = events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        history.append((at, pid, leading, token))
+        if leading:
+            leaders[pid] = token
+        else:
+            leaders.pop(pid, None)
+    raise RuntimeError(f"No leader after {timeout}s")
+
+
+def check_history(history, killed):
+    """Leadership intervals must not overlap and tokens must keep going up"""
+    intervals, started, tokens = [], {}, []
+    for at, pid, leading, token in sorted(history):
+        if leading:
+            started[pid] = at
+            tokens.append(token)
+        elif pid in started:
+            intervals.append((started.pop(pid), at, pid))
+    for pid, at in started.items():
+        intervals.append((at, killed.get(pid, float('inf')), pid))
+    intervals.sort()
+    overlaps = sum(1 for a, b in zip(intervals, intervals[1:]) if b[0] < a[1])
+    increasing = all(a < b for a, b in zip(tokens, tokens[1:]))
+    return overlaps, increasing, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure leader failover between processes sharing one SQLite file")
+    parser.add_argument("--processes", type=int, default=3, help="Competing processes")
+    parser.add_argument("--kills", type=int, default=3, help="Times to kill the current leader")
+    parser.add_argument("--ttl", type=float, default=3, help="Lease length in seconds")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "couple_bot.db")
+    asyncio.run(Database(db_path).init_db())
+
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    processes = {}
+
+    def spawn():
+        process = context.Process(target=elect, args=(db_path, args.ttl, events), daemon=True)
+        process.start()
+        processes[process.pid] = process
+
+    for _ in range(args.processes):
+        spawn()
+
+    leaders, history, killed, failovers = {}, [], {}, []
+    timeout = args.ttl * 3 + 10
+    try:
+        leader = wait_for_leader(events, leaders, history, timeout)
+        print(f"{args.processes} processes, {args.ttl}s lease, first leader pid {leader} (token {leaders[leader]})\n")
+        for _ in range(args.kills):
+            time.sleep(args.ttl)
+            processes.pop(leader).kill()
+            killed_at = time.time()
+            killed[leader] = killed_at
+            leaders.pop(leader, None)
+            spawn()
+            leader = wait_for_leader(events, leaders, history, timeout)
+            taken_at = max(at for at, pid, leading, _ in history if pid == leader and leading)
+            failovers.append(taken_at - killed_at)
+            print(f"Killed leader, pid {leader} took over in {failovers[-1]:.2f}s (token {leaders[leader]})")
+        time.sleep(args.ttl)
+    finally:
+        for process in processes.values():
+            process.kill()
+
+    while True:
+        try:
+            history.append(events.get(timeout=0.5))
+        except queue.Empty:
+            break
+
+    overlaps, increasing, tokens = check_history(history, killed)
+    print(f"\nFailover: mean {sum(failovers) / len(failovers):.2f}s, max {max(failovers):.2f}s" if failovers else "")
+    print(f"Overlapping leaders: {overlaps}, tokens {tokens} {'increasing' if increasing else 'NOT increasing'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'failovers': failovers, 'overlaps': overlaps, 'tokens': tokens}, f, indent=2)
+        print(f"\nWrote results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
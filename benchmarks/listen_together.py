@@ -0,0 +1,96 @@
+"""Measure CPU time of listen-together fan-out against one source per listener.
+
+Run from the repository root:
+
+    python -m benchmarks.listen_together --seconds 60 --listeners 1 2 4 8
+
+Each listener is a thread reading a track frame by frame, like discord.py's
+AudioPlayer. "source per listener" gives every thread its own upstream, as
+separate /play commands do; "shared stream" has them all read one
+SharedOpusStream. The upstream encodes silent PCM with libopus when it can
+be loaded, otherwise zlib stands in for the encoder's CPU cost.
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+
+import discord
+
+from bot.listen_together import SharedOpusStream
+
+
+class EncodingSource(discord.AudioSource):
+    """Upstream that pays an encoder's CPU cost for every frame, like FFmpegOpusAudio"""
+
+    def __init__(self, seconds):
+        self.frames = int(seconds * 50)
+        self.pcm = bytes(range(256)) * (discord.opus.Encoder.FRAME_SIZE // 256)
+        self.encoder = discord.opus.Encoder() if discord.opus.is_loaded() else None
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        if self.frames <= 0:
+            return b''
+        self.frames -= 1
+        if self.encoder:
+            return self.encoder.encode(self.pcm, discord.opus.Encoder.SAMPLES_PER_FRAME)
+        return zlib.compress(self.pcm, 9)
+
+
+def drain(source):
+    while source.read():
+        pass
+
+
+def run_once(mode, listeners, seconds):
+    if mode == 'shared stream':
+        stream = SharedOpusStream(EncodingSource(seconds), {'title': 'bench'})
+        sources = [stream.listen() for _ in range(listeners)]
+    else:
+        sources = [EncodingSource(seconds) for _ in range(listeners)]
+
+    threads = [threading.Thread(target=drain, args=(source,)) for source in sources]
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu_started
+    return {
+        'mode': mode,
+        'listeners': listeners,
+        'cpu_ms': cpu * 1000,
+        'wall_ms': (time.perf_counter() - started) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU time of shared and per-listener audio sources")
+    parser.add_argument("--seconds", type=float, default=60, help="Track length in seconds (50 frames each)")
+    parser.add_argument("--listeners", type=int, nargs="+", default=[1, 2, 4, 8], help="Listener counts to try")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    encoder = "libopus" if discord.opus.is_loaded() else "zlib stand-in"
+    print(f"Encoder: {encoder}, {int(args.seconds * 50)} frames per track\n")
+    print(f"{'mode':<22}{'listeners':>10}{'cpu ms':>10}{'wall ms':>10}")
+    results = []
+    for listeners in args.listeners:
+        for mode in ('source per listener', 'shared stream'):
+            row = run_once(mode, listeners, args.seconds)
+            results.append(row)
+            print(f"{mode:<22}{listeners:>10}{row['cpu_ms']:>10.0f}{row['wall_ms']:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\nWrote results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Drive the cogs' slash command callbacks against a fake Discord gateway.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --guilds 2000 --commands 20000 --concurrency 200
+
+Every command runs against a temporary SQLite database with mocked
+interactions, stubbed yt-dlp extraction and a silent audio source in
+place of FFmpeg. Reports p50/p99 latency and throughput per command.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import bot.music_cog as music_cog
+from bot.audio_cache import AudioCache
+from bot.calendar_cog import CalendarCog
+from bot.couple_cog import CoupleCog
+from bot.database import Database
+from bot.music_cog import MusicCog, YTDLSource
+from benchmarks.fake_discord import FakeBot, FakeGateway, StubAudioSource
+
+WORDS = ["dinner", "movie", "picnic", "concert", "beach", "hike", "museum", "brunch", "trip", "birthday"]
+
+
+class FakeYoutubeDL:
+    """Answers extract_info with synthetic tracks instead of hitting YouTube"""
+
+    def extract_info(self, query, download=False):
+        video_id = f"{zlib.crc32(query.encode()):011d}"
+        track = {
+            'id': video_id,
+            'extractor': 'youtube',
+            'title': f"Love song {video_id}",
+            'url': f"https://example.invalid/audio/{video_id}",
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'duration': 180
+        }
+        if query.startswith('ytsearch'):
+            return {'entries': [track]}
+        return track
+
+
+def install_stubs(track_seconds):
+    """Swap network and FFmpeg dependencies of the music cog for fakes"""
+    music_cog.ytdl = FakeYoutubeDL()
+    music_cog.playlist_ytdl = FakeYoutubeDL()
+    # max_duration=0 keeps every track out of the on-disk cache
+    music_cog.audio_cache = AudioCache(directory=tempfile.mkdtemp(), max_duration=0)
+    YTDLSource.from_data = classmethod(
+        lambda cls, data, start=0, gain=None: cls(StubAudioSource(track_seconds), data=data)
+    )
+
+
+def random_future_date():
+    return datetime.now() + timedelta(days=random.randint(1, 90), hours=random.randint(0, 23))
+
+
+def build_scenarios(calendar, couple, music):
+    """(name, weight, factory) where factory(interaction) returns the callback coroutine"""
+
+    def other_member(interaction):
+        return next(member for member in interaction.guild.members if member.id != interaction.user.id)
+
+    return [
+        ("add_date", 15, lambda i: calendar.add_date.callback(
+            calendar, i, random.choice(WORDS).title(), random_future_date().strftime("%Y-%m-%d"),
+            time="19:30", description=f"Our {random.choice(WORDS)} night",
+            repeat=random.choice([None, None, None, 'weekly', 'yearly'])
+        )),
+        ("upcoming_dates", 20, lambda i: calendar.upcoming_dates.callback(calendar, i, days=random.choice([7, 30, 90]))),
+        ("search_dates", 10, lambda i: calendar.search_dates.callback(calendar, i, random.choice(WORDS))),
+        ("date_night_ideas", 5, lambda i: calendar.date_night_ideas.callback(calendar, i)),
+        ("love_meter", 10, lambda i: couple.love_meter.callback(couple, i, other_member(i))),
+        ("anniversary", 5, lambda i: couple.set_anniversary.callback(
+            couple, i, other_member(i),
+            (datetime.now() - timedelta(days=random.randint(30, 3000))).strftime("%Y-%m-%d")
+        )),
+        ("milestones", 10, lambda i: couple.milestones.callback(couple, i)),
+        ("couple_stats", 5, lambda i: couple.couple_stats.callback(couple, i)),
+        ("play", 10, lambda i: music.play.callback(music, i, f"{random.choice(WORDS)} {random.randint(1, 500)}")),
+        ("queue", 10, lambda i: music.queue.callback(music, i)),
+        ("skip", 5, lambda i: music.skip.callback(music, i)),
+    ]
+
+
+async def seed(db, gateway, events_per_guild):
+    """Give every guild some dates so reads have something to return"""
+    for guild in gateway.guilds:
+        owner = guild.members[0]
+        records = [
+            {
+                'type': 'event',
+                'title': f"{random.choice(WORDS).title()} date",
+                'description': f"Remember the {random.choice(WORDS)}",
+                'event_date': random_future_date(),
+                'recurrence': random.choice([None, None, 'monthly'])
+            }
+            for _ in range(events_per_guild)
+        ]
+        await db.import_calendar(guild.id, owner.id, guild.text_channel.id, records)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+async def run(args):
+    random.seed(args.seed)
+    install_stubs(args.track_seconds)
+
+    directory = tempfile.mkdtemp()
+    db = Database(os.path.join(directory, "couple_bot.db"))
+    await db.init_db()
+
+    gateway = FakeGateway(args.guilds, args.members, args.api_latency / 1000, args.track_seconds)
+    bot = FakeBot(gateway, db)
+    calendar, couple, music = (bot.add_cog(cog(bot)) for cog in (CalendarCog, CoupleCog, MusicCog))
+    await music.cog_load()
+
+    if args.seed_events:
+        started = time.perf_counter()
+        await seed(db, gateway, args.seed_events)
+        print(f"Seeded {args.seed_events * args.guilds} events in {time.perf_counter() - started:.1f}s")
+
+    scenarios = build_scenarios(calendar, couple, music)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if scenario[0] in args.only]
+    names = [name for name, _, _ in scenarios]
+    weights = [weight for _, weight, _ in scenarios]
+    factories = {name: factory for name, _, factory in scenarios}
+    plan = random.choices(names, weights, k=args.commands)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    crashes = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def invoke(name):
+        async with semaphore:
+            interaction = gateway.interaction()
+            started = time.perf_counter()
+            try:
+                await factories[name](interaction)
+            except Exception:
+                crashes[name] += 1
+            latencies[name].append(time.perf_counter() - started)
+            if interaction.failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke(name) for name in plan))
+    elapsed = time.perf_counter() - started
+
+    await music.now_playing.flush()
+    music.now_playing.stop()
+    for voice_client in list(bot.voice_clients):
+        await voice_client.disconnect()
+    await db.close()
+
+    results = {}
+    for name in names + ['total']:
+        values = sorted(latencies[name]) if name != 'total' else sorted(v for vs in latencies.values() for v in vs)
+        results[name] = {
+            'count': len(values),
+            'errors': errors[name] if name != 'total' else sum(errors.values()),
+            'crashes': crashes[name] if name != 'total' else sum(crashes.values()),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'ops_per_sec': len(values) / elapsed if elapsed else 0.0
+        }
+
+    print(f"\n{args.commands} commands across {args.guilds} guilds, concurrency {args.concurrency}, "
+          f"{elapsed:.2f}s wall time\n")
+    print(f"{'command':<18}{'count':>8}{'errors':>8}{'crashes':>9}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}")
+    for name, row in results.items():
+        print(f"{name:<18}{row['count']:>8}{row['errors']:>8}{row['crashes']:>9}"
+              f"{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['ops_per_sec']:>10.1f}")
+
+    print(f"\nNow playing: {music.now_playing.sends} message(s) posted, {music.now_playing.edits} edit(s)")
+    members = bot.member_cache.stats()
+    print(f"Member cache: {members['hit_ratio']:.1%} hit ratio, {members['fetches']} fetch_member call(s) "
+          f"for {members['misses']} miss(es)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'elapsed': elapsed, 'results': results, 'member_cache': members}, f, indent=2)
+        print(f"\nWrote results to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot's slash commands against a fake Discord gateway")
+    parser.add_argument("--guilds", type=int, default=2000, help="Number of simulated guilds")
+    parser.add_argument("--members", type=int, default=2, help="Members per guild (at least 2)")
+    parser.add_argument("--commands", type=int, default=20000, help="Total commands to run")
+    parser.add_argument("--concurrency", type=int, default=200, help="Commands in flight at once")
+    parser.add_argument("--seed-events", type=int, default=5, help="Events created per guild before the run")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Simulated Discord API round trip in ms")
+    parser.add_argument("--track-seconds", type=float, default=1.0, help="How long each stub track plays")
+    parser.add_argument("--only", nargs="+", help="Only run these commands")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for a repeatable command mix")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show errors the cogs log")
+    args = parser.parse_args()
+
+    if args.members < 2:
+        parser.error("--members must be at least 2")
+
+    # Errors are counted in the report, the log lines are only noise unless asked for
+    logging.basicConfig(level=logging.ERROR if args.verbose else logging.CRITICAL)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
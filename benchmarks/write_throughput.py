@@ -0,0 +1,123 @@
+"""Measure SQLite write throughput with and without group commit.
+
+Run from the repository root:
+
+    python -m benchmarks.write_throughput --writes 2000 --writers 1 10 100
+
+Each run starts from an empty database and has N concurrent writers add
+calendar events until the total is reached. "commit per write" opens a
+connection and commits every write on its own, as Database did before
+the group-commit writer; "group commit" goes through Database itself.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from bot.database import Database
+from bot.storage import DEFAULT_REMINDER_OFFSETS, build_reminder_rows
+from benchmarks.load_test import percentile
+
+
+async def commit_per_write(db, guild_id, user_id, title, event_date):
+    """The old add_calendar_event: its own connection and transaction"""
+    async with aiosqlite.connect(db.db_path) as conn:
+        cursor = await conn.execute(
+            '''INSERT INTO calendar_events (guild_id, user_id, channel_id, title, description, event_date)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            (guild_id, user_id, 1, title, None, event_date)
+        )
+        await conn.executemany(
+            '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+               VALUES (?, ?, ?, ?)''',
+            build_reminder_rows(cursor.lastrowid, event_date, None, DEFAULT_REMINDER_OFFSETS, datetime.now())
+        )
+        await conn.commit()
+
+
+async def group_commit(db, guild_id, user_id, title, event_date):
+    await db.add_calendar_event(guild_id, user_id, 1, title, None, event_date)
+
+
+MODES = {
+    'commit per write': commit_per_write,
+    'group commit': group_commit
+}
+
+
+async def run_once(mode, writers, writes):
+    directory = tempfile.mkdtemp()
+    db = Database(os.path.join(directory, "couple_bot.db"))
+    await db.init_db()
+    write = MODES[mode]
+    event_date = datetime.now() + timedelta(days=30)
+    remaining = iter(range(writes))
+    latencies = []
+    errors = 0
+
+    async def writer(number):
+        nonlocal errors
+        for index in remaining:
+            started = time.perf_counter()
+            try:
+                await write(db, number, index, f"Date {index}", event_date)
+            except sqlite3.OperationalError:
+                # "database is locked" once the busy timeout runs out
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(number) for number in range(writers)))
+    elapsed = time.perf_counter() - started
+    commits = db.writer.commits
+    await db.close()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'writers': writers,
+        'writes': writes - errors,
+        'errors': errors,
+        'commits': commits if mode == 'group commit' else writes - errors,
+        'writes_per_sec': (writes - errors) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+async def run(args):
+    results = []
+    print(f"{'mode':<18}{'writers':>8}{'writes/s':>10}{'commits':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for writers in args.writers:
+        for mode in MODES:
+            row = await run_once(mode, writers, args.writes)
+            results.append(row)
+            print(f"{mode:<18}{writers:>8}{row['writes_per_sec']:>10.0f}{row['commits']:>9}{row['errors']:>8}"
+                  f"{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\nWrote results to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite writes/sec with and without group commit")
+    parser.add_argument("--writes", type=int, default=2000, help="Events written per run")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 10, 100], help="Concurrent writer counts to try")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import time
+import logging
+import tracemalloc
+from bot.memory import LOW_MEMORY, format_bytes, start_tracing, subsystem_sizes, top_allocators
+
+logger = logging.getLogger(__name__)
+
+class AdminCog(commands.Cog):
+    """Owner-only maintenance commands"""
+    
+    def __init__(self, bot):
+        self.bot = bot
+    
+    async def ensure_owner(self, interaction: discord.Interaction):
+        """Check the user owns the bot, telling them off if not"""
+        if await self.bot.is_owner(interaction.user):
+            return True
+        await interaction.response.send_message(
+            "❌ Only the bot owner can use this command!",
+            ephemeral=True
+        )
+        return False
+    
+    @app_commands.command(name="reload", description="Reload a part of the bot without restarting (owner only) 🔄")
+    @app_commands.describe(
+        cog="Which part to reload",
+        sync="Also sync slash commands (only needed if command options changed)"
+    )
+    @app_commands.choices(cog=[
+        app_commands.Choice(name="Calendar", value="bot.calendar_cog"),
+        app_commands.Choice(name="Couple", value="bot.couple_cog"),
+        app_commands.Choice(name="Music", value="bot.music_cog")
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def reload(self, interaction: discord.Interaction, cog: str, sync: bool = False):
+        """Reload a cog, handing its state over to the new version"""
+        if not await self.ensure_owner(interaction):
+            return
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            started = time.perf_counter()
+            await self.bot.reload_extension(cog)
+            message = f"🔄 Reloaded `{cog}` in {(time.perf_counter() - started) * 1000:.0f}ms!"
+            if sync:
+                synced = await self.bot.tree.sync()
+                message += f" Synced {len(synced)} command(s)."
+            logger.info("Reloaded extension %s", cog)
+            await interaction.followup.send(message, ephemeral=True)
+        except commands.ExtensionError as e:
+            logger.error("Failed to reload %s: %s", cog, e)
+            await interaction.followup.send(
+                f"❌ Reload failed, the previous version is still running: {e}",
+                ephemeral=True
+            )
+    
+    @app_commands.command(name="diagnostics", description="Show event loop diagnostics (owner only) 🩺")
+    @app_commands.default_permissions(administrator=True)
+    async def diagnostics(self, interaction: discord.Interaction):
+        """Show task timings and event loop stalls"""
+        if not await self.ensure_owner(interaction):
+            return
+        
+        diagnostics = self.bot.diagnostics
+        if diagnostics is None:
+            await interaction.response.send_message(
+                "❌ Diagnostics are off. Start the bot with `DIAGNOSTICS=1` to enable them.",
+                ephemeral=True
+            )
+            return
+        
+        uptime = time.perf_counter() - diagnostics.started_at
+        embed = discord.Embed(
+            title="🩺 Event Loop Diagnostics",
+            description=f"Watching for {uptime / 60:.0f} min, slow threshold {diagnostics.slow_threshold * 1000:.0f}ms",
+            color=0xff69b4,
+            timestamp=interaction.created_at
+        )
+        
+        lines = [f"{'coroutine':<32}{'runs':>6}{'cpu ms':>9}{'max ms':>8}"]
+        for name, stats in diagnostics.top_tasks(limit=10):
+            lines.append(f"{name[-32:]:<32}{stats.count:>6}{stats.cpu * 1000:>9.0f}{stats.max_step * 1000:>8.1f}")
+        embed.add_field(
+            name="⏱️ Most CPU by task",
+            value="```\n" + "\n".join(lines)[:1000] + "\n```",
+            inline=False
+        )
+        
+        if diagnostics.stalls:
+            last = diagnostics.stalls[-1]
+            frames = last['stack'].strip().splitlines()[-4:]
+            embed.add_field(
+                name=f"🐢 Loop stalls: {len(diagnostics.stalls)}",
+                value=f"Last one blocked for {last['duration'] * 1000:.0f}ms <t:{int(last['at'])}:R>\n```\n" + "\n".join(frames)[-900:] + "\n```",
+                inline=False
+            )
+        else:
+            embed.add_field(name="🐢 Loop stalls", value="None so far! ✨", inline=False)
+        
+        members = self.bot.member_cache.stats()
+        embed.add_field(
+            name="👥 Member cache",
+            value=f"{members['hit_ratio']:.0%} hits ({members['hits']}/{members['hits'] + members['misses']}), "
+                  f"{members['fetches']} fetch(es), {members['entries']} cached",
+            inline=False
+        )
+        
+        embed.set_footer(text="Use /profile for a sampling profile")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    @app_commands.command(name="profile", description="Record a sampling profile of the bot (owner only) 🔬")
+    @app_commands.describe(seconds="How long to sample (1-60, default: 10)")
+    @app_commands.default_permissions(administrator=True)
+    async def profile(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 60] = 10):
+        """Sample every thread's stack and send the folded-stack file"""
+        if not await self.ensure_owner(interaction):
+            return
+        
+        if self.bot.diagnostics is None:
+            await interaction.response.send_message(
+                "❌ Diagnostics are off. Start the bot with `DIAGNOSTICS=1` to enable them.",
+                ephemeral=True
+            )
+            return
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            path = await self.bot.diagnostics.dump_profile(seconds)
+            await interaction.followup.send(
+                f"🔬 Sampled for {seconds}s. Open it with speedscope or flamegraph.pl!",
+                file=discord.File(path),
+                ephemeral=True
+            )
+        except Exception as e:
+            logger.error("Error recording profile: %s", e)
+            await interaction.followup.send(
+                f"❌ Couldn't record a profile: {e}",
+                ephemeral=True
+            )
+    
+    @app_commands.command(name="memory", description="Show what is using memory (owner only) 🧠")
+    @app_commands.default_permissions(administrator=True)
+    async def memory(self, interaction: discord.Interaction):
+        """Show bytes held per subsystem and tracemalloc's top allocating lines"""
+        if not await self.ensure_owner(interaction):
+            return
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            sizes = subsystem_sizes(self.bot)
+            embed = discord.Embed(
+                title="🧠 Memory",
+                description=f"Low-memory mode is **{'on' if LOW_MEMORY else 'off'}**",
+                color=0xff69b4,
+                timestamp=interaction.created_at
+            )
+            lines = [f"{name:<20}{format_bytes(size):>12}" for name, size in sizes]
+            embed.add_field(
+                name="📦 By subsystem",
+                value="```\n" + "\n".join(lines) + "\n```",
+                inline=False
+            )
+            
+            if start_tracing():
+                embed.add_field(
+                    name="🔍 Top allocators",
+                    value="tracemalloc wasn't running, so it started now. Run `/memory` again in a while to see where memory goes!",
+                    inline=False
+                )
+            else:
+                # Grouping a snapshot by line takes a moment with many traces
+                top = await self.bot.loop.run_in_executor(None, top_allocators, 8)
+                current, peak = tracemalloc.get_traced_memory()
+                lines = [f"{location[-34:]:<34}{format_bytes(size):>10}" for location, size, _ in top]
+                embed.add_field(
+                    name=f"🔍 Top allocators ({format_bytes(current)} traced, peak {format_bytes(peak)})",
+                    value="```\n" + "\n".join(lines)[:1000] + "\n```",
+                    inline=False
+                )
+            
+            embed.set_footer(text="Sizes are approximate, shared objects count once")
+            await interaction.followup.send(embed=embed, ephemeral=True)
+        except Exception as e:
+            logger.error("Error reporting memory: %s", e)
+            await interaction.followup.send(
+                f"❌ Couldn't measure memory: {e}",
+                ephemeral=True
+            )
+
+async def setup(bot):
+    await bot.add_cog(AdminCog(bot))
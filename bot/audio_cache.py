@@ -0,0 +1,179 @@
+import asyncio
+import copy
+import glob
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# Partial downloads left behind by yt-dlp never count as cached audio
+_PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+
+class AudioCache:
+    """Size-bounded on-disk audio cache with LRU eviction.
+
+    Files are named after a hash of the extractor and video id, so the same
+    track always maps to the same file regardless of the query that found it.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, max_duration=1800, prefetch_concurrency=2):
+        self.directory = directory or os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+        if max_bytes is None:
+            max_bytes = int(os.getenv("AUDIO_CACHE_MAX_MB", "500")) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (path, size), oldest first
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._prefetch_semaphore = None
+        self._prefetch_concurrency = prefetch_concurrency
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from files already on disk"""
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(_PARTIAL_SUFFIXES):
+                # Leftovers from an interrupted download
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, os.path.splitext(name)[0], path, stat.st_size))
+
+        for _, key, path, size in sorted(files):
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+
+        self._evict()
+        logger.info("Audio cache loaded: %s file(s), %s MB", len(self._entries), self.total_bytes // (1024 * 1024))
+
+    @staticmethod
+    def cache_key(data):
+        """Content-addressed key for an extracted track"""
+        extractor = data.get('extractor_key') or data.get('extractor') or 'generic'
+        identity = data.get('id') or data.get('webpage_url') or data.get('url')
+        return hashlib.sha256(f"{extractor}:{identity}".encode()).hexdigest()[:32]
+
+    def is_cacheable(self, data):
+        """Check if a track is worth keeping on disk"""
+        if data.get('is_live'):
+            return False
+        duration = data.get('duration')
+        return duration is not None and duration <= self.max_duration
+
+    def get(self, data):
+        """Return the local file for a track if cached, marking it recently used"""
+        key = self.cache_key(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            path, size = entry
+            if not os.path.exists(path):
+                del self._entries[key]
+                self.total_bytes -= size
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            # Persist recency so the LRU order survives restarts
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def _register(self, key, path):
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self.total_bytes -= old[1]
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used files until the cache fits its budget"""
+        removed = []
+        with self._lock:
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                key, (path, size) = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                removed.append(path)
+
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Could not evict cached audio %s: %s", path, e)
+
+    def _download(self, key, data):
+        """Download a track into the cache (runs in a worker thread)"""
+        options = {
+            'format': 'bestaudio/best',
+            'outtmpl': os.path.join(self.directory, f'{key}.%(ext)s'),
+            'noplaylist': True,
+            'nocheckcertificate': True,
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+        }
+        with yt_dlp.YoutubeDL(options) as ydl:
+            # Reuse the already extracted info instead of extracting again (a Track becomes a plain dict)
+            ydl.process_ie_result(copy.deepcopy(dict(data)), download=True)
+
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f'{key}.*')):
+            if not path.endswith(_PARTIAL_SUFFIXES):
+                self._register(key, path)
+                return path
+        return None
+
+    async def fetch(self, data, *, loop=None):
+        """Make sure a track is cached and return its local path"""
+        path = self.get(data)
+        if path or not self.is_cacheable(data):
+            return path
+
+        key = self.cache_key(data)
+        # Share a single download between concurrent requests for the same track
+        future = self._pending.get(key)
+        if future is None:
+            loop = loop or asyncio.get_event_loop()
+            future = loop.run_in_executor(None, self._download, key, data)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        try:
+            return await asyncio.shield(future)
+        except Exception as e:
+            logger.warning("Failed to cache audio for %s: %s", data.get('title'), e)
+            return None
+
+    def prefetch(self, data, *, loop=None):
+        """Download a track in the background so it plays from disk later"""
+        if not self.is_cacheable(data) or self.get(data):
+            return None
+        loop = loop or asyncio.get_event_loop()
+        return loop.create_task(self._prefetch(data, loop))
+
+    async def _prefetch(self, data, loop):
+        if self._prefetch_semaphore is None:
+            self._prefetch_semaphore = asyncio.Semaphore(self._prefetch_concurrency)
+        async with self._prefetch_semaphore:
+            await self.fetch(data, loop=loop)
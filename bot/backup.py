@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = 'couple_bot-'
+BACKUP_SUFFIX = '.db.gz'
+# Files SQLite keeps next to a database while it is open or after a crash
+SIDECAR_SUFFIXES = ('-wal', '-shm', '-journal')
+
+
+def connect_read_only(path):
+    return sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", uri=True)
+
+
+class BackupRestarted(Exception):
+    """The source kept changing under an incremental backup"""
+
+
+def copy_database(source_path, target_path, pages=256, step_sleep=0.05, max_restarts=3):
+    """Copy a live database with the SQLite backup API, returning the number of pages.
+
+    Each step copies `pages` pages in a short read transaction, then sleeps.
+    A write from another connection makes SQLite restart the copy; after
+    max_restarts the whole database is copied again in one step. The
+    database runs in WAL mode, so that step reads a snapshot and writers
+    carry on while it runs.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted()
+        last_remaining = remaining
+        time.sleep(step_sleep)
+
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+    # Read-write, so a hot journal left by a crash can be rolled back first
+    source = sqlite3.connect(source_path)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except BackupRestarted:
+                logger.info("Database kept changing during backup, copying all of it in one step")
+                source.backup(target, pages=-1)
+            return target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def check_integrity(path):
+    """Run PRAGMA integrity_check, raising unless the database is intact"""
+    connection = connect_read_only(path)
+    try:
+        problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+    finally:
+        connection.close()
+    if problems != ['ok']:
+        raise sqlite3.DatabaseError(f"integrity check failed: {'; '.join(problems[:5])}")
+
+
+def decompress(backup_path, target_path):
+    with gzip.open(backup_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+def verify_backup(backup_path):
+    """Restore a compressed backup into a temporary file and check its integrity"""
+    fd, restored = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        decompress(backup_path, restored)
+        check_integrity(restored)
+    finally:
+        os.remove(restored)
+
+
+def create_backup(source_path, directory, pages=256, step_sleep=0.05):
+    """Back up, compress and verify a database, returning (path, pages)"""
+    os.makedirs(directory, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    copy_path = os.path.join(directory, f"{name}.db.partial")
+    partial = os.path.join(directory, f"{name}{BACKUP_SUFFIX}.partial")
+    path = os.path.join(directory, f"{name}{BACKUP_SUFFIX}")
+    try:
+        page_count = copy_database(source_path, copy_path, pages, step_sleep)
+        with open(copy_path, 'rb') as source, gzip.open(partial, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        # Only a backup that restores cleanly replaces anything
+        verify_backup(partial)
+        os.replace(partial, path)
+    finally:
+        for leftover in (copy_path, partial):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return path, page_count
+
+
+def list_backups(directory):
+    """Backups in a directory, oldest first (names sort by their timestamp)"""
+    pattern = os.path.join(glob.escape(directory), f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}")
+    return sorted(glob.glob(pattern))
+
+
+def rotate_backups(directory, keep):
+    """Delete all but the newest keep backups, returning the deleted paths"""
+    backups = list_backups(directory)
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("Could not remove old backup %s: %s", path, e)
+    return removed
+
+
+def restore_backup(backup_path, target_path, force=False):
+    """Replace target_path with a verified copy of a compressed backup.
+
+    SQLite replays a -wal (or rolls back a hot -journal) left next to the
+    database onto whatever file it opens there next, which would undo the
+    restore. Those files mean the bot is running or didn't shut down
+    cleanly, so the restore refuses unless force discards them.
+    """
+    sidecars = [f"{target_path}{suffix}" for suffix in SIDECAR_SUFFIXES if os.path.exists(f"{target_path}{suffix}")]
+    if sidecars and not force:
+        raise FileExistsError(
+            f"{', '.join(sidecars)} exist: stop the bot first, or force the restore to discard them"
+        )
+    partial = f"{target_path}.restore"
+    try:
+        decompress(backup_path, partial)
+        check_integrity(partial)
+        for path in sidecars:
+            os.remove(path)
+        os.replace(partial, target_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class BackupJob:
+    """Online backups of the SQLite database while the bot keeps running.
+
+    Each run copies the database with the backup API in small page steps
+    off the event loop, gzips it, restores the result into a temporary
+    file to check it with PRAGMA integrity_check, and keeps the newest
+    BACKUP_KEEP backups in BACKUP_DIR. A run only backs up once the newest
+    backup is interval_hours old, so restarts and a new leader don't take
+    extra ones.
+    """
+
+    def __init__(self, bot, directory=None, keep=None, interval_hours=None, pages=256, step_sleep=0.05):
+        self.bot = bot
+        self.directory = directory or os.getenv("BACKUP_DIR", "backups")
+        if interval_hours is None:
+            interval_hours = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))
+        self.interval_hours = interval_hours
+        if keep is None:
+            keep = int(os.getenv("BACKUP_KEEP", "8"))
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.last_backup = None
+
+    def is_due(self):
+        backups = list_backups(self.directory)
+        if not backups:
+            return True
+        return time.time() - os.path.getmtime(backups[-1]) >= self.interval_hours * 3600
+
+    async def run_once(self):
+        """Take a backup if one is due and rotate old ones, returning its path"""
+        source_path = getattr(self.bot.db, 'db_path', None)
+        if source_path is None or self.interval_hours <= 0:
+            # Off, or Postgres, which has its own tooling (pg_dump, WAL archiving)
+            return None
+        if not self.is_due():
+            return None
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        path, page_count = await loop.run_in_executor(
+            None, create_backup, source_path, self.directory, self.pages, self.step_sleep
+        )
+        removed = await loop.run_in_executor(None, rotate_backups, self.directory, self.keep)
+        self.last_backup = path
+        logger.info(
+            "Backed up %s page(s) to %s in %.1fs (%s KB), removed %s old backup(s)",
+            page_count, path, time.perf_counter() - started, os.path.getsize(path) // 1024, len(removed)
+        )
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up, verify or restore the bot's SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup = commands.add_parser("backup", help="Take a backup now, even while the bot runs")
+    backup.add_argument("--database", default=os.getenv("DATABASE_PATH", "couple_bot.db"))
+    backup.add_argument("--directory", default=os.getenv("BACKUP_DIR", "backups"))
+    verify = commands.add_parser("verify", help="Check that a backup restores cleanly")
+    verify.add_argument("backup")
+    restore = commands.add_parser("restore", help="Replace the database with a backup (stop the bot first)")
+    restore.add_argument("backup")
+    restore.add_argument("--database", default=os.getenv("DATABASE_PATH", "couple_bot.db"))
+    restore.add_argument("--force", action="store_true", help="Discard a -wal/-shm/-journal left next to the database")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        path, page_count = create_backup(args.database, args.directory)
+        print(f"Backed up {page_count} page(s) to {path}")
+    elif args.command == "verify":
+        verify_backup(args.backup)
+        print(f"{args.backup} restores cleanly")
+    else:
+        restore_backup(args.backup, args.database, force=args.force)
+        print(f"Restored {args.backup} to {args.database}")
+
+
+if __name__ == "__main__":
+    main()
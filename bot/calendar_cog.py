@@ -1,12 +1,30 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import aiohttp
+import io
 import re
 import logging
+import tempfile
+from bot.calendar_io import (
+    iter_ics_records, iter_ndjson_records, iter_ics_header, iter_ics_record,
+    format_ndjson_record, ICS_FOOTER
+)
+from bot.storage import DEFAULT_REMINDER_OFFSETS
+from bot.utils import parse_reminder_offsets, format_reminder_offset
 
 logger = logging.getLogger(__name__)
 
+MAX_IMPORT_BYTES = 10 * 1024 * 1024
+
+REPEAT_LABELS = {
+    'daily': "Every day",
+    'weekly': "Every week",
+    'monthly': "Every month",
+    'yearly': "Every year"
+}
+
 class CalendarCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -16,9 +34,16 @@ class CalendarCog(commands.Cog):
         title="What's the occasion?",
         date="Date in YYYY-MM-DD format",
         time="Time in HH:MM format (optional)",
-        description="Additional details about the date"
+        description="Additional details about the date",
+        repeat="Repeat this date automatically (optional)"
     )
-    async def add_date(self, interaction: discord.Interaction, title: str, date: str, time: str = '', description: str = ''):
+    @app_commands.choices(repeat=[
+        app_commands.Choice(name="Every day", value="daily"),
+        app_commands.Choice(name="Every week", value="weekly"),
+        app_commands.Choice(name="Every month", value="monthly"),
+        app_commands.Choice(name="Every year", value="yearly")
+    ])
+    async def add_date(self, interaction: discord.Interaction, title: str, date: str, time: str = '', description: str = '', repeat: str = None):
         """Add a date to the calendar"""
         try:
             # Parse date
@@ -52,6 +77,8 @@ class CalendarCog(commands.Cog):
                 )
                 return
             
+            reminder_offsets = await self.get_reminder_offsets(interaction.guild.id, interaction.user.id)
+            
             # Add to database
             event_id = await self.bot.db.add_calendar_event(
                 interaction.guild.id,
@@ -59,7 +86,9 @@ class CalendarCog(commands.Cog):
                 interaction.channel.id,
                 title,
                 description or "No description provided",
-                event_date
+                event_date,
+                recurrence=repeat,
+                reminder_offsets=reminder_offsets
             )
             
             # Create confirmation embed
@@ -83,9 +112,16 @@ class CalendarCog(commands.Cog):
                     inline=False
                 )
             
+            if repeat:
+                embed.add_field(
+                    name="🔁 Repeats",
+                    value=REPEAT_LABELS[repeat],
+                    inline=False
+                )
+            
             embed.add_field(
-                name="⏰ Reminder",
-                value="You'll get a reminder 24 hours before!",
+                name="⏰ Reminders",
+                value=f"You'll get reminders {', '.join(format_reminder_offset(offset) for offset in reminder_offsets)} before!",
                 inline=False
             )
             
@@ -99,12 +135,61 @@ class CalendarCog(commands.Cog):
                 ephemeral=True
             )
         except Exception as e:
-            logger.error(f"Error adding date: {e}")
+            logger.error("Error adding date: %s", e)
             await interaction.response.send_message(
                 "❌ Something went wrong while adding your date. Please try again!", 
                 ephemeral=True
             )
     
+    async def get_reminder_offsets(self, guild_id, user_id):
+        """Get a user's reminder offsets in minutes"""
+        value = await self.bot.db.get_user_preference(guild_id, user_id, 'reminder_offsets')
+        if not value:
+            return list(DEFAULT_REMINDER_OFFSETS)
+        return [int(offset) for offset in value.split(',')]
+    
+    @app_commands.command(name="reminder_settings", description="Choose when you get reminded about dates ⏰")
+    @app_commands.describe(offsets="How long before, e.g. '1w, 1d, 1h' (w=weeks, d=days, h=hours, m=minutes)")
+    async def reminder_settings(self, interaction: discord.Interaction, offsets: str):
+        """Set reminder offsets for new dates"""
+        try:
+            parsed = parse_reminder_offsets(offsets)
+        except ValueError:
+            await interaction.response.send_message(
+                "❌ Invalid reminder times! Use something like `1w, 1d, 1h` or `2d 30m`.", 
+                ephemeral=True
+            )
+            return
+        
+        if len(parsed) > 5 or parsed[0] > 4 * 10080:
+            await interaction.response.send_message(
+                "❌ You can have up to 5 reminders, at most 4 weeks before a date!", 
+                ephemeral=True
+            )
+            return
+        
+        try:
+            await self.bot.db.set_user_preference(
+                interaction.guild.id,
+                interaction.user.id,
+                'reminder_offsets',
+                ','.join(str(offset) for offset in parsed)
+            )
+            
+            embed = discord.Embed(
+                title="⏰ Reminders Updated",
+                description=f"New dates you add will remind you {', '.join(format_reminder_offset(offset) for offset in parsed)} before! 💕",
+                color=0x90EE90
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            
+        except Exception as e:
+            logger.error("Error saving reminder settings: %s", e)
+            await interaction.response.send_message(
+                "❌ Something went wrong while saving your reminder settings. Please try again!", 
+                ephemeral=True
+            )
+    
     @app_commands.command(name="upcoming_dates", description="View your upcoming dates and events 💖")
     @app_commands.describe(days="Number of days to look ahead (default: 30)")
     async def upcoming_dates(self, interaction: discord.Interaction, days: int = 30):
@@ -147,6 +232,9 @@ class CalendarCog(commands.Cog):
                 elif days_until <= 7:
                     time_text += f" (In {days_until} days)"
                 
+                if event.get('recurrence'):
+                    time_text += f" 🔁 {REPEAT_LABELS.get(event['recurrence'], event['recurrence'])}"
+                
                 embed.add_field(
                     name=f"💖 {event['title']}",
                     value=f"{time_text}\n{event['description'][:100]}{'...' if len(event['description']) > 100 else ''}",
@@ -159,12 +247,213 @@ class CalendarCog(commands.Cog):
             await interaction.response.send_message(embed=embed)
             
         except Exception as e:
-            logger.error(f"Error getting upcoming dates: {e}")
+            logger.error("Error getting upcoming dates: %s", e)
             await interaction.response.send_message(
                 "❌ Something went wrong while fetching your dates. Please try again!", 
                 ephemeral=True
             )
     
+    @app_commands.command(name="search_dates", description="Search your dates and milestones 🔍")
+    @app_commands.describe(
+        query="Words to look for in titles and descriptions",
+        page="Results page (default: 1)"
+    )
+    async def search_dates(self, interaction: discord.Interaction, query: str, page: int = 1):
+        """Search past and upcoming dates and milestones"""
+        try:
+            if page < 1:
+                await interaction.response.send_message(
+                    "❌ Page must be 1 or higher!", 
+                    ephemeral=True
+                )
+                return
+            
+            per_page = 10
+            total, results = await self.bot.db.search_dates(
+                interaction.guild.id,
+                query,
+                limit=per_page,
+                offset=(page - 1) * per_page
+            )
+            
+            if not results:
+                embed = discord.Embed(
+                    title="🔍 No Matches",
+                    description=f"Nothing found for **{query}**. Try different words! 💕" if total == 0
+                    else f"There are only {(total + per_page - 1) // per_page} page(s) of results.",
+                    color=0xff69b4
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            
+            embed = discord.Embed(
+                title=f"🔍 Results for \"{query}\"",
+                description=f"Found {total} matching moment{'s' if total != 1 else ''}:",
+                color=0xff69b4,
+                timestamp=datetime.now()
+            )
+            
+            for result in results:
+                result_date = datetime.fromisoformat(result['date']) if isinstance(result['date'], str) else result['date']
+                if result['kind'] == 'event':
+                    name = f"📅 {result['title']}"
+                    footer = f"Event ID: {result['id']}"
+                else:
+                    name = f"🏆 {result['title'].title()}"
+                    footer = "Milestone"
+                
+                embed.add_field(
+                    name=name[:256],
+                    value=f"<t:{int(result_date.timestamp())}:D> • {footer}\n{result['snippet'][:200]}",
+                    inline=False
+                )
+            
+            pages = (total + per_page - 1) // per_page
+            embed.set_footer(text=f"Page {page} of {pages} • Use the page option to see more")
+            
+            await interaction.response.send_message(embed=embed)
+            
+        except Exception as e:
+            logger.error("Error searching dates: %s", e)
+            await interaction.response.send_message(
+                "❌ Something went wrong while searching. Please try again!", 
+                ephemeral=True
+            )
+    
+    @app_commands.command(name="import_calendar", description="Import dates from an .ics or .ndjson file 📥")
+    @app_commands.describe(file="An .ics calendar or an .ndjson export from this bot")
+    async def import_calendar(self, interaction: discord.Interaction, file: discord.Attachment):
+        """Import dates and milestones from a file"""
+        name = file.filename.lower()
+        if name.endswith('.ics'):
+            parser = iter_ics_records
+        elif name.endswith(('.ndjson', '.jsonl')):
+            parser = iter_ndjson_records
+        else:
+            await interaction.response.send_message(
+                "❌ Please upload an `.ics` or `.ndjson` file!", 
+                ephemeral=True
+            )
+            return
+        
+        if file.size > MAX_IMPORT_BYTES:
+            await interaction.response.send_message(
+                f"❌ That file is too big! The limit is {MAX_IMPORT_BYTES // (1024 * 1024)} MB.", 
+                ephemeral=True
+            )
+            return
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+                # Stream the download to disk instead of holding it in memory
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(file.url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            spool.write(chunk)
+                spool.seek(0)
+                
+                errors = []
+                lines = io.TextIOWrapper(spool, encoding='utf-8-sig', errors='replace')
+                records = self._own_records(parser(lines, errors), interaction.user.id, errors)
+                reminder_offsets = await self.get_reminder_offsets(interaction.guild.id, interaction.user.id)
+                
+                event_count, milestone_count = await self.bot.db.import_calendar(
+                    interaction.guild.id,
+                    interaction.user.id,
+                    interaction.channel.id,
+                    records,
+                    reminder_offsets=reminder_offsets
+                )
+            
+            embed = discord.Embed(
+                title="📥 Calendar Imported!",
+                description=f"Imported **{event_count}** date{'s' if event_count != 1 else ''} and **{milestone_count}** milestone{'s' if milestone_count != 1 else ''}! 💕",
+                color=0x90EE90,
+                timestamp=datetime.now()
+            )
+            if errors:
+                shown = '\n'.join(errors[:5])
+                more = f"\n...and {len(errors) - 5} more" if len(errors) > 5 else ""
+                embed.add_field(
+                    name=f"⚠️ Skipped {len(errors)} entr{'ies' if len(errors) != 1 else 'y'}",
+                    value=f"{shown}{more}"[:1024],
+                    inline=False
+                )
+            
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            
+        except Exception as e:
+            logger.error("Error importing calendar: %s", e)
+            await interaction.followup.send(
+                "❌ Something went wrong while importing your calendar. Nothing was added, please try again!", 
+                ephemeral=True
+            )
+    
+    @staticmethod
+    def _own_records(records, user_id, errors):
+        """Only keep milestones that involve the importing user"""
+        for record in records:
+            if record['type'] == 'milestone':
+                if user_id not in (record['user1_id'], record['user2_id']):
+                    errors.append("Skipped a milestone that doesn't include you")
+                    continue
+                user1_id, user2_id = sorted((record['user1_id'], record['user2_id']))
+                record = {**record, 'user1_id': user1_id, 'user2_id': user2_id}
+            yield record
+    
+    @app_commands.command(name="export_calendar", description="Download all your dates and milestones 📤")
+    @app_commands.describe(format="File format (default: ics)")
+    @app_commands.choices(format=[
+        app_commands.Choice(name="Calendar file (.ics)", value="ics"),
+        app_commands.Choice(name="Backup file (.ndjson)", value="ndjson")
+    ])
+    async def export_calendar(self, interaction: discord.Interaction, format: str = "ics"):
+        """Export the guild's calendar to a file"""
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            count = 0
+            stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+            
+            with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+                if format == "ics":
+                    spool.writelines(line.encode() for line in iter_ics_header())
+                
+                # Rows are written as they are read, never all at once
+                async for record in self.bot.db.iter_calendar_export(interaction.guild.id):
+                    if format == "ics":
+                        spool.writelines(line.encode() for line in iter_ics_record(record, interaction.guild.id, stamp))
+                    else:
+                        spool.write(format_ndjson_record(record).encode())
+                    count += 1
+                
+                if format == "ics":
+                    spool.write(ICS_FOOTER.encode())
+                
+                if count == 0:
+                    await interaction.followup.send(
+                        "📅 There's nothing to export yet! Use `/add_date` to add some special moments! 💕", 
+                        ephemeral=True
+                    )
+                    return
+                
+                spool.seek(0)
+                await interaction.followup.send(
+                    f"📤 Here are your {count} dates and milestones! 💕",
+                    file=discord.File(spool, filename=f"couple_calendar.{format}"),
+                    ephemeral=True
+                )
+            
+        except Exception as e:
+            logger.error("Error exporting calendar: %s", e)
+            await interaction.followup.send(
+                "❌ Something went wrong while exporting your calendar. Please try again!", 
+                ephemeral=True
+            )
+    
     @app_commands.command(name="delete_date", description="Remove a date from your calendar")
     @app_commands.describe(event_id="The ID of the event to delete")
     async def delete_date(self, interaction: discord.Interaction, event_id: int):
@@ -188,7 +477,7 @@ class CalendarCog(commands.Cog):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             
         except Exception as e:
-            logger.error(f"Error deleting date: {e}")
+            logger.error("Error deleting date: %s", e)
             await interaction.response.send_message(
                 "❌ Something went wrong while deleting the date. Please try again!", 
                 ephemeral=True
@@ -240,3 +529,6 @@ class CalendarCog(commands.Cog):
         embed.set_footer(text="Run this command again for more ideas! 💕")
         
         await interaction.response.send_message(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(CalendarCog(bot))
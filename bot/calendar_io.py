@@ -0,0 +1,194 @@
+import json
+import re
+from datetime import datetime, timezone
+from bot.recurrence import RECURRENCE_RULES, parse_datetime
+
+ICS_FREQUENCIES = {rule.upper(): rule for rule in RECURRENCE_RULES}
+# RRULE parts that don't change which dates a FREQ rule produces; anything
+# else (COUNT, UNTIL, BYDAY, ...) would be lost, so those events are skipped
+ICS_IGNORED_RRULE_PARTS = {'FREQ', 'INTERVAL', 'WKST'}
+
+
+class InvalidRecord(ValueError):
+    """A single line or block in an import file could not be used"""
+
+
+def _event_record(title, description, event_date, recurrence=None):
+    if not title:
+        raise InvalidRecord("Missing title")
+    if recurrence is not None and recurrence not in RECURRENCE_RULES:
+        raise InvalidRecord(f"Unsupported repeat rule: {recurrence}")
+    return {
+        'type': 'event',
+        'title': title[:200],
+        'description': (description or "No description provided")[:1000],
+        'event_date': event_date,
+        'recurrence': recurrence
+    }
+
+
+def _local_time(value):
+    """Naive local time, the way dates added with /add_date are stored"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+def iter_ndjson_records(lines, errors):
+    """Parse NDJSON lines into event and milestone records, one at a time"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+            kind = data.get('type', 'event')
+            if kind == 'event':
+                yield _event_record(
+                    data.get('title'),
+                    data.get('description'),
+                    _local_time(parse_datetime(data['event_date'])),
+                    data.get('recurrence')
+                )
+            elif kind == 'milestone':
+                yield {
+                    'type': 'milestone',
+                    'user1_id': int(data['user1_id']),
+                    'user2_id': int(data['user2_id']),
+                    'milestone_type': str(data['milestone_type'])[:50],
+                    'milestone_date': _local_time(parse_datetime(data['milestone_date'])),
+                    'description': data.get('description') or ""
+                }
+            else:
+                raise InvalidRecord(f"Unknown record type: {kind}")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            errors.append(f"Line {number}: {e}")
+
+
+def _unfold_ics(lines):
+    """Join folded ICS content lines (continuations start with a space or tab)"""
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _unescape_ics(value):
+    # One left-to-right pass, so an escaped backslash followed by "n" stays as it is
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _escape_ics(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _parse_ics_date(value, params):
+    if 'VALUE=DATE' in params or len(value) == 8:
+        return datetime.strptime(value[:8], '%Y%m%d')
+    if value.endswith('Z'):
+        return _local_time(datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc))
+    return datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+
+
+def iter_ics_records(lines, errors):
+    """Parse VEVENT blocks from ICS lines into event records, one at a time"""
+    event = None
+    number = 0
+    for line in _unfold_ics(lines):
+        number += 1
+        name, _, value = line.partition(':')
+        name, _, params = name.partition(';')
+        name = name.upper()
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'line': number}
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            try:
+                if 'start' not in event:
+                    raise InvalidRecord("Missing DTSTART")
+                yield _event_record(event.get('summary'), event.get('description'), event['start'], event.get('recurrence'))
+            except InvalidRecord as e:
+                errors.append(f"Event at line {event['line']}: {e}")
+            event = None
+        elif event is not None:
+            try:
+                if name == 'SUMMARY':
+                    event['summary'] = _unescape_ics(value)
+                elif name == 'DESCRIPTION':
+                    event['description'] = _unescape_ics(value)
+                elif name == 'DTSTART':
+                    event['start'] = _parse_ics_date(value, params.upper())
+                elif name == 'RRULE':
+                    parts = dict(part.split('=', 1) for part in value.upper().split(';') if '=' in part)
+                    frequency = ICS_FREQUENCIES.get(parts.get('FREQ'))
+                    if (frequency is None or parts.get('INTERVAL', '1') != '1'
+                            or not parts.keys() <= ICS_IGNORED_RRULE_PARTS):
+                        raise InvalidRecord(f"Unsupported RRULE: {value}")
+                    event['recurrence'] = frequency
+            except ValueError as e:
+                errors.append(f"Event at line {event['line']}: {e}")
+                event = None
+
+
+def format_ndjson_record(record):
+    """Serialize an exported record as one NDJSON line"""
+    return json.dumps(record, default=_json_default, ensure_ascii=False) + '\n'
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _fold_ics(line):
+    """Fold a content line at 75 characters as ICS requires"""
+    chunks = [line[:75]]
+    line = line[75:]
+    while line:
+        chunks.append(' ' + line[:74])
+        line = line[74:]
+    return '\r\n'.join(chunks) + '\r\n'
+
+
+def iter_ics_header():
+    """Lines that open an ICS calendar"""
+    yield 'BEGIN:VCALENDAR\r\n'
+    yield 'VERSION:2.0\r\n'
+    yield 'PRODID:-//Couple Bot//Calendar Export//EN\r\n'
+
+
+ICS_FOOTER = 'END:VCALENDAR\r\n'
+
+
+def iter_ics_record(record, guild_id, stamp):
+    """Serialize an exported record as VEVENT lines"""
+    if record['type'] == 'event':
+        uid = f"event-{record['id']}-{guild_id}@couplebot"
+        summary = record['title']
+        start = parse_datetime(record['event_date'])
+        recurrence = record.get('recurrence')
+    else:
+        uid = f"milestone-{record['id']}-{guild_id}@couplebot"
+        summary = f"{record['milestone_type'].title()} 💖"
+        start = parse_datetime(record['milestone_date'])
+        recurrence = 'yearly' if record['milestone_type'] == 'anniversary' else None
+
+    yield 'BEGIN:VEVENT\r\n'
+    yield f'UID:{uid}\r\n'
+    yield f'DTSTAMP:{stamp}\r\n'
+    yield f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}\r\n"
+    if recurrence:
+        yield f'RRULE:FREQ={recurrence.upper()}\r\n'
+    yield _fold_ics(f'SUMMARY:{_escape_ics(summary)}')
+    if record.get('description'):
+        yield _fold_ics(f"DESCRIPTION:{_escape_ics(record['description'])}")
+    yield 'END:VEVENT\r\n'
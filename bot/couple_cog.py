@@ -2,8 +2,11 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from datetime import datetime, timedelta
+import asyncio
 import random
 import logging
+from bot.recurrence import next_occurrence
+from bot.utils import format_time_together
 
 logger = logging.getLogger(__name__)
 
@@ -124,19 +127,6 @@ class CoupleCog(commands.Cog):
                 f"Anniversary between {interaction.user.display_name} and {partner.display_name}"
             )
             
-            # Calculate time together
-            time_together = datetime.now() - anniversary_date
-            years = time_together.days // 365
-            months = (time_together.days % 365) // 30
-            days = time_together.days % 30
-            
-            time_text = ""
-            if years > 0:
-                time_text += f"{years} year{'s' if years != 1 else ''}, "
-            if months > 0:
-                time_text += f"{months} month{'s' if months != 1 else ''}, "
-            time_text += f"{days} day{'s' if days != 1 else ''}"
-            
             embed = discord.Embed(
                 title="💍 Anniversary Set!",
                 description=f"Anniversary date has been set for {interaction.user.mention} and {partner.mention}!",
@@ -152,14 +142,12 @@ class CoupleCog(commands.Cog):
             
             embed.add_field(
                 name="⏰ Time Together",
-                value=time_text,
+                value=format_time_together(anniversary_date),
                 inline=False
             )
             
-            # Calculate next anniversary
-            next_anniversary = anniversary_date.replace(year=datetime.now().year)
-            if next_anniversary < datetime.now():
-                next_anniversary = next_anniversary.replace(year=datetime.now().year + 1)
+            # Feb 29 anniversaries fall on Feb 28 in other years
+            next_anniversary = next_occurrence(anniversary_date, 'yearly', datetime.now())
             
             embed.add_field(
                 name="🎉 Next Anniversary",
@@ -177,7 +165,7 @@ class CoupleCog(commands.Cog):
                 ephemeral=True
             )
         except Exception as e:
-            logger.error(f"Error setting anniversary: {e}")
+            logger.error("Error setting anniversary: %s", e)
             await interaction.response.send_message(
                 "❌ Something went wrong while setting your anniversary. Please try again!", 
                 ephemeral=True
@@ -185,9 +173,9 @@ class CoupleCog(commands.Cog):
     
     @app_commands.command(name="milestones", description="View your relationship milestones! 🏆")
     async def milestones(self, interaction: discord.Interaction):
-        """View relationship milestones"""
+        """View the caller's relationship milestones"""
         try:
-            milestones = await self.bot.db.get_milestones(interaction.guild.id)
+            milestones = await self.bot.db.get_milestones(interaction.guild.id, interaction.user.id)
             
             if not milestones:
                 embed = discord.Embed(
@@ -205,10 +193,15 @@ class CoupleCog(commands.Cog):
                 timestamp=datetime.now()
             )
             
+            # Without the members intent most partners aren't in the gateway cache
+            user_ids = list({user_id for milestone in milestones[:10] for user_id in (milestone['user1_id'], milestone['user2_id'])})
+            found = await asyncio.gather(*(self.bot.member_cache.get_member(interaction.guild, user_id) for user_id in user_ids))
+            members = dict(zip(user_ids, found))
+            
             for milestone in milestones[:10]:  # Limit to 10
                 milestone_date = datetime.fromisoformat(milestone['milestone_date'].replace('Z', '+00:00')) if isinstance(milestone['milestone_date'], str) else milestone['milestone_date']
-                user1 = interaction.guild.get_member(milestone['user1_id'])
-                user2 = interaction.guild.get_member(milestone['user2_id'])
+                user1 = members[milestone['user1_id']]
+                user2 = members[milestone['user2_id']]
                 
                 user1_name = user1.display_name if user1 else "Unknown User"
                 user2_name = user2.display_name if user2 else "Unknown User"
@@ -225,12 +218,95 @@ class CoupleCog(commands.Cog):
             await interaction.response.send_message(embed=embed)
             
         except Exception as e:
-            logger.error(f"Error getting milestones: {e}")
+            logger.error("Error getting milestones: %s", e)
             await interaction.response.send_message(
                 "❌ Something went wrong while fetching milestones. Please try again!", 
                 ephemeral=True
             )
     
+    @app_commands.command(name="couple_stats", description="See your relationship stats at a glance! 📊")
+    @app_commands.describe(partner="Your partner (default: whoever you have the most milestones with)")
+    async def couple_stats(self, interaction: discord.Interaction, partner: discord.Member = None):
+        """Show a couple's summary from the stats table"""
+        try:
+            if partner and partner.id == interaction.user.id:
+                await interaction.response.send_message(
+                    "❌ Tag your partner, not yourself! 💕", 
+                    ephemeral=True
+                )
+                return
+            
+            stats = await self.bot.db.get_couple_stats(
+                interaction.guild.id,
+                interaction.user.id,
+                partner.id if partner else None
+            )
+            
+            if not stats:
+                embed = discord.Embed(
+                    title="📊 No Stats Yet",
+                    description="No milestones recorded for you yet! Use `/anniversary` to get started! 💕",
+                    color=0xff69b4
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            
+            now = datetime.now()
+            embed = discord.Embed(
+                title="📊 Couple Stats",
+                description=f"<@{stats['user1_id']}> ❤️ <@{stats['user2_id']}>",
+                color=0xff69b4,
+                timestamp=now
+            )
+            
+            anniversary_date = stats['anniversary_date']
+            if anniversary_date:
+                next_anniversary = next_occurrence(anniversary_date, 'yearly', now)
+                embed.add_field(
+                    name="⏰ Time Together",
+                    value=f"{format_time_together(anniversary_date, now)}\n({(now - anniversary_date).days:,} days)",
+                    inline=True
+                )
+                embed.add_field(
+                    name="🎉 Next Anniversary",
+                    value=f"<t:{int(next_anniversary.timestamp())}:D> (<t:{int(next_anniversary.timestamp())}:R>)",
+                    inline=True
+                )
+            else:
+                embed.add_field(
+                    name="⏰ Time Together",
+                    value="Set your anniversary with `/anniversary`!",
+                    inline=False
+                )
+            
+            milestone_lines = [
+                f"💖 {milestone_type.title()}: **{count}**"
+                for milestone_type, count in stats['milestone_counts'].items()
+            ]
+            embed.add_field(
+                name=f"🏆 Milestones ({stats['milestone_count']})",
+                value="\n".join(milestone_lines) or "None yet",
+                inline=False
+            )
+            
+            upcoming = stats['events_total'] - stats['events_attended']
+            embed.add_field(
+                name="📅 Dates",
+                value=f"Planned: **{stats['events_total']}**\nBeen on: **{stats['events_attended']}**\nComing up: **{upcoming}**",
+                inline=False
+            )
+            
+            embed.set_footer(text="Here's to many more memories together! 💕")
+            
+            await interaction.response.send_message(embed=embed)
+            
+        except Exception as e:
+            logger.error("Error getting couple stats: %s", e)
+            await interaction.response.send_message(
+                "❌ Something went wrong while fetching your stats. Please try again!", 
+                ephemeral=True
+            )
+    
     @app_commands.command(name="love_quote", description="Get a romantic quote! 💌")
     async def love_quote(self, interaction: discord.Interaction):
         """Send a random love quote"""
@@ -304,3 +380,6 @@ class CoupleCog(commands.Cog):
         embed.set_footer(text="Use this command again for a new question! 💕")
         
         await interaction.response.send_message(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(CoupleCog(bot))
@@ -3,16 +3,49 @@ import aiosqlite
 import asyncio
 from datetime import datetime, timedelta
 import logging
+import re
+import time
+from bot.group_commit import GroupCommitWriter
+from bot.recurrence import parse_datetime
+from bot.storage import (
+    StorageBackend, ARCHIVE_EVENT_FIELDS, DEFAULT_REMINDER_OFFSETS, build_reminder_rows, count_archived_by_couple,
+    iter_chunks, merge_upcoming_events, next_reminder_occurrence, pack_archive, plan_due_reminders, unpack_archive
+)
 
 logger = logging.getLogger(__name__)
 
-class Database:
+# A user's couples, one index seek per column (params: guild_id, user_id, guild_id, user_id)
+USER_COUPLES_SQL = '''SELECT id FROM couples WHERE guild_id = ? AND user1_id = ?
+                      UNION ALL
+                      SELECT id FROM couples WHERE guild_id = ? AND user2_id = ?'''
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+class Database(StorageBackend):
+    """SQLite storage backend"""
+    
     def __init__(self, db_path="couple_bot.db"):
         self.db_path = db_path
+        # Single-row writes from commands share transactions instead of each paying for a sync
+        self.writer = GroupCommitWriter(db_path)
     
     async def init_db(self):
         """Initialize the database with required tables"""
         async with aiosqlite.connect(self.db_path) as db:
+            # Free pages are handed back gradually by reclaim_space instead of a full VACUUM
+            cursor = await db.execute('PRAGMA auto_vacuum')
+            if (await cursor.fetchone())[0] != 2:
+                await db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                # Existing databases only switch over after one full rebuild
+                logger.info("Switching the database to incremental auto-vacuum")
+                await db.execute('VACUUM')
+            
+            # Readers (commands, online backups) don't block writers and writers don't block them
+            await db.execute('PRAGMA journal_mode = WAL')
+            
             # Calendar events table
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS calendar_events (
@@ -24,7 +57,54 @@ class Database:
                     description TEXT,
                     event_date DATETIME NOT NULL,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    reminder_sent BOOLEAN DEFAULT FALSE
+                    reminder_sent BOOLEAN DEFAULT FALSE,
+                    recurrence TEXT,
+                    couple_id INTEGER
+                )
+            ''')
+            
+            # Columns added after the first release
+            await self._add_missing_columns(db, 'calendar_events', {
+                'recurrence': 'TEXT',
+                'couple_id': 'INTEGER'
+            })
+            
+            await self._init_reminders_table(db)
+            
+            # Reminders waiting to be delivered (pending -> claimed -> sent/failed)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS reminder_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reminder_id INTEGER,
+                    event_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    event_date DATETIME NOT NULL,
+                    offset_minutes INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at DATETIME NOT NULL,
+                    claimed_at DATETIME,
+                    sent_at DATETIME,
+                    last_error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(event_id, offset_minutes, event_date)
+                )
+            ''')
+            await db.execute(
+                'CREATE INDEX IF NOT EXISTS idx_reminder_outbox_state ON reminder_outbox(state, next_attempt_at)'
+            )
+            
+            # Leases for leader election between replicas (expires_at is a unix timestamp)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    token INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
                 )
             ''')
             
@@ -51,9 +131,14 @@ class Database:
                     milestone_type TEXT NOT NULL,
                     milestone_date DATETIME NOT NULL,
                     description TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    couple_id INTEGER
                 )
             ''')
+            await self._add_missing_columns(db, 'couple_milestones', {
+                'couple_id': 'INTEGER'
+            })
+            await self._init_couples_table(db)
             
             # Music queue table
             await db.execute('''
@@ -68,77 +153,802 @@ class Database:
                 )
             ''')
             
+            # Metadata of played tracks, used for /play suggestions
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS track_metadata (
+                    track_key TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    duration INTEGER,
+                    play_count INTEGER DEFAULT 0,
+                    last_played_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    loudness_i REAL,
+                    loudness_tp REAL,
+                    loudness_lra REAL
+                )
+            ''')
+            await self._add_missing_columns(db, 'track_metadata', {
+                'loudness_i': 'REAL',
+                'loudness_tp': 'REAL',
+                'loudness_lra': 'REAL'
+            })
+            
+            # Past one-off events moved out of calendar_events, as gzipped NDJSON per guild
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS calendar_events_archive (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    guild_id INTEGER NOT NULL,
+                    event_count INTEGER NOT NULL,
+                    first_event_date DATETIME NOT NULL,
+                    last_event_date DATETIME NOT NULL,
+                    payload BLOB NOT NULL,
+                    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            await db.execute(
+                'CREATE INDEX IF NOT EXISTS idx_calendar_events_archive_guild ON calendar_events_archive(guild_id, first_event_date)'
+            )
+            await db.execute(
+                'CREATE INDEX IF NOT EXISTS idx_calendar_events_archivable ON calendar_events(event_date) WHERE recurrence IS NULL'
+            )
+            
+            await self._init_search_tables(db)
+            await self._init_stats_tables(db)
+            
             await db.commit()
             logger.info("Database initialized successfully")
     
-    async def add_calendar_event(self, guild_id, user_id, channel_id, title, description, event_date):
-        """Add a new calendar event"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def close(self):
+        """Commit queued writes and stop the writer task"""
+        await self.writer.close()
+    
+    async def _init_reminders_table(self, db):
+        """Create the reminders table, one row per event and reminder offset"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reminders'"
+        )
+        is_new = await cursor.fetchone() is None
+        
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                offset_minutes INTEGER NOT NULL,
+                occurrence_at DATETIME NOT NULL,
+                fire_at DATETIME NOT NULL,
+                UNIQUE(event_id, offset_minutes)
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders(fire_at)')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_reminders_delete AFTER DELETE ON calendar_events BEGIN
+                DELETE FROM reminders WHERE event_id = old.id;
+            END
+        ''')
+        
+        if is_new:
+            # Older databases tracked a single reminder with the reminder_sent flag
             cursor = await db.execute(
-                '''INSERT INTO calendar_events 
-                   (guild_id, user_id, channel_id, title, description, event_date)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (guild_id, user_id, channel_id, title, description, event_date)
+                '''SELECT id, event_date, recurrence FROM calendar_events
+                   WHERE reminder_sent = FALSE OR recurrence IS NOT NULL'''
             )
-            await db.commit()
-            return cursor.lastrowid
+            now = datetime.now()
+            rows = []
+            for event_id, event_date, recurrence in await cursor.fetchall():
+                rows.extend(build_reminder_rows(event_id, parse_datetime(event_date), recurrence, DEFAULT_REMINDER_OFFSETS, now))
+            await db.executemany(
+                '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+                   VALUES (?, ?, ?, ?)''',
+                rows
+            )
+    
+    async def _init_couples_table(self, db):
+        """Create the couples table that milestones and events point at"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'couples'"
+        )
+        is_new = await cursor.fetchone() is None
+        
+        # user1_id is always the smaller ID, so a pair has exactly one row
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS couples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                user1_id INTEGER NOT NULL,
+                user2_id INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(guild_id, user1_id, user2_id)
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_couples_user2 ON couples(guild_id, user2_id)')
+        await db.execute(
+            'CREATE INDEX IF NOT EXISTS idx_calendar_events_couple ON calendar_events(couple_id, event_date)'
+        )
+        await db.execute(
+            'CREATE INDEX IF NOT EXISTS idx_couple_milestones_couple_date ON couple_milestones(couple_id, milestone_date)'
+        )
+        
+        # Dates either partner planned before they became a couple count as the couple's
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couples_attach_events AFTER INSERT ON couples BEGIN
+                UPDATE calendar_events SET couple_id = new.id
+                WHERE guild_id = new.guild_id AND couple_id IS NULL AND user_id IN (new.user1_id, new.user2_id);
+            END
+        ''')
+        
+        if is_new:
+            await db.execute('''
+                INSERT INTO couples (guild_id, user1_id, user2_id)
+                SELECT guild_id, min(user1_id, user2_id), max(user1_id, user2_id)
+                FROM couple_milestones
+                GROUP BY 1, 2, 3
+                ORDER BY MIN(id)
+            ''')
+            await db.execute('''
+                UPDATE couple_milestones SET couple_id = (
+                    SELECT id FROM couples c
+                    WHERE c.guild_id = couple_milestones.guild_id
+                      AND c.user1_id = min(couple_milestones.user1_id, couple_milestones.user2_id)
+                      AND c.user2_id = max(couple_milestones.user1_id, couple_milestones.user2_id)
+                )
+                WHERE couple_id IS NULL
+            ''')
+            
+            # Stats used to match events by creator, recount them by couple
+            cursor = await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'couple_stats'"
+            )
+            if await cursor.fetchone() is not None:
+                for name in ('couple_milestones_stats_insert', 'couple_milestones_stats_delete',
+                             'calendar_events_stats_insert', 'calendar_events_stats_delete'):
+                    await db.execute(f'DROP TRIGGER IF EXISTS {name}')
+                await db.execute('DROP INDEX IF EXISTS idx_calendar_events_guild_user')
+                await db.execute('DROP INDEX IF EXISTS idx_couple_milestones_couple')
+                await db.execute('''
+                    UPDATE couple_stats SET
+                        events_total = (
+                            SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                            WHERE c.guild_id = couple_stats.guild_id
+                              AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+                        ),
+                        events_attended = 0,
+                        attended_through = NULL
+                ''')
+    
+    async def _init_stats_tables(self, db):
+        """Create per-couple summary tables that triggers keep up to date"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'couple_stats'"
+        )
+        is_new = await cursor.fetchone() is None
+        
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS couple_stats (
+                guild_id INTEGER NOT NULL,
+                user1_id INTEGER NOT NULL,
+                user2_id INTEGER NOT NULL,
+                anniversary_date DATETIME,
+                milestone_count INTEGER NOT NULL DEFAULT 0,
+                events_total INTEGER NOT NULL DEFAULT 0,
+                events_attended INTEGER NOT NULL DEFAULT 0,
+                attended_through DATETIME,
+                PRIMARY KEY (guild_id, user1_id, user2_id)
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_couple_stats_user2 ON couple_stats(guild_id, user2_id)')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS couple_milestone_counts (
+                guild_id INTEGER NOT NULL,
+                user1_id INTEGER NOT NULL,
+                user2_id INTEGER NOT NULL,
+                milestone_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, user1_id, user2_id, milestone_type)
+            )
+        ''')
+        
+        if is_new:
+            await db.execute('''
+                INSERT INTO couple_stats (guild_id, user1_id, user2_id, anniversary_date, milestone_count)
+                SELECT guild_id, min(user1_id, user2_id), max(user1_id, user2_id),
+                       MIN(CASE WHEN milestone_type = 'anniversary' THEN milestone_date END), COUNT(*)
+                FROM couple_milestones
+                GROUP BY 1, 2, 3
+            ''')
+            await db.execute('''
+                INSERT INTO couple_milestone_counts (guild_id, user1_id, user2_id, milestone_type, count)
+                SELECT guild_id, min(user1_id, user2_id), max(user1_id, user2_id), milestone_type, COUNT(*)
+                FROM couple_milestones
+                GROUP BY 1, 2, 3, 4
+            ''')
+            await db.execute('''
+                UPDATE couple_stats SET events_total = (
+                    SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                    WHERE c.guild_id = couple_stats.guild_id
+                      AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+                )
+            ''')
+        
+        # Milestones create the couple's row; events count towards the couple they belong to
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couple_milestones_stats_insert AFTER INSERT ON couple_milestones BEGIN
+                INSERT OR IGNORE INTO couple_stats (guild_id, user1_id, user2_id, events_total)
+                VALUES (
+                    new.guild_id, min(new.user1_id, new.user2_id), max(new.user1_id, new.user2_id),
+                    (SELECT COUNT(*) FROM calendar_events WHERE couple_id = new.couple_id)
+                );
+                UPDATE couple_stats SET
+                    milestone_count = milestone_count + 1,
+                    anniversary_date = CASE
+                        WHEN new.milestone_type = 'anniversary'
+                             AND (anniversary_date IS NULL OR new.milestone_date < anniversary_date)
+                        THEN new.milestone_date ELSE anniversary_date END
+                WHERE guild_id = new.guild_id
+                  AND user1_id = min(new.user1_id, new.user2_id) AND user2_id = max(new.user1_id, new.user2_id);
+                INSERT OR IGNORE INTO couple_milestone_counts (guild_id, user1_id, user2_id, milestone_type)
+                VALUES (new.guild_id, min(new.user1_id, new.user2_id), max(new.user1_id, new.user2_id), new.milestone_type);
+                UPDATE couple_milestone_counts SET count = count + 1
+                WHERE guild_id = new.guild_id AND milestone_type = new.milestone_type
+                  AND user1_id = min(new.user1_id, new.user2_id) AND user2_id = max(new.user1_id, new.user2_id);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couple_milestones_stats_delete AFTER DELETE ON couple_milestones BEGIN
+                UPDATE couple_stats SET
+                    milestone_count = milestone_count - 1,
+                    anniversary_date = CASE WHEN old.milestone_type = 'anniversary' THEN (
+                        SELECT MIN(milestone_date) FROM couple_milestones
+                        WHERE couple_id = old.couple_id AND milestone_type = 'anniversary'
+                    ) ELSE anniversary_date END
+                WHERE guild_id = old.guild_id
+                  AND user1_id = min(old.user1_id, old.user2_id) AND user2_id = max(old.user1_id, old.user2_id);
+                UPDATE couple_milestone_counts SET count = count - 1
+                WHERE guild_id = old.guild_id AND milestone_type = old.milestone_type
+                  AND user1_id = min(old.user1_id, old.user2_id) AND user2_id = max(old.user1_id, old.user2_id);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_stats_insert AFTER INSERT ON calendar_events BEGIN
+                UPDATE couple_stats SET
+                    events_total = events_total + 1,
+                    events_attended = events_attended + COALESCE(new.event_date <= attended_through, 0)
+                WHERE (guild_id, user1_id, user2_id) = (
+                    SELECT guild_id, user1_id, user2_id FROM couples WHERE id = new.couple_id
+                );
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_stats_delete AFTER DELETE ON calendar_events BEGIN
+                UPDATE couple_stats SET
+                    events_total = events_total - 1,
+                    events_attended = events_attended - COALESCE(old.event_date <= attended_through, 0)
+                WHERE (guild_id, user1_id, user2_id) = (
+                    SELECT guild_id, user1_id, user2_id FROM couples WHERE id = old.couple_id
+                );
+            END
+        ''')
+    
+    async def _add_missing_columns(self, db, table, columns):
+        """Add columns that older databases don't have yet"""
+        cursor = await db.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in await cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                await db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    
+    async def _init_search_tables(self, db):
+        """Create FTS5 indexes mirroring events and milestones"""
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('calendar_events_fts', 'couple_milestones_fts')"
+        )
+        existing = {row[0] for row in await cursor.fetchall()}
+        
+        await db.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS calendar_events_fts USING fts5(
+                title, description,
+                content='calendar_events', content_rowid='id'
+            )
+        ''')
+        await db.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS couple_milestones_fts USING fts5(
+                description,
+                content='couple_milestones', content_rowid='id'
+            )
+        ''')
+        
+        # Triggers keep the indexes in sync with every write path
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_fts_insert AFTER INSERT ON calendar_events BEGIN
+                INSERT INTO calendar_events_fts(rowid, title, description)
+                VALUES (new.id, new.title, new.description);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_fts_delete AFTER DELETE ON calendar_events BEGIN
+                INSERT INTO calendar_events_fts(calendar_events_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS calendar_events_fts_update AFTER UPDATE OF title, description ON calendar_events BEGIN
+                INSERT INTO calendar_events_fts(calendar_events_fts, rowid, title, description)
+                VALUES ('delete', old.id, old.title, old.description);
+                INSERT INTO calendar_events_fts(rowid, title, description)
+                VALUES (new.id, new.title, new.description);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couple_milestones_fts_insert AFTER INSERT ON couple_milestones BEGIN
+                INSERT INTO couple_milestones_fts(rowid, description)
+                VALUES (new.id, new.description);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couple_milestones_fts_delete AFTER DELETE ON couple_milestones BEGIN
+                INSERT INTO couple_milestones_fts(couple_milestones_fts, rowid, description)
+                VALUES ('delete', old.id, old.description);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS couple_milestones_fts_update AFTER UPDATE OF description ON couple_milestones BEGIN
+                INSERT INTO couple_milestones_fts(couple_milestones_fts, rowid, description)
+                VALUES ('delete', old.id, old.description);
+                INSERT INTO couple_milestones_fts(rowid, description)
+                VALUES (new.id, new.description);
+            END
+        ''')
+        
+        # Index rows that were written before the search tables existed
+        if 'calendar_events_fts' not in existing:
+            await db.execute("INSERT INTO calendar_events_fts(calendar_events_fts) VALUES ('rebuild')")
+        if 'couple_milestones_fts' not in existing:
+            await db.execute("INSERT INTO couple_milestones_fts(couple_milestones_fts) VALUES ('rebuild')")
+    
+    async def add_calendar_event(self, guild_id, user_id, channel_id, title, description, event_date, recurrence=None, reminder_offsets=None):
+        """Add a new calendar event, optionally repeating daily/weekly/monthly/yearly"""
+        async def write(db):
+            cursor = await db.execute(
+                # New events belong to their creator's newest couple
+                f'''INSERT INTO calendar_events 
+                   (guild_id, user_id, channel_id, title, description, event_date, recurrence, couple_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT MAX(id) FROM ({USER_COUPLES_SQL})))''',
+                (guild_id, user_id, channel_id, title, description, event_date, recurrence, guild_id, user_id, guild_id, user_id)
+            )
+            event_id = cursor.lastrowid
+            
+            await db.executemany(
+                '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+                   VALUES (?, ?, ?, ?)''',
+                build_reminder_rows(event_id, event_date, recurrence, reminder_offsets or DEFAULT_REMINDER_OFFSETS, datetime.now())
+            )
+            return event_id
+        
+        return await self.writer.submit(write)
+    
+    async def import_calendar(self, guild_id, user_id, channel_id, records, reminder_offsets=None, chunk_size=500):
+        """Bulk import event and milestone records in a single transaction"""
+        offsets = reminder_offsets or DEFAULT_REMINDER_OFFSETS
+        event_count = 0
+        milestone_count = 0
+        now = datetime.now()
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            # Take the write lock up front so new event IDs can't interleave with other writers
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = await db.execute(f'SELECT MAX(id) FROM ({USER_COUPLES_SQL})', (guild_id, user_id, guild_id, user_id))
+                couple_id = (await cursor.fetchone())[0]
+                
+                for chunk in iter_chunks(records, chunk_size):
+                    events = [record for record in chunk if record['type'] == 'event']
+                    milestones = [record for record in chunk if record['type'] == 'milestone']
+                    
+                    if events:
+                        cursor = await db.execute('SELECT COALESCE(MAX(id), 0) FROM calendar_events')
+                        last_id = (await cursor.fetchone())[0]
+                        await db.executemany(
+                            '''INSERT INTO calendar_events 
+                               (guild_id, user_id, channel_id, title, description, event_date, recurrence, couple_id)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                            [
+                                (guild_id, user_id, channel_id, event['title'], event['description'], event['event_date'], event['recurrence'], couple_id)
+                                for event in events
+                            ]
+                        )
+                        cursor = await db.execute(
+                            'SELECT id, event_date, recurrence FROM calendar_events WHERE id > ?',
+                            (last_id,)
+                        )
+                        reminder_rows = []
+                        for event_id, event_date, recurrence in await cursor.fetchall():
+                            reminder_rows.extend(build_reminder_rows(event_id, parse_datetime(event_date), recurrence, offsets, now))
+                        await db.executemany(
+                            '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+                               VALUES (?, ?, ?, ?)''',
+                            reminder_rows
+                        )
+                        event_count += len(events)
+                    
+                    if milestones:
+                        couple_ids = {}
+                        for milestone in milestones:
+                            pair = (milestone['user1_id'], milestone['user2_id'])
+                            if pair not in couple_ids:
+                                couple_ids[pair] = await self._ensure_couple(db, guild_id, *pair)
+                        await db.executemany(
+                            '''INSERT INTO couple_milestones 
+                               (guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                            [
+                                (guild_id, milestone['user1_id'], milestone['user2_id'], milestone['milestone_type'],
+                                 milestone['milestone_date'], milestone['description'],
+                                 couple_ids[(milestone['user1_id'], milestone['user2_id'])])
+                                for milestone in milestones
+                            ]
+                        )
+                        milestone_count += len(milestones)
+                
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        
+        return event_count, milestone_count
+    
+    async def iter_calendar_export(self, guild_id):
+        """Yield a guild's events and milestones one row at a time"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            async with db.execute(
+                'SELECT payload FROM calendar_events_archive WHERE guild_id = ? ORDER BY first_event_date ASC',
+                (guild_id,)
+            ) as cursor:
+                async for row in cursor:
+                    for record in unpack_archive(row['payload']):
+                        yield {
+                            'type': 'event',
+                            'id': record['id'],
+                            'title': record['title'],
+                            'description': record['description'],
+                            'event_date': record['event_date'],
+                            'recurrence': None
+                        }
+            
+            async with db.execute(
+                '''SELECT id, title, description, event_date, recurrence FROM calendar_events
+                   WHERE guild_id = ? ORDER BY event_date ASC''',
+                (guild_id,)
+            ) as cursor:
+                cursor.arraysize = 500
+                async for row in cursor:
+                    yield {'type': 'event', **dict(row)}
+            
+            async with db.execute(
+                '''SELECT id, user1_id, user2_id, milestone_type, milestone_date, description FROM couple_milestones
+                   WHERE guild_id = ? ORDER BY milestone_date ASC''',
+                (guild_id,)
+            ) as cursor:
+                cursor.arraysize = 500
+                async for row in cursor:
+                    yield {'type': 'milestone', **dict(row)}
     
     async def get_upcoming_events(self, guild_id, days_ahead=30):
-        """Get upcoming events for a guild"""
+        """Get upcoming events for a guild, with repeating events expanded in the window"""
+        now = datetime.now()
+        window_end = now + timedelta(days=days_ahead)
+        
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = sqlite3.Row
             cursor = await db.execute(
                 '''SELECT * FROM calendar_events 
-                   WHERE guild_id = ? AND event_date > datetime('now') 
+                   WHERE guild_id = ? AND recurrence IS NULL
+                   AND event_date > datetime('now') 
                    AND event_date <= datetime('now', '+{} days')
                    ORDER BY event_date ASC'''.format(days_ahead),
                 (guild_id,)
             )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            one_off = [dict(row) for row in await cursor.fetchall()]
+            
+            cursor = await db.execute(
+                '''SELECT * FROM calendar_events
+                   WHERE guild_id = ? AND recurrence IS NOT NULL AND event_date <= ?''',
+                (guild_id, window_end)
+            )
+            recurring = [dict(row) for row in await cursor.fetchall()]
+        
+        return merge_upcoming_events(one_off, recurring, now, window_end)
     
-    async def get_upcoming_reminders(self):
-        """Get events that need reminders (24 hours before)"""
+    async def get_upcoming_reminders(self, limit=500):
+        """Get reminders that are due, oldest first"""
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = sqlite3.Row
+            # Range seek on idx_reminders_fire_at, no matter how many events exist
             cursor = await db.execute(
-                '''SELECT *, event_date as reminder_date FROM calendar_events 
-                   WHERE reminder_sent = FALSE 
-                   AND datetime(event_date, '-1 day') <= datetime('now')
-                   AND event_date > datetime('now')''',
+                '''SELECT e.*, r.id AS reminder_id, r.offset_minutes,
+                          r.occurrence_at, r.fire_at AS reminder_date
+                   FROM reminders r
+                   JOIN calendar_events e ON e.id = r.event_id
+                   WHERE r.fire_at <= ?
+                   ORDER BY r.fire_at ASC
+                   LIMIT ?''',
+                (datetime.now(), limit)
             )
             rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        
+        reminders = []
+        for row in rows:
+            reminder = dict(row)
+            reminder['event_date'] = parse_datetime(reminder.pop('occurrence_at'))
+            reminder['reminder_date'] = parse_datetime(reminder['reminder_date'])
+            reminders.append(reminder)
+        return reminders
+    
+    async def mark_reminder_sent(self, reminder_id):
+        """Mark reminder as sent, moving repeating events on to their next occurrence"""
+        async def write(db):
+            cursor = await db.execute(
+                '''SELECT e.event_date, e.recurrence, r.offset_minutes, r.occurrence_at
+                   FROM reminders r JOIN calendar_events e ON e.id = r.event_id
+                   WHERE r.id = ?''',
+                (reminder_id,)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return
+            
+            event_date, recurrence, offset_minutes, occurrence_at = row
+            upcoming = next_reminder_occurrence(event_date, recurrence, offset_minutes, occurrence_at, datetime.now())
+            
+            if upcoming:
+                await db.execute(
+                    'UPDATE reminders SET occurrence_at = ?, fire_at = ? WHERE id = ?',
+                    (upcoming, upcoming - timedelta(minutes=offset_minutes), reminder_id)
+                )
+            else:
+                await db.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
+        
+        await self.writer.submit(write)
+    
+    async def enqueue_due_reminders(self, limit=500, lookahead=0):
+        """Move due reminders (and those due within lookahead seconds) into the outbox in one transaction"""
+        now = datetime.now()
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = await db.execute(
+                    '''SELECT r.id AS reminder_id, r.offset_minutes, r.occurrence_at,
+                              e.id AS event_id, e.guild_id, e.channel_id, e.user_id,
+                              e.title, e.description, e.event_date, e.recurrence
+                       FROM reminders r
+                       JOIN calendar_events e ON e.id = r.event_id
+                       WHERE r.fire_at <= ?
+                       ORDER BY r.fire_at ASC
+                       LIMIT ?''',
+                    (now + timedelta(seconds=lookahead), limit)
+                )
+                outbox_rows, updates, deletes = plan_due_reminders(await cursor.fetchall(), now)
+                
+                # The unique key makes a repeated enqueue of the same occurrence a no-op
+                await db.executemany(
+                    '''INSERT OR IGNORE INTO reminder_outbox
+                       (reminder_id, event_id, guild_id, channel_id, user_id, title, description,
+                        event_date, offset_minutes, next_attempt_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    outbox_rows
+                )
+                await db.executemany(
+                    'UPDATE reminders SET occurrence_at = ?, fire_at = ? WHERE id = ?',
+                    updates
+                )
+                await db.executemany('DELETE FROM reminders WHERE id = ?', deletes)
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        return len(outbox_rows)
+    
+    async def claim_outbox(self, limit=100, fence=None):
+        """Claim pending outbox entries that are ready to send"""
+        now = datetime.now()
+        fence_sql, fence_params = '', ()
+        if fence is not None:
+            fence_sql = 'AND EXISTS (SELECT 1 FROM leases WHERE name = ? AND token = ?)'
+            fence_params = fence
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            cursor = await db.execute(
+                f'''UPDATE reminder_outbox
+                   SET state = 'claimed', claimed_at = ?, attempts = attempts + 1
+                   WHERE id IN (
+                       SELECT id FROM reminder_outbox
+                       WHERE state = 'pending' AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at ASC
+                       LIMIT ?
+                   ) {fence_sql}
+                   RETURNING *''',
+                (now, now, limit, *fence_params)
+            )
+            rows = [dict(row) for row in await cursor.fetchall()]
+            await db.commit()
+        
+        for row in rows:
+            row['event_date'] = parse_datetime(row['event_date'])
+        return rows
+    
+    async def acquire_lease(self, name, holder, ttl):
+        """Take or renew a lease for ttl seconds, returning its fencing token or None if someone else holds it"""
+        # Not through the writer, a renewal must not wait behind a batch of other writes
+        now = time.time()
+        async with aiosqlite.connect(self.db_path) as db:
+            # One statement, so two processes racing for an expired lease can't both win
+            cursor = await db.execute(
+                '''INSERT INTO leases (name, holder, token, expires_at) VALUES (?, ?, 1, ?)
+                   ON CONFLICT(name) DO UPDATE SET
+                       token = CASE WHEN leases.holder = excluded.holder THEN leases.token ELSE leases.token + 1 END,
+                       holder = excluded.holder,
+                       expires_at = excluded.expires_at
+                   WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                   RETURNING token''',
+                (name, holder, now + ttl, now)
+            )
+            row = await cursor.fetchone()
+            await db.commit()
+        return row[0] if row else None
+    
+    async def release_lease(self, name, holder):
+        """Let a lease expire now if holder still has it"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                'UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?',
+                (name, holder)
+            )
+            await db.commit()
+    
+    async def complete_outbox(self, outbox_ids):
+        """Mark claimed outbox entries as sent"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(
+                '''UPDATE reminder_outbox SET state = 'sent', sent_at = ?, last_error = NULL
+                   WHERE state = 'claimed' AND id = ?''',
+                [(datetime.now(), outbox_id) for outbox_id in outbox_ids]
+            )
+            await db.commit()
+    
+    async def retry_outbox(self, outbox_id, error, next_attempt_at):
+        """Put a claimed outbox entry back to pending for a later attempt"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                '''UPDATE reminder_outbox
+                   SET state = 'pending', next_attempt_at = ?, claimed_at = NULL, last_error = ?
+                   WHERE state = 'claimed' AND id = ?''',
+                (next_attempt_at, error, outbox_id)
+            )
+            await db.commit()
     
-    async def mark_reminder_sent(self, event_id):
-        """Mark reminder as sent"""
+    async def fail_outbox(self, outbox_id, error):
+        """Give up on a claimed outbox entry"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
-                'UPDATE calendar_events SET reminder_sent = TRUE WHERE id = ?',
-                (event_id,)
+                '''UPDATE reminder_outbox SET state = 'failed', last_error = ?
+                   WHERE state = 'claimed' AND id = ?''',
+                (error, outbox_id)
             )
             await db.commit()
     
+    async def recover_outbox(self, stale_before, prune_before):
+        """Release claims left by a crashed dispatcher and prune old finished entries"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                '''UPDATE reminder_outbox SET state = 'pending', claimed_at = NULL
+                   WHERE state = 'claimed' AND claimed_at < ?''',
+                (stale_before,)
+            )
+            released = cursor.rowcount
+            await db.execute(
+                '''DELETE FROM reminder_outbox
+                   WHERE state IN ('sent', 'failed') AND COALESCE(sent_at, next_attempt_at) < ?''',
+                (prune_before,)
+            )
+            await db.commit()
+            return released
+    
+    async def archive_past_events(self, before, limit=500):
+        """Move up to limit one-off events dated before a moment into the compressed archive"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = await db.execute(
+                    f'''SELECT {', '.join(ARCHIVE_EVENT_FIELDS)} FROM calendar_events
+                        WHERE recurrence IS NULL AND event_date < ?
+                        ORDER BY event_date LIMIT ?''',
+                    (before, limit)
+                )
+                events = [dict(row) for row in await cursor.fetchall()]
+                if not events:
+                    await db.rollback()
+                    return 0
+                
+                await db.executemany(
+                    '''INSERT INTO calendar_events_archive
+                       (guild_id, event_count, first_event_date, last_event_date, payload)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    pack_archive(events)
+                )
+                # Archived dates stay planned and count as attended, undoing the delete trigger
+                await db.executemany(
+                    '''UPDATE couple_stats SET events_total = events_total + ?1, events_attended = events_attended + ?1
+                       WHERE (guild_id, user1_id, user2_id) = (SELECT guild_id, user1_id, user2_id FROM couples WHERE id = ?2)''',
+                    count_archived_by_couple(events)
+                )
+                event_ids = [event['id'] for event in events]
+                await db.execute(
+                    f'DELETE FROM calendar_events WHERE id IN ({", ".join("?" * len(event_ids))})',
+                    event_ids
+                )
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        
+        return len(events)
+    
+    async def reclaim_space(self, max_pages=1000):
+        """Return up to max_pages of free pages to the OS with an incremental vacuum"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute('PRAGMA freelist_count')
+            free_before = (await cursor.fetchone())[0]
+            if not free_before:
+                return 0
+            # execute() only steps the pragma once (one page), executescript runs it to the end
+            await db.executescript(f'PRAGMA incremental_vacuum({int(max_pages)});')
+            cursor = await db.execute('PRAGMA freelist_count')
+            return free_before - (await cursor.fetchone())[0]
+    
+    async def purge_guild(self, guild_id):
+        """Delete everything stored for a guild"""
+        # Events and milestones go first so their triggers clean up reminders and search rows
+        tables = (
+            'calendar_events', 'couple_milestones', 'reminder_outbox', 'calendar_events_archive',
+            'couple_stats', 'couple_milestone_counts', 'couples', 'user_preferences', 'music_queue'
+        )
+        deleted = 0
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                for table in tables:
+                    cursor = await db.execute(f'DELETE FROM {table} WHERE guild_id = ?', (guild_id,))
+                    deleted += cursor.rowcount
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        return deleted
+    
     async def delete_event(self, event_id, user_id):
         """Delete an event (only by the creator)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             cursor = await db.execute(
                 'DELETE FROM calendar_events WHERE id = ? AND user_id = ?',
                 (event_id, user_id)
             )
-            await db.commit()
-            return cursor.rowcount > 0
+            return cursor.rowcount
+        
+        return await self.writer.submit(write) > 0
     
     async def set_user_preference(self, guild_id, user_id, key, value):
         """Set a user preference"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+        async def write(db):
+            cursor = await db.execute(
                 '''INSERT OR REPLACE INTO user_preferences 
                    (guild_id, user_id, preference_key, preference_value)
                    VALUES (?, ?, ?, ?)''',
                 (guild_id, user_id, key, value)
             )
-            await db.commit()
+            return cursor.lastrowid
+        
+        return await self.writer.submit(write)
     
     async def get_user_preference(self, guild_id, user_id, key, default=None):
         """Get a user preference"""
@@ -151,26 +961,199 @@ class Database:
             row = await cursor.fetchone()
             return row[0] if row else default
     
+    async def _ensure_couple(self, db, guild_id, user_a, user_b):
+        """Get the ID of a pair's couple row, creating it the first time"""
+        key = (guild_id, min(user_a, user_b), max(user_a, user_b))
+        await db.execute('INSERT OR IGNORE INTO couples (guild_id, user1_id, user2_id) VALUES (?, ?, ?)', key)
+        cursor = await db.execute('SELECT id FROM couples WHERE guild_id = ? AND user1_id = ? AND user2_id = ?', key)
+        return (await cursor.fetchone())[0]
+    
     async def add_milestone(self, guild_id, user1_id, user2_id, milestone_type, milestone_date, description):
         """Add a couple milestone"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
+            couple_id = await self._ensure_couple(db, guild_id, user1_id, user2_id)
             cursor = await db.execute(
                 '''INSERT INTO couple_milestones 
-                   (guild_id, user1_id, user2_id, milestone_type, milestone_date, description)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (guild_id, user1_id, user2_id, milestone_type, milestone_date, description)
+                   (guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id)
             )
-            await db.commit()
             return cursor.lastrowid
+        
+        return await self.writer.submit(write)
     
-    async def get_milestones(self, guild_id):
-        """Get all milestones for a guild"""
+    async def get_milestones(self, guild_id, user_id):
+        """Get the milestones of every couple a user is in, newest first"""
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = sqlite3.Row
             cursor = await db.execute(
-                '''SELECT * FROM couple_milestones 
-                   WHERE guild_id = ? ORDER BY milestone_date DESC''',
-                (guild_id,)
+                f'''SELECT * FROM couple_milestones
+                    WHERE couple_id IN ({USER_COUPLES_SQL})
+                    ORDER BY milestone_date DESC''',
+                (guild_id, user_id, guild_id, user_id)
+            )
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    async def get_couple_stats(self, guild_id, user_id, partner_id=None):
+        """Get a couple's summary row, counting dates that happened since the last roll-up"""
+        now = datetime.now()
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            if partner_id is not None:
+                cursor = await db.execute(
+                    'SELECT * FROM couple_stats WHERE guild_id = ? AND user1_id = ? AND user2_id = ?',
+                    (guild_id, min(user_id, partner_id), max(user_id, partner_id))
+                )
+            else:
+                cursor = await db.execute(
+                    '''SELECT * FROM couple_stats
+                       WHERE guild_id = ? AND (user1_id = ? OR user2_id = ?)
+                       ORDER BY milestone_count DESC LIMIT 1''',
+                    (guild_id, user_id, user_id)
+                )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            stats = dict(row)
+            key = (row['guild_id'], row['user1_id'], row['user2_id'])
+            
+            # Read-only: dates that passed since attended_through are added here,
+            # roll_up_attended_dates moves the watermark in the retention job
+            cursor = await db.execute(
+                '''SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                   WHERE c.guild_id = ? AND c.user1_id = ? AND c.user2_id = ?
+                     AND e.event_date > COALESCE(?, '') AND e.event_date <= ?''',
+                (*key, row['attended_through'], now)
+            )
+            stats['events_attended'] += (await cursor.fetchone())[0]
+            
+            cursor = await db.execute(
+                '''SELECT milestone_type, count FROM couple_milestone_counts
+                   WHERE guild_id = ? AND user1_id = ? AND user2_id = ? AND count > 0
+                   ORDER BY count DESC''',
+                key
+            )
+            stats['milestone_counts'] = {milestone_type: count for milestone_type, count in await cursor.fetchall()}
+        
+        if stats['anniversary_date']:
+            stats['anniversary_date'] = parse_datetime(stats['anniversary_date'])
+        return stats
+    
+    async def roll_up_attended_dates(self, now=None):
+        """Add dates that passed since each couple's attended_through to events_attended"""
+        now = now or datetime.now()
+        async def write(db):
+            cursor = await db.execute(
+                '''UPDATE couple_stats SET
+                       events_attended = events_attended + (
+                           SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                           WHERE c.guild_id = couple_stats.guild_id
+                             AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+                             AND e.event_date > COALESCE(couple_stats.attended_through, '')
+                             AND e.event_date <= ?
+                       ),
+                       attended_through = ?''',
+                (now, now)
+            )
+            return cursor.rowcount
+        
+        return await self.writer.submit(write)
+    
+    async def record_track_play(self, track_key, title, url, duration):
+        """Record that a track was played"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                '''INSERT INTO track_metadata (track_key, title, url, duration, play_count)
+                   VALUES (?, ?, ?, ?, 1)
+                   ON CONFLICT(track_key) DO UPDATE SET
+                       title = excluded.title,
+                       url = excluded.url,
+                       duration = excluded.duration,
+                       play_count = play_count + 1,
+                       last_played_at = CURRENT_TIMESTAMP''',
+                (track_key, title, url, duration)
+            )
+            await db.commit()
+    
+    async def get_played_tracks(self, limit=5000):
+        """Get the most played tracks, with their measured loudness if known"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            cursor = await db.execute(
+                '''SELECT track_key, title, url, duration, play_count, loudness_i, loudness_tp, loudness_lra
+                   FROM track_metadata WHERE play_count > 0
+                   ORDER BY play_count DESC, last_played_at DESC LIMIT ?''',
+                (limit,)
             )
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
+    
+    async def get_track_loudness(self, track_key):
+        """Get a track's stored EBU R128 measurement, or None"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            cursor = await db.execute(
+                '''SELECT loudness_i, loudness_tp, loudness_lra FROM track_metadata
+                   WHERE track_key = ? AND loudness_i IS NOT NULL''',
+                (track_key,)
+            )
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+    
+    async def save_track_loudness(self, track_key, title, url, duration, loudness):
+        """Store a track's EBU R128 measurement, adding an unplayed row if needed"""
+        async def write(db):
+            await db.execute(
+                '''INSERT INTO track_metadata (track_key, title, url, duration, loudness_i, loudness_tp, loudness_lra)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(track_key) DO UPDATE SET
+                       loudness_i = excluded.loudness_i,
+                       loudness_tp = excluded.loudness_tp,
+                       loudness_lra = excluded.loudness_lra''',
+                (track_key, title, url, duration,
+                 loudness['loudness_i'], loudness['loudness_tp'], loudness['loudness_lra'])
+            )
+        
+        await self.writer.submit(write)
+    
+    async def search_dates(self, guild_id, text, limit=10, offset=0):
+        """Full-text search over a guild's events and milestones, best matches first"""
+        match = build_fts_query(text)
+        if not match:
+            return 0, []
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = sqlite3.Row
+            cursor = await db.execute(
+                '''SELECT
+                       (SELECT COUNT(*) FROM calendar_events_fts
+                        JOIN calendar_events e ON e.id = calendar_events_fts.rowid
+                        WHERE calendar_events_fts MATCH ? AND e.guild_id = ?) +
+                       (SELECT COUNT(*) FROM couple_milestones_fts
+                        JOIN couple_milestones m ON m.id = couple_milestones_fts.rowid
+                        WHERE couple_milestones_fts MATCH ? AND m.guild_id = ?)''',
+                (match, guild_id, match, guild_id)
+            )
+            total = (await cursor.fetchone())[0]
+            
+            # Titles weigh more than descriptions
+            cursor = await db.execute(
+                '''SELECT 'event' AS kind, e.id, e.title,
+                          snippet(calendar_events_fts, -1, '**', '**', '…', 16) AS snippet,
+                          e.event_date AS date, bm25(calendar_events_fts, 10.0, 1.0) AS rank
+                   FROM calendar_events_fts
+                   JOIN calendar_events e ON e.id = calendar_events_fts.rowid
+                   WHERE calendar_events_fts MATCH ? AND e.guild_id = ?
+                   UNION ALL
+                   SELECT 'milestone' AS kind, m.id, m.milestone_type AS title,
+                          snippet(couple_milestones_fts, 0, '**', '**', '…', 16) AS snippet,
+                          m.milestone_date AS date, bm25(couple_milestones_fts) AS rank
+                   FROM couple_milestones_fts
+                   JOIN couple_milestones m ON m.id = couple_milestones_fts.rowid
+                   WHERE couple_milestones_fts MATCH ? AND m.guild_id = ?
+                   ORDER BY rank LIMIT ? OFFSET ?''',
+                (match, guild_id, match, guild_id, limit, offset)
+            )
+            rows = await cursor.fetchall()
+            return total, [dict(row) for row in rows]
@@ -0,0 +1,230 @@
+import asyncio
+import collections
+import collections.abc
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStats:
+    __slots__ = ('count', 'running', 'wall', 'busy', 'cpu', 'max_step')
+
+    def __init__(self):
+        self.count = 0
+        self.running = 0
+        self.wall = 0.0
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.max_step = 0.0
+
+
+class _TimedCoroutine(collections.abc.Coroutine):
+    """Wrap a task's coroutine to time every step it runs on the loop"""
+
+    __slots__ = ('_coro', '_stats', '_started')
+
+    def __init__(self, coro, stats):
+        self._coro = coro
+        self._stats = stats
+        self._started = time.perf_counter()
+        stats.count += 1
+        stats.running += 1
+
+    def _step(self, method, *args):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return method(*args)
+        except BaseException:
+            self._stats.running -= 1
+            self._stats.wall += time.perf_counter() - self._started
+            raise
+        finally:
+            step = time.perf_counter() - wall
+            self._stats.busy += step
+            self._stats.cpu += time.thread_time() - cpu
+            if step > self._stats.max_step:
+                self._stats.max_step = step
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def __getattr__(self, name):
+        # cr_frame, cr_code, __qualname__ etc. for code that inspects task coroutines
+        return getattr(self._coro, name)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.relpath(code.co_filename)}:{frame.f_lineno})"
+
+
+def _fold_stack(frame):
+    """Collapse a stack into one 'outer;...;inner' line, root first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Sample every thread's stack at a fixed interval.
+
+    Output uses the collapsed-stack format py-spy writes with
+    ``--format raw``, so flamegraph.pl or speedscope can render it.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def run(self, duration):
+        """Sample for duration seconds, returning folded stack counts"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            samples = collections.Counter()
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    name = names.get(thread_id) or f"thread-{thread_id}"
+                    samples[f"{name};{_fold_stack(frame)}"] += 1
+                time.sleep(self.interval)
+            return samples
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def write(samples, path):
+        """Write folded stacks to a file, most sampled first"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class LoopDiagnostics:
+    """Opt-in event loop diagnostics.
+
+    Turns on asyncio's slow-callback logging, times every task step by
+    coroutine, and runs a watchdog thread that captures the loop thread's
+    stack while a callback is blocking it.
+    """
+
+    def __init__(self, slow_threshold=0.1, directory=None, max_stalls=50):
+        self.slow_threshold = slow_threshold
+        self.directory = directory or os.getenv("DIAGNOSTICS_DIR", "diagnostics")
+        self.stats = collections.defaultdict(TaskStats)
+        self.stalls = collections.deque(maxlen=max_stalls)
+        self.profiler = SamplingProfiler()
+        self.started_at = None
+        self._loop = None
+        self._loop_thread = None
+        self._last_tick = None
+        self._heartbeat = None
+        self._running = False
+
+    def start(self, loop):
+        """Install the task factory, heartbeat and watchdog on a running loop"""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self.started_at = time.perf_counter()
+
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_threshold
+        loop.set_task_factory(self._task_factory)
+
+        self._running = True
+        self._last_tick = time.monotonic()
+        self._heartbeat = loop.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+        # kill -USR1 <pid> writes a 10 second profile to the diagnostics directory
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(self.dump_profile()))
+        except (AttributeError, NotImplementedError, RuntimeError):
+            logger.info("SIGUSR1 profiling is not available on this platform")
+        logger.info("Loop diagnostics enabled (slow callback threshold %.0fms)", self.slow_threshold * 1000)
+
+    def stop(self):
+        """Remove the task factory and stop the watchdog"""
+        self._running = False
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        if self._loop:
+            self._loop.set_task_factory(None)
+            self._loop.set_debug(False)
+            try:
+                self._loop.remove_signal_handler(signal.SIGUSR1)
+            except (AttributeError, NotImplementedError, RuntimeError):
+                pass
+
+    def _task_factory(self, loop, coro, **kwargs):
+        name = getattr(coro, '__qualname__', type(coro).__name__)
+        return asyncio.Task(_TimedCoroutine(coro, self.stats[name]), loop=loop, **kwargs)
+
+    async def _beat(self):
+        interval = self.slow_threshold / 2
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self):
+        """Capture the loop thread's stack once per stall"""
+        interval = self.slow_threshold / 2
+        stall = None
+        while self._running:
+            time.sleep(interval)
+            lag = time.monotonic() - self._last_tick
+            if lag > self.slow_threshold + interval:
+                if stall is None:
+                    frame = sys._current_frames().get(self._loop_thread)
+                    stack = ''.join(traceback.format_stack(frame)) if frame else ''
+                    stall = {'at': time.time(), 'duration': lag, 'stack': stack}
+                    self.stalls.append(stall)
+                    logger.warning("Event loop blocked for %.0fms so far, in:\n%s", lag * 1000, stack)
+                else:
+                    stall['duration'] = lag
+            elif stall is not None:
+                logger.warning("Event loop was blocked for %.0fms", stall['duration'] * 1000)
+                stall = None
+
+    def top_tasks(self, limit=10, key='cpu'):
+        """(name, TaskStats) pairs for the most expensive coroutines"""
+        return sorted(self.stats.items(), key=lambda item: getattr(item[1], key), reverse=True)[:limit]
+
+    async def dump_profile(self, seconds=10):
+        """Sample all threads without blocking the loop and write a folded-stack file"""
+        loop = asyncio.get_running_loop()
+        samples = await loop.run_in_executor(None, self.profiler.run, seconds)
+        path = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        await loop.run_in_executor(None, SamplingProfiler.write, samples, path)
+        logger.info("Wrote %s stack samples to %s", sum(samples.values()), path)
+        return path
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitWriter:
+    """Run SQLite writes on a single connection, committing them in groups.
+
+    Callers submit a coroutine function that takes the connection. Writes
+    queued while the previous group was committing (plus any that arrive
+    within max_delay, if set) share one transaction and one journal sync.
+    Waiting is off by default, since writes pile up during a commit anyway. Every
+    write runs in its own savepoint, so a failing write is rolled back
+    without taking the rest of its group with it.
+    """
+
+    def __init__(self, db_path, max_batch=100, max_delay=0):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.commits = 0
+        self.writes = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Start the writer task on the running loop (submit does this on first use)"""
+        if self._task is None or self._task.done():
+            # A restarted writer picks up whatever is still queued
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name="group-commit-writer")
+
+    async def submit(self, write):
+        """Queue write(db) and return its result once its group has committed"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((write, future))
+        return await future
+
+    async def close(self):
+        """Commit everything already queued, then close the connection"""
+        if self._task is None:
+            return
+        if not self._task.done():
+            self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        batch = []
+        try:
+            async with aiosqlite.connect(self.db_path, isolation_level=None) as db:
+                closing = False
+                while not closing:
+                    batch = [await self._queue.get()]
+                    if batch[0] is None:
+                        break
+                    if self.max_delay and self._queue.qsize() < self.max_batch:
+                        await asyncio.sleep(self.max_delay)
+                    while len(batch) < self.max_batch and not self._queue.empty():
+                        item = self._queue.get_nowait()
+                        if item is None:
+                            closing = True
+                            break
+                        batch.append(item)
+                    await self._commit(db, batch)
+                    batch = []
+        except asyncio.CancelledError:
+            self._fail_pending(batch, None)
+            raise
+        except Exception as e:
+            # The next submit starts a new task
+            logger.error("Group commit writer stopped: %s", e)
+            self._fail_pending(batch, e)
+
+    def _fail_pending(self, batch, error):
+        """Fail the in-flight and queued writes of a stopped writer, cancelling them if error is None"""
+        pending = list(batch)
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                pending.append(item)
+        for _, future in pending:
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _commit(self, db, batch):
+        outcomes = []
+        try:
+            await db.execute('BEGIN IMMEDIATE')
+            for write, future in batch:
+                if future.cancelled():
+                    continue
+                await db.execute('SAVEPOINT write')
+                try:
+                    result = await write(db)
+                except Exception as e:
+                    await db.execute('ROLLBACK TO write')
+                    outcomes.append((future, e, None))
+                else:
+                    outcomes.append((future, None, result))
+                await db.execute('RELEASE write')
+            await db.execute('COMMIT')
+        except Exception as e:
+            logger.error("Group commit of %s writes failed: %s", len(batch), e)
+            if db.in_transaction:
+                await db.rollback()
+            outcomes = [(future, e, None) for _, future in batch]
+
+        self.commits += 1
+        self.writes += len(outcomes)
+        for future, error, result in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
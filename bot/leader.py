@@ -0,0 +1,76 @@
+import logging
+import os
+import secrets
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+# The lease guarding reminder dispatch and maintenance jobs
+LEADER_LEASE = 'leader'
+
+
+class LeaderElection:
+    """Lease-based leader election between bot processes sharing one database.
+
+    Every process tries to take or renew the same lease every renew_interval
+    seconds. Whoever holds it is the leader until the lease expires ttl
+    seconds after its last renewal, so when the leader dies another process
+    takes over within about ttl + renew_interval seconds. A process stops
+    acting as leader one renew_interval before its lease runs out, so a
+    stalled leader steps down before anyone else can take over. Each change
+    of hands bumps the lease's fencing token, which the database checks
+    before claiming reminders.
+    """
+
+    def __init__(self, db, name=LEADER_LEASE, holder=None, ttl=None, renew_interval=None):
+        self.db = db
+        self.name = name
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(2)}"
+        if ttl is None:
+            ttl = float(os.getenv("LEADER_LEASE_SECONDS", "10"))
+        self.ttl = ttl
+        self.renew_interval = renew_interval or ttl / 3
+        self.token = None
+        self.valid_until = 0.0
+
+    @property
+    def is_leader(self):
+        return self.token is not None and time.monotonic() < self.valid_until
+
+    @property
+    def fence(self):
+        """(lease name, token) for fenced writes, or None when not the leader"""
+        return (self.name, self.token) if self.is_leader else None
+
+    async def run_once(self):
+        """Take or renew the lease, returning whether this process is the leader"""
+        was_leader = self.is_leader
+        started = time.monotonic()
+        try:
+            token = await self.db.acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            # Keep leading on what is left of the last renewal
+            logger.error("Failed to renew leader lease: %s", e)
+            token = self.token if was_leader else None
+        else:
+            if token is not None:
+                self.valid_until = started + self.ttl - self.renew_interval
+        self.token = token
+
+        if self.is_leader and not was_leader:
+            logger.info("Became leader as %s (token %s)", self.holder, self.token)
+        elif was_leader and not self.is_leader:
+            logger.warning("Lost leadership as %s", self.holder)
+        return self.is_leader
+
+    async def release(self):
+        """Hand the lease over right away instead of letting it expire"""
+        if self.token is None:
+            return
+        self.token = None
+        try:
+            await self.db.release_lease(self.name, self.holder)
+            logger.info("Released leader lease")
+        except Exception as e:
+            logger.error("Failed to release leader lease: %s", e)
@@ -0,0 +1,111 @@
+import collections
+import secrets
+import threading
+import discord
+
+# Frames kept for listeners that read late (20ms each, so 5 seconds)
+BACKLOG_FRAMES = 250
+
+
+class SharedOpusStream:
+    """Decode and encode one track once, serving its Opus frames to many listeners.
+
+    Each voice client's player thread pulls frames through its own
+    OpusListener. Whichever listener is furthest ahead reads the next frame
+    from the upstream source; the rest copy it from the backlog, so adding
+    a listener costs a deque lookup instead of another FFmpeg process.
+    """
+
+    def __init__(self, source, data, start=0, backlog=BACKLOG_FRAMES):
+        self.source = source
+        self.data = data
+        self.start_frame = int(start * 50)
+        self.backlog = backlog
+        self.frames = collections.deque()
+        self.base = 0
+        self.ended = False
+        self.listeners = 0
+        self._lock = threading.Lock()
+
+    @property
+    def head(self):
+        """Index of the next frame the upstream source will produce"""
+        return self.base + len(self.frames)
+
+    def frame(self, index):
+        """Get (frame, index) for a cursor, reading upstream if it is ahead of everyone"""
+        with self._lock:
+            while index >= self.head and not self.ended:
+                data = self.source.read()
+                if not data:
+                    self.ended = True
+                    break
+                self.frames.append(data)
+                if len(self.frames) > self.backlog:
+                    self.frames.popleft()
+                    self.base += 1
+            # A listener that fell further behind than the backlog skips ahead
+            index = max(index, self.base)
+            if index >= self.head:
+                return b'', index
+            return self.frames[index - self.base], index
+
+    def listen(self):
+        """Create a listener that joins at the live position"""
+        with self._lock:
+            self.listeners += 1
+            return OpusListener(self, self.head)
+
+    def release(self):
+        """Drop a listener, closing the upstream source after the last one"""
+        with self._lock:
+            self.listeners -= 1
+            if self.listeners > 0:
+                return
+            self.ended = True
+        self.source.cleanup()
+
+
+class OpusListener(discord.AudioSource):
+    """One voice client's read cursor into a SharedOpusStream"""
+
+    def __init__(self, stream, cursor):
+        self.stream = stream
+        self.cursor = cursor
+        self.released = False
+        self.data = stream.data
+        self.title = stream.data.get('title')
+        self.url = stream.data.get('url')
+        self.duration = stream.data.get('duration')
+        self.thumbnail = stream.data.get('thumbnail')
+
+    def is_opus(self):
+        # discord.py sends the frames as they are instead of encoding them per listener
+        return True
+
+    def read(self):
+        data, index = self.stream.frame(self.cursor)
+        self.cursor = index + 1
+        return data
+
+    @property
+    def position(self):
+        """Seconds into the track (each frame is 20ms)"""
+        return (self.stream.start_frame + self.cursor) * 0.02
+
+    def cleanup(self):
+        if not self.released:
+            self.released = True
+            self.stream.release()
+
+
+class ListenSession:
+    """Guilds listening to one host guild's queue in sync"""
+
+    def __init__(self, host_id):
+        self.host_id = host_id
+        self.code = secrets.token_hex(3).upper()
+        self.guild_ids = {host_id}
+        self.stream = None
+        # Guilds still playing the current stream, only touched on the event loop
+        self.listening = set()
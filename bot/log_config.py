@@ -0,0 +1,128 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Correlation fields for whatever the current task is handling
+log_context = contextvars.ContextVar('log_context', default={})
+
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def bind_interaction(interaction):
+    """Tag every log line from the rest of this task with the interaction's details"""
+    command = interaction.command.qualified_name if interaction.command else None
+    log_context.set({
+        'interaction_id': interaction.id,
+        'guild_id': interaction.guild_id,
+        'user_id': interaction.user.id,
+        'command': command
+    })
+
+
+def bind(**fields):
+    """Add correlation fields for the current task (e.g. a background job name)"""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copy the correlation fields onto records before they leave the loop thread"""
+
+    def filter(self, record):
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at or below a level"""
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno > self.level or self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge args now, since they may change by the time the listener runs,
+        # but leave the (slower) JSON formatting to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=None, fmt=None, debug_sample_rate=None):
+    """Route all logging through a queue to a listener thread that writes to stderr.
+
+    Settings default to the LOG_LEVEL, LOG_FORMAT (json or text) and
+    LOG_DEBUG_SAMPLE_RATE env vars. Returns the started QueueListener.
+    """
+    level = level or os.getenv("LOG_LEVEL", "INFO").upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "json").lower()
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+
+    stream = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(debug_sample_rate))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
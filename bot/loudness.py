@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import subprocess
+from collections import OrderedDict
+
+from bot.audio_cache import AudioCache
+
+logger = logging.getLogger(__name__)
+
+# Columns of track_metadata holding a track's measured loudness
+LOUDNESS_FIELDS = ('loudness_i', 'loudness_tp', 'loudness_lra')
+
+
+def measure_loudness(path, timeout=300):
+    """Run FFmpeg's EBU R128 analysis (loudnorm first pass) over a local file"""
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-nostats', '-i', path, '-vn',
+         '-af', 'loudnorm=print_format=json', '-f', 'null', '-'],
+        capture_output=True, text=True, timeout=timeout
+    )
+    output = result.stderr
+    if result.returncode != 0 or '{' not in output:
+        lines = output.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"ffmpeg exited with {result.returncode}")
+    # loudnorm prints its measurement as the last JSON object on stderr
+    info = json.loads(output[output.rindex('{'):output.rindex('}') + 1])
+    return {
+        'loudness_i': float(info['input_i']),
+        'loudness_tp': float(info['input_tp']),
+        'loudness_lra': float(info['input_lra'])
+    }
+
+
+def playback_gain(measured, target, true_peak, max_gain):
+    """dB that brings a track to target LUFS without pushing its peaks past true_peak"""
+    loudness = measured.get('loudness_i')
+    if loudness is None or not math.isfinite(loudness):
+        # Silence measures as -inf, there is nothing sensible to boost
+        return None
+    gain = min(target - loudness, max_gain)
+    peak = measured.get('loudness_tp')
+    if peak is not None and math.isfinite(peak):
+        gain = min(gain, true_peak - peak)
+    return gain
+
+
+class LoudnessAnalyzer:
+    """Measure each cached track's loudness once and turn it into a playback gain.
+
+    Analysis only runs on files already in the audio cache, in the default
+    executor, one track at a time. Results are kept in track_metadata, so
+    repeat plays and restarts never analyze again, and the max_entries
+    most recently used are also kept in memory.
+    """
+
+    def __init__(self, db, cache, target=None, true_peak=-1.0, max_gain=12.0, concurrency=1, max_entries=5000):
+        self.db = db
+        self.cache = cache
+        if target is None:
+            target = float(os.getenv("LOUDNESS_TARGET_LUFS", "-14"))
+        self.target = target
+        self.true_peak = true_peak
+        self.max_gain = max_gain
+        self.max_entries = max_entries
+        self.measured = OrderedDict()  # track key -> loudness fields, least recently used first
+        self.available = True
+        self._pending = {}
+        self._semaphore = None
+        self._concurrency = concurrency
+
+    def load(self, tracks):
+        """Remember loudness already stored with track metadata, for tracks listed most played first"""
+        # Least played go in first, so they are the first to be evicted
+        for track in reversed(tracks):
+            if track.get('loudness_i') is not None:
+                self._remember(track['track_key'], {field: track.get(field) for field in LOUDNESS_FIELDS})
+
+    def _remember(self, key, measured):
+        self.measured[key] = measured
+        self.measured.move_to_end(key)
+        while len(self.measured) > self.max_entries:
+            self.measured.popitem(last=False)
+
+    def gain(self, data):
+        """Gain in dB for a track, or None until it has been analyzed"""
+        key = AudioCache.cache_key(data)
+        measured = self.measured.get(key)
+        if measured is None:
+            return None
+        self.measured.move_to_end(key)
+        return playback_gain(measured, self.target, self.true_peak, self.max_gain)
+
+    def schedule(self, data, download=None, *, loop=None):
+        """Analyze a track in the background once download (its prefetch task) is done"""
+        key = AudioCache.cache_key(data)
+        if not self.available or key in self.measured or key in self._pending:
+            return None
+        if not self.cache.is_cacheable(data) and not self.cache.get(data):
+            # Only local files are analyzed, streaming a track twice costs more than it saves
+            return None
+        loop = loop or asyncio.get_event_loop()
+        task = loop.create_task(self._analyze(key, data, download))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    async def _analyze(self, key, data, download):
+        try:
+            stored = await self.db.get_track_loudness(key)
+        except Exception as e:
+            logger.error("Failed to load track loudness: %s", e)
+            return
+        if stored:
+            # Evicted from memory, or analyzed by an earlier run
+            self._remember(key, stored)
+            return
+
+        if download is not None:
+            await download
+        path = self.cache.get(data)
+        if path is None:
+            return
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            try:
+                measured = await asyncio.get_running_loop().run_in_executor(None, measure_loudness, path)
+            except FileNotFoundError:
+                self.available = False
+                logger.warning("ffmpeg not found, loudness normalization is off")
+                return
+            except Exception as e:
+                logger.warning("Loudness analysis failed for %s: %s", data.get('title'), e)
+                return
+
+        self._remember(key, measured)
+        title = data.get('title')
+        url = data.get('webpage_url') or data.get('original_url')
+        if not title or not url:
+            return
+        try:
+            await self.db.save_track_loudness(key, title, url, data.get('duration'), measured)
+        except Exception as e:
+            logger.error("Failed to save track loudness: %s", e)
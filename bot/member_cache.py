@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+class MemberCache:
+    """Bounded TTL cache of guild members for a bot without the members intent.
+
+    Entries come from interaction payloads (the user and any members passed
+    as options) and from fetch_member results, including "not a member"
+    answers for a shorter time. Concurrent lookups of the same member share
+    one fetch_member call.
+    """
+
+    def __init__(self, max_entries=10000, ttl=900, negative_ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # (guild_id, user_id) -> (expires_at, member or None), least recently used first
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, guild_id, user_id, member):
+        """Remember a member, or None for a user who isn't in the guild"""
+        ttl = self.ttl if member is not None else self.negative_ttl
+        key = (guild_id, user_id)
+        self._entries[key] = (time.monotonic() + ttl, member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def remember(self, interaction):
+        """Cache the members an interaction payload already carries"""
+        if interaction.guild is None:
+            return
+        members = [interaction.user, *(value for _, value in interaction.namespace)]
+        for member in members:
+            if isinstance(member, discord.Member):
+                self.put(interaction.guild.id, member.id, member)
+
+    async def get_member(self, guild, user_id):
+        """Get a guild member, or None if the user isn't in the guild"""
+        key = (guild.id, user_id)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            # Least recently used goes first when the cache is full
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        # The gateway cache still has whoever the bot saw in voice or in events
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.hits += 1
+            self.put(guild.id, user_id, member)
+            return member
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(guild, user_id))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, guild, user_id):
+        key = (guild.id, user_id)
+        try:
+            self.fetches += 1
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                member = None
+            except discord.HTTPException as e:
+                # Not cached, the next lookup tries again
+                logger.warning("Could not fetch member %s of guild %s: %s", user_id, guild.id, e)
+                return None
+            self.put(guild.id, user_id, member)
+            return member
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        """Lookup counts and hit ratio since start"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import collections
+import collections.abc
+import linecache
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+import types
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# LOW_MEMORY=1 trims discord.py's caches and keeps extracted tracks as Track records
+LOW_MEMORY = os.getenv("LOW_MEMORY", "0") == "1"
+
+# Never walked into when sizing a subsystem: code, the event loop, tasks and the client itself
+_OPAQUE_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+    types.CodeType, types.FrameType, asyncio.AbstractEventLoop, asyncio.Future,
+    type(threading.Lock()), threading.Thread, discord.Client, discord.VoiceProtocol,
+    discord.state.ConnectionState, discord.http.HTTPClient
+)
+
+
+def client_options(intents):
+    """Keyword arguments for the bot's constructor, smaller caches in low-memory mode"""
+    if not LOW_MEMORY:
+        return {'intents': intents}
+    # Everything runs on slash commands and voice, so no message, emoji or sticker events
+    lean = discord.Intents.none()
+    lean.guilds = True
+    lean.voice_states = intents.voice_states
+    return {
+        'intents': lean,
+        'max_messages': None,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False
+    }
+
+
+def format_bytes(size):
+    """Human readable byte count like 12.3 MB"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def start_tracing(frames=1):
+    """Start tracemalloc if it isn't running, returning whether it was started now"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    logger.info("tracemalloc started with %s frame(s)", frames)
+    return True
+
+
+def top_allocators(limit=10):
+    """Source lines holding the most traced memory, as (location, bytes, blocks)"""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+    ))
+    results = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        results.append((f"{frame.filename}:{frame.lineno}", stat.size, stat.count))
+    return results
+
+
+def deep_size(obj, seen):
+    """Bytes reachable from obj through containers and object attributes, skipping ids in seen"""
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _OPAQUE_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, collections.abc.Mapping):
+            # Copied first, the loop may still change these while a report runs
+            stack.extend(list(current.keys()))
+            stack.extend(list(current.values()))
+        elif isinstance(current, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(list(current))
+        elif not isinstance(current, (str, bytes, bytearray, int, float)):
+            attributes = getattr(current, '__dict__', None)
+            if attributes is not None:
+                stack.append(attributes)
+            for klass in type(current).__mro__:
+                for name in getattr(klass, '__slots__', ()):
+                    value = getattr(current, name, None)
+                    if value is not None:
+                        stack.append(value)
+    return total
+
+
+def subsystem_sizes(bot):
+    """Approximate bytes held by each part of the bot, largest first.
+
+    Objects shared between parts are counted once, for whichever part is
+    measured first.
+    """
+    seen = set()
+    # Discord's caches go first, so members a queue entry points at count as theirs
+    state = bot._connection
+    parts = [
+        ("Discord guilds", state._guilds),
+        ("Discord users", state._users),
+        ("Discord messages", state._messages),
+        ("Member cache", bot.member_cache)
+    ]
+    music = bot.get_cog('MusicCog')
+    if music is not None:
+        players = [getattr(player, 'data', None) for player in music.current_players.values()]
+        parts += [
+            ("Music queues", music.music_queues),
+            ("Current tracks", players),
+            ("Song suggestions", [music.title_index, music.remote_search]),
+            ("Loudness", music.loudness.measured),
+            ("Listen together", [music.sessions, music.listen_links])
+        ]
+    sizes = [(name, deep_size(obj, seen)) for name, obj in parts]
+    return sorted(sizes, key=lambda item: item[1], reverse=True)
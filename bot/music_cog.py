@@ -4,8 +4,18 @@ from discord import app_commands
 import asyncio
 import yt_dlp
 import logging
+import json
+import os
+import time
 from urllib.parse import urlparse
 import re
+from bot.audio_cache import AudioCache
+from bot.search_index import TitleIndex, RemoteSearchCache
+from bot.listen_together import ListenSession, SharedOpusStream
+from bot.loudness import LoudnessAnalyzer
+from bot.now_playing import NowPlayingBoard, NowPlayingView, progress_bar
+from bot.track import Track, track_info
+from bot.utils import format_duration
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +34,48 @@ ytdl_format_options = {
     'source_address': '0.0.0.0'
 }
 
+# Playlist listing only reads titles and URLs; each entry is resolved later
+ytdl_playlist_options = {
+    **ytdl_format_options,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+    'playlistend': 100
+}
+
 ffmpeg_options = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
 }
 
+# Cached files are local, so FFmpeg doesn't need the reconnect options
+local_ffmpeg_options = {
+    'options': '-vn'
+}
+
+# Where queues are saved on shutdown and picked up on the next start
+MUSIC_STATE_PATH = os.getenv("MUSIC_STATE_PATH", "music_state.json")
+MUSIC_STATE_MAX_AGE = 15 * 60
+
 ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+playlist_ytdl = yt_dlp.YoutubeDL(ytdl_playlist_options)
+audio_cache = AudioCache()
+
+def ffmpeg_input(data, start=0, gain=None, volume=None):
+    """Pick the cached file or the stream URL for FFmpeg, seeking to start and adjusting volume"""
+    cached_path = audio_cache.get(data)
+    source, options = (cached_path, local_ffmpeg_options) if cached_path else (data['url'], ffmpeg_options)
+    if start:
+        # Seek before opening the input so resuming doesn't decode the skipped part
+        options = {**options, 'before_options': f"-ss {start:.2f} {options.get('before_options', '')}".strip()}
+    filters = []
+    if gain is not None:
+        # Loudness normalization from the cached measurement, a plain gain needs no second pass
+        filters.append(f"volume={gain:.2f}dB")
+    if volume is not None:
+        filters.append(f"volume={volume}")
+    if filters:
+        options = {**options, 'options': f"{options['options']} -filter:a {','.join(filters)}"}
+    return source, options
 
 class YTDLSource(discord.PCMVolumeTransformer):
     def __init__(self, source, *, data, volume=0.5):
@@ -39,32 +85,246 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.url = data.get('url')
         self.duration = data.get('duration')
         self.thumbnail = data.get('thumbnail')
+        self.frames = 0
+    
+    def read(self):
+        self.frames += 1
+        return super().read()
+    
+    @property
+    def position(self):
+        """Seconds played so far (each frame is 20ms)"""
+        return self.frames * 0.02
 
     @classmethod
     async def from_url(cls, url, *, loop=None, stream=False):
         loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
+        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
         
         if 'entries' in data:
             data = data['entries'][0]
+        data = track_info(data)
+        
+        if not stream:
+            # Download mode goes through the managed cache instead of the working directory
+            await audio_cache.fetch(data, loop=loop)
         
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+        return cls.from_data(data)
+
+    @classmethod
+    def from_data(cls, data, start=0, gain=None):
+        """Create a player from extracted info, preferring the local cache"""
+        source, options = ffmpeg_input(data, start, gain)
+        player = cls(discord.FFmpegPCMAudio(source, **options), data=data)
+        player.frames = int(start * 50)
+        return player
+
+def save_music_state(path, state):
+    """Write a music snapshot to disk for the next start"""
+    with open(path, 'w') as f:
+        json.dump({'saved_at': time.time(), 'guilds': state}, f)
+
+def load_music_state(path, max_age=MUSIC_STATE_MAX_AGE):
+    """Read and remove a saved music snapshot, ignoring stale ones"""
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable music state %s: %s", path, e)
+        return None
+    if time.time() - saved.get('saved_at', 0) > max_age:
+        return None
+    return saved.get('guilds')
 
 class MusicCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.music_queues = {}
         self.current_players = {}
+        self.playlist_tasks = {}
+        self.title_index = TitleIndex()
+        self.remote_search = RemoteSearchCache(self.search_remote)
+        self.loudness = LoudnessAnalyzer(bot.db, audio_cache)
+        self.now_playing_view = NowPlayingView()
+        self.now_playing = NowPlayingBoard(self.now_playing_embed, self.now_playing_view)
+        # Listen-together sessions by join code, and by every guild taking part
+        self.sessions = {}
+        self.listen_links = {}
+    
+    async def cog_load(self):
+        """Load the suggestion index and pick up queues saved by a reload or restart"""
+        try:
+            tracks = await self.bot.db.get_played_tracks()
+            for track in tracks:
+                self.title_index.add(track['track_key'], track['title'], track['url'], track['play_count'])
+            self.loudness.load(tracks)
+            logger.info("Loaded %s track(s) into the search index", len(self.title_index))
+        except Exception as e:
+            logger.error("Failed to load track search index: %s", e)
         
+        # Buttons on now playing messages from before a reload or restart keep working
+        self.bot.add_view(self.now_playing_view)
+        self.now_playing.start()
+        
+        # Pick up queues from the MusicCog this one replaces, or from before a restart
+        if self.bot.music_handoff is not None:
+            state, self.bot.music_handoff = self.bot.music_handoff, None
+            await self.restore(state)
+        else:
+            state = await self.bot.loop.run_in_executor(None, load_music_state, MUSIC_STATE_PATH)
+            if state:
+                self.bot.loop.create_task(self.restore_when_ready(state))
+    
+    async def cog_unload(self):
+        """Hand queues and players over to the next MusicCog on reload"""
+        for guild_id in list(self.playlist_tasks):
+            self.cancel_playlist_task(guild_id)
+        self.now_playing.stop()
+        self.bot.music_handoff = self.snapshot()
+    
+    def entry_state(self, entry, include_data=True):
+        """Serialize a queue entry into plain data"""
+        data = entry.get('data')
+        requester = entry.get('requester')
+        return {
+            'title': entry.get('title'),
+            'url': entry.get('url') or (data or {}).get('webpage_url') or (data or {}).get('original_url'),
+            'requester_id': requester.id if requester else None,
+            'data': data if include_data else None
+        }
+    
+    def entry_from_state(self, guild, state):
+        """Rebuild a queue entry; entries without data are resolved lazily"""
+        requester_id = state.get('requester_id')
+        requester = None
+        if requester_id:
+            requester = guild.get_member(requester_id) or discord.Object(id=requester_id)
+        return {
+            'url': state.get('url'),
+            'data': state.get('data'),
+            'requester': requester,
+            'title': state.get('title') or state.get('url')
+        }
+    
+    def snapshot(self, include_data=True):
+        """Serialize every connected guild's queue and current song"""
+        state = []
+        for voice_client in self.bot.voice_clients:
+            guild_id = voice_client.guild.id
+            player = self.current_players.get(guild_id)
+            current = None
+            if player is not None and voice_client.source is player:
+                current = {
+                    **self.entry_state({'data': player.data, 'title': player.title}, include_data),
+                    'position': player.position
+                }
+            state.append({
+                'guild_id': guild_id,
+                'channel_id': voice_client.channel.id,
+                'paused': voice_client.is_paused(),
+                'current': current,
+                'queue': [self.entry_state(entry, include_data) for entry in self.music_queues.get(guild_id, [])]
+            })
+        return state
+    
+    async def save_state(self):
+        """Save queues to disk so the next start can resume them"""
+        state = self.snapshot(include_data=False)
+        if state:
+            # Stream URLs expire, so only page URLs are saved and resolved again later
+            await self.bot.loop.run_in_executor(None, save_music_state, MUSIC_STATE_PATH, state)
+            logger.info("Saved music state for %s guild(s)", len(state))
+    
+    async def restore_when_ready(self, state):
+        """Restore a saved snapshot once the guild cache is filled"""
+        await self.bot.wait_until_ready()
+        await self.restore(state)
+    
+    async def restore(self, state):
+        """Re-attach queues and players from a snapshot"""
+        for guild_state in state:
+            guild = self.bot.get_guild(guild_state['guild_id'])
+            if guild is None:
+                continue
+            guild_id = guild.id
+            entries = [self.entry_from_state(guild, item) for item in guild_state['queue']]
+            self.get_queue(guild_id).extend(entries)
+            
+            try:
+                voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+                if voice_client and voice_client.source is not None:
+                    # Still playing after a reload, only the bookkeeping moves over
+                    self.current_players[guild_id] = voice_client.source
+                elif voice_client:
+                    await self.play_next(guild_id)
+                else:
+                    channel = guild.get_channel(guild_state['channel_id'])
+                    if channel is None:
+                        continue
+                    voice_client = await channel.connect()
+                    if guild_state['current']:
+                        current = self.entry_from_state(guild, guild_state['current'])
+                        data = await self.resolve_entry(current)
+                        self.start_playing(voice_client, guild_id, data, start=guild_state['current']['position'])
+                        if guild_state['paused']:
+                            voice_client.pause()
+                    else:
+                        await self.play_next(guild_id)
+            except Exception as e:
+                logger.warning("Could not resume music in guild %s: %s", guild_id, e)
+            
+            unresolved = [entry for entry in entries if entry.get('data') is None]
+            if unresolved:
+                self.playlist_tasks[guild_id] = self.bot.loop.create_task(self.fill_playlist(guild_id, unresolved))
+        
+    def queue_owner(self, guild_id):
+        """Guild whose queue this guild plays from (the host's when listening together)"""
+        session = self.listen_links.get(guild_id)
+        return session.host_id if session else guild_id
+    
+    def session_voice_clients(self, guild):
+        """Voice clients playing this guild's music, every session member's when listening together"""
+        session = self.listen_links.get(guild.id)
+        if session is None:
+            voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+            return [voice_client] if voice_client else []
+        return [voice_client for voice_client in self.bot.voice_clients if voice_client.guild.id in session.guild_ids]
+    
     def get_queue(self, guild_id):
         """Get or create music queue for guild"""
+        guild_id = self.queue_owner(guild_id)
         if guild_id not in self.music_queues:
             self.music_queues[guild_id] = []
         return self.music_queues[guild_id]
     
+    async def query_autocomplete(self, interaction: discord.Interaction, current: str):
+        """Suggest songs from previously played tracks, then from YouTube"""
+        if not current.strip():
+            return []
+        
+        suggestions = self.title_index.search(current, limit=25)
+        
+        # Only go remote for queries the local index can't answer well
+        if len(suggestions) < 5 and len(current) >= 3:
+            remote = await self.remote_search.search(interaction.user.id, current, timeout=2.0)
+            seen = {url for _, url in suggestions}
+            for title, url in remote or []:
+                if url not in seen and len(suggestions) < 25:
+                    suggestions.append((title, url))
+                    seen.add(url)
+        
+        return [
+            app_commands.Choice(name=title[:100], value=url)
+            for title, url in suggestions
+            if len(url) <= 100
+        ]
+    
     @app_commands.command(name="play", description="Play a song for you and your partner 🎵")
     @app_commands.describe(query="Song name or YouTube URL")
+    @app_commands.autocomplete(query=query_autocomplete)
     async def play(self, interaction: discord.Interaction, query: str):
         """Play music command"""
         try:
@@ -80,6 +340,7 @@ class MusicCog(commands.Cog):
             
             # Defer response since this might take a while
             await interaction.response.defer()
+            self.now_playing.attach(interaction.guild.id, interaction.channel)
             
             # Connect to voice channel if not already connected
             voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
@@ -90,7 +351,7 @@ class MusicCog(commands.Cog):
             
             # Search for the song
             try:
-                player = await YTDLSource.from_url(query, loop=self.bot.loop, stream=True)
+                data = await self.extract_track(query)
             except Exception as e:
                 await interaction.followup.send(
                     f"❌ Couldn't find or play that song! Try a different search term or URL. 💔"
@@ -99,10 +360,12 @@ class MusicCog(commands.Cog):
             
             guild_queue = self.get_queue(interaction.guild.id)
             
+            # Cache the track in the background so repeat plays come from disk
+            self.prefetch(data)
+            
             # If nothing is playing, start immediately
             if not voice_client.is_playing():
-                voice_client.play(player, after=lambda e: self.song_finished(interaction.guild.id, e))
-                self.current_players[interaction.guild.id] = player
+                player = self.start_playing(voice_client, interaction.guild.id, data)
                 
                 embed = discord.Embed(
                     title="🎵 Now Playing",
@@ -133,15 +396,17 @@ class MusicCog(commands.Cog):
                 await interaction.followup.send(embed=embed)
             else:
                 # Add to queue
+                # The FFmpeg process is only started once the song comes up
                 guild_queue.append({
-                    'player': player,
+                    'data': data,
                     'requester': interaction.user,
-                    'title': player.title
+                    'title': data.get('title')
                 })
+                self.touch_now_playing(interaction.guild)
                 
                 embed = discord.Embed(
                     title="📝 Added to Queue",
-                    description=f"**{player.title}** has been added to the queue!",
+                    description=f"**{data.get('title')}** has been added to the queue!",
                     color=0x90EE90
                 )
                 embed.add_field(
@@ -158,39 +423,308 @@ class MusicCog(commands.Cog):
                 await interaction.followup.send(embed=embed)
                 
         except Exception as e:
-            logger.error(f"Error in play command: {e}")
+            logger.error("Error in play command: %s", e)
             await interaction.followup.send(
                 "❌ Something went wrong while trying to play music. Please try again! 💔"
             )
     
+    def start_playing(self, voice_client, guild_id, data, start=0):
+        """Start playing a track and remember it for suggestions"""
+        session = self.listen_links.get(guild_id)
+        if session:
+            player = self.start_session_track(session, voice_client, guild_id, data, start)
+        else:
+            player = YTDLSource.from_data(data, start=start, gain=self.loudness.gain(data))
+            bot = self.bot
+            # The cog is looked up when the song ends, so a reloaded MusicCog takes over
+            voice_client.play(player, after=lambda e: MusicCog.song_ended(bot, guild_id, e))
+            self.current_players[guild_id] = player
+            self.now_playing.touch(guild_id)
+        self.bot.loop.create_task(self.record_play(data))
+        return player
+    
+    def start_session_track(self, session, voice_client, guild_id, data, start=0):
+        """Start one FFmpeg process for a track and play it in every guild of the session"""
+        # FFmpeg encodes Opus once and applies YTDLSource's default volume itself
+        source, options = ffmpeg_input(data, start, self.loudness.gain(data), volume=0.5)
+        stream = SharedOpusStream(discord.FFmpegOpusAudio(source, **options), data, start=start)
+        session.stream = stream
+        session.listening = set()
+        
+        player = self.attach_listener(session, voice_client, guild_id)
+        for member in self.session_voice_clients(voice_client.guild):
+            if member.guild.id != guild_id:
+                self.attach_listener(session, member, member.guild.id)
+        return player
+    
+    def attach_listener(self, session, voice_client, guild_id):
+        """Play the session's current stream in one guild from the live position"""
+        if voice_client.source is not None:
+            # A leftover listener, its end is ignored since the stream has moved on
+            voice_client.stop()
+        stream = session.stream
+        listener = stream.listen()
+        bot = self.bot
+        voice_client.play(listener, after=lambda e: MusicCog.listener_ended(bot, session, stream, guild_id, e))
+        session.listening.add(guild_id)
+        self.current_players[guild_id] = listener
+        self.now_playing.touch(guild_id)
+        return listener
+    
+    async def record_play(self, data):
+        """Store a played track in the database and the search index"""
+        title = data.get('title')
+        url = data.get('webpage_url') or data.get('original_url')
+        if not title or not url:
+            return
+        key = audio_cache.cache_key(data)
+        try:
+            await self.bot.db.record_track_play(key, title, url, data.get('duration'))
+        except Exception as e:
+            logger.error("Failed to record played track: %s", e)
+        self.title_index.add(key, title, url, self.title_index.play_count(key) + 1)
+    
+    async def search_remote(self, query):
+        """Search YouTube for suggestions without resolving the results"""
+        data = await self.bot.loop.run_in_executor(
+            None, lambda: playlist_ytdl.extract_info(f"ytsearch5:{query}", download=False)
+        )
+        results = []
+        for entry in data.get('entries') or []:
+            url = entry.get('url') or entry.get('webpage_url')
+            if entry.get('title') and url:
+                results.append((entry['title'], url))
+        return results
+    
+    def prefetch(self, data):
+        """Download a track in the background, then measure its loudness once"""
+        download = audio_cache.prefetch(data, loop=self.bot.loop)
+        self.loudness.schedule(data, download, loop=self.bot.loop)
+    
+    def cancel_playlist_task(self, guild_id):
+        """Stop resolving playlist entries for a guild"""
+        task = self.playlist_tasks.pop(guild_id, None)
+        if task:
+            task.cancel()
+    
+    async def extract_track(self, query):
+        """Extract info for a single track without downloading it"""
+        data = await self.bot.loop.run_in_executor(None, lambda: ytdl.extract_info(query, download=False))
+        if 'entries' in data:
+            data = data['entries'][0]
+        # Low-memory mode drops the format lists and everything else playback doesn't read
+        return track_info(data)
+    
+    async def extract_playlist(self, query):
+        """List playlist entries without resolving each one"""
+        data = await self.bot.loop.run_in_executor(None, lambda: playlist_ytdl.extract_info(query, download=False))
+        if 'entries' not in data:
+            # A single video, already fully usable
+            return [track_info(data)]
+        return [entry for entry in data['entries'] if entry]
+    
+    async def resolve_entry(self, entry):
+        """Resolve a lazy queue entry into full track info"""
+        if entry.get('data') is None:
+            task = entry.get('resolver')
+            if task is None or task.cancelled() or (task.done() and task.exception() is not None):
+                # A resolver cancelled with an old fill_playlist, or one that failed, is started again
+                task = self.bot.loop.create_task(self.extract_track(entry['url']))
+                entry['resolver'] = task
+            # Shielded, cancelling one waiter (like a replaced fill_playlist) leaves the others theirs
+            entry['data'] = await asyncio.shield(task)
+            entry['title'] = entry['data'].get('title') or entry['title']
+            self.prefetch(entry['data'])
+        return entry['data']
+    
+    async def fill_playlist(self, guild_id, entries):
+        """Resolve queued playlist entries one by one in the background"""
+        for entry in entries:
+            queue = self.get_queue(guild_id)
+            if not any(queued is entry for queued in queue):
+                # Skipped, played or the queue was cleared
+                continue
+            try:
+                await self.resolve_entry(entry)
+            except Exception as e:
+                logger.warning("Dropping unplayable playlist entry %s: %s", entry['url'], e)
+                if any(queued is entry for queued in queue):
+                    queue.remove(entry)
+        if self.playlist_tasks.get(guild_id) is asyncio.current_task():
+            del self.playlist_tasks[guild_id]
+    
+    @staticmethod
+    def song_ended(bot, guild_id, error):
+        """Pass the end of a song to whichever MusicCog is loaded now"""
+        cog = bot.get_cog('MusicCog')
+        if cog:
+            cog.song_finished(guild_id, error)
+    
     def song_finished(self, guild_id, error):
         """Called when a song finishes playing"""
         if error:
-            logger.error(f"Player error: {error}")
+            logger.error("Player error: %s", error)
         
-        # Play next song in queue
+        # Runs on the audio thread, the next entry may still need resolving
+        asyncio.run_coroutine_threadsafe(self.play_next(guild_id), self.bot.loop)
+    
+    @staticmethod
+    def listener_ended(bot, session, stream, guild_id, error):
+        """Pass the end of a shared song in one guild to whichever MusicCog is loaded now"""
+        if error:
+            logger.error("Player error: %s", error)
+        cog = bot.get_cog('MusicCog')
+        if cog:
+            asyncio.run_coroutine_threadsafe(cog.listener_finished(session, stream, guild_id), bot.loop)
+    
+    async def listener_finished(self, session, stream, guild_id):
+        """Move the session on once every guild has finished the shared song"""
+        self.now_playing.touch(guild_id)
+        if self.listen_links.get(guild_id) is not session:
+            # The guild left, the session ended or the cog was reloaded
+            await self.play_next(guild_id)
+            return
+        if stream is not session.stream:
+            return
+        session.listening.discard(guild_id)
+        if not session.listening:
+            session.stream = None
+            await self.play_next(session.host_id)
+    
+    async def play_next(self, guild_id):
+        """Play the next song in the queue"""
+        self.now_playing.touch(guild_id)
+        guild_id = self.queue_owner(guild_id)
         queue = self.get_queue(guild_id)
-        if queue:
+        guild = self.bot.get_guild(guild_id)
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+        
+        while queue and voice_client:
             next_song = queue.pop(0)
-            guild = self.bot.get_guild(guild_id)
-            voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+            try:
+                data = await self.resolve_entry(next_song)
+            except Exception as e:
+                logger.warning("Skipping unplayable song %s: %s", next_song['title'], e)
+                continue
             
-            if voice_client:
-                voice_client.play(
-                    next_song['player'], 
-                    after=lambda e: self.song_finished(guild_id, e)
+            if voice_client.is_playing():
+                # Someone started a song while this one was resolving
+                queue.insert(0, next_song)
+                return
+            
+            self.start_playing(voice_client, guild_id, data)
+            return
+    
+    @app_commands.command(name="play_playlist", description="Queue a whole playlist or album 🎶")
+    @app_commands.describe(query="Playlist URL or search term")
+    async def play_playlist(self, interaction: discord.Interaction, query: str):
+        """Play a playlist, starting as soon as the first song is ready"""
+        try:
+            if not interaction.user.voice:
+                await interaction.response.send_message(
+                    "❌ You need to be in a voice channel to play music! Join one and try again! 💕", 
+                    ephemeral=True
                 )
-                self.current_players[guild_id] = next_song['player']
+                return
+            
+            voice_channel = interaction.user.voice.channel
+            await interaction.response.defer()
+            self.now_playing.attach(interaction.guild.id, interaction.channel)
+            
+            voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+            if not voice_client:
+                voice_client = await voice_channel.connect()
+            elif voice_client.channel != voice_channel:
+                await voice_client.move_to(voice_channel)
+            
+            try:
+                flat_entries = await self.extract_playlist(query)
+            except Exception as e:
+                await interaction.followup.send(
+                    "❌ Couldn't load that playlist! Check the link and try again. 💔"
+                )
+                return
+            
+            entries = []
+            for flat_entry in flat_entries:
+                url = flat_entry.get('url') or flat_entry.get('webpage_url') or flat_entry.get('id')
+                if not url:
+                    continue
+                resolved = flat_entry if isinstance(flat_entry, Track) or flat_entry.get('formats') else None
+                entries.append({
+                    'url': url,
+                    'data': resolved,
+                    'requester': interaction.user,
+                    'title': flat_entry.get('title') or url
+                })
+            
+            if not entries:
+                await interaction.followup.send("❌ That playlist is empty! 💔")
+                return
+            
+            # Only the first song has to be resolved before playback starts
+            first = entries[0]
+            try:
+                await self.resolve_entry(first)
+            except Exception as e:
+                logger.warning("First playlist entry failed to resolve: %s", e)
+            
+            guild_id = interaction.guild.id
+            guild_queue = self.get_queue(guild_id)
+            
+            now_playing = None
+            if first.get('data') is None:
+                # Unplayable, the rest of the playlist still goes in the queue
+                entries = entries[1:]
+            elif not voice_client.is_playing():
+                player = self.start_playing(voice_client, guild_id, first['data'])
+                now_playing = player.title
+                entries = entries[1:]
+            
+            guild_queue.extend(entries)
+            self.touch_now_playing(interaction.guild)
+            if first.get('data') is None and entries and not voice_client.is_playing():
+                # Nothing else would start the queue, play_next resolves the next entry itself
+                self.bot.loop.create_task(self.play_next(guild_id))
+            
+            if entries:
+                previous = self.playlist_tasks.pop(guild_id, None)
+                if previous:
+                    # Entries from the earlier playlist are still resolved by play_next
+                    previous.cancel()
+                self.playlist_tasks[guild_id] = self.bot.loop.create_task(self.fill_playlist(guild_id, entries))
+            
+            embed = discord.Embed(
+                title="🎶 Playlist Added",
+                description=f"**{len(flat_entries)}** songs have been added to the queue!",
+                color=0x90EE90,
+                timestamp=interaction.created_at
+            )
+            if now_playing:
+                embed.add_field(
+                    name="🎵 Now Playing",
+                    value=f"**{now_playing}**",
+                    inline=False
+                )
+            embed.add_field(
+                name="🎧 Requested by",
+                value=interaction.user.mention,
+                inline=True
+            )
+            embed.set_footer(text="Song details load in the background 💕")
+            
+            await interaction.followup.send(embed=embed)
+            
+        except Exception as e:
+            logger.error("Error in play_playlist command: %s", e)
+            await interaction.followup.send(
+                "❌ Something went wrong while loading the playlist. Please try again! 💔"
+            )
     
     @app_commands.command(name="stop", description="Stop music and clear the queue 🛑")
     async def stop(self, interaction: discord.Interaction):
         """Stop music command"""
-        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        
-        if voice_client and voice_client.is_playing():
-            voice_client.stop()
-            self.music_queues[interaction.guild.id] = []
-            
+        if self.stop_music(interaction.guild):
             embed = discord.Embed(
                 title="🛑 Music Stopped",
                 description="Music has been stopped and queue cleared!",
@@ -206,10 +740,7 @@ class MusicCog(commands.Cog):
     @app_commands.command(name="pause", description="Pause the current song ⏸️")
     async def pause(self, interaction: discord.Interaction):
         """Pause music command"""
-        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        
-        if voice_client and voice_client.is_playing():
-            voice_client.pause()
+        if self.pause_music(interaction.guild):
             embed = discord.Embed(
                 title="⏸️ Music Paused",
                 description="Music has been paused. Use `/resume` to continue!",
@@ -225,10 +756,7 @@ class MusicCog(commands.Cog):
     @app_commands.command(name="resume", description="Resume the paused song ▶️")
     async def resume(self, interaction: discord.Interaction):
         """Resume music command"""
-        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        
-        if voice_client and voice_client.is_paused():
-            voice_client.resume()
+        if self.resume_music(interaction.guild):
             embed = discord.Embed(
                 title="▶️ Music Resumed",
                 description="Music has been resumed!",
@@ -244,10 +772,7 @@ class MusicCog(commands.Cog):
     @app_commands.command(name="skip", description="Skip to the next song ⏭️")
     async def skip(self, interaction: discord.Interaction):
         """Skip song command"""
-        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        
-        if voice_client and voice_client.is_playing():
-            voice_client.stop()  # This will trigger the next song
+        if self.skip_song(interaction.guild):
             embed = discord.Embed(
                 title="⏭️ Song Skipped",
                 description="Skipped to the next song!",
@@ -260,6 +785,106 @@ class MusicCog(commands.Cog):
                 ephemeral=True
             )
     
+    def stop_music(self, guild):
+        """Stop playback and clear the queue, returning whether anything was playing"""
+        voice_clients = [vc for vc in self.session_voice_clients(guild) if vc.is_playing()]
+        if voice_clients:
+            self.music_queues[self.queue_owner(guild.id)] = []
+            for voice_client in voice_clients:
+                self.cancel_playlist_task(voice_client.guild.id)
+                voice_client.stop()
+        return bool(voice_clients)
+    
+    def pause_music(self, guild):
+        """Pause playback, returning whether anything was playing"""
+        voice_clients = [vc for vc in self.session_voice_clients(guild) if vc.is_playing()]
+        for voice_client in voice_clients:
+            voice_client.pause()
+        self.touch_now_playing(guild)
+        return bool(voice_clients)
+    
+    def resume_music(self, guild):
+        """Resume playback, returning whether anything was paused"""
+        voice_clients = [vc for vc in self.session_voice_clients(guild) if vc.is_paused()]
+        for voice_client in voice_clients:
+            voice_client.resume()
+        self.touch_now_playing(guild)
+        return bool(voice_clients)
+    
+    def skip_song(self, guild):
+        """Skip to the next song, returning whether anything was playing"""
+        voice_clients = [vc for vc in self.session_voice_clients(guild) if vc.is_playing()]
+        for voice_client in voice_clients:
+            voice_client.stop()  # This will trigger the next song
+        return bool(voice_clients)
+    
+    def touch_now_playing(self, guild):
+        """Refresh the now playing message of a guild and everyone listening along with it"""
+        session = self.listen_links.get(guild.id)
+        for guild_id in session.guild_ids if session else (guild.id,):
+            self.now_playing.touch(guild_id)
+    
+    def now_playing_embed(self, guild_id):
+        """Render the live now playing message, returning (embed, whether a song is on)"""
+        guild = self.bot.get_guild(guild_id)
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+        player = self.current_players.get(guild_id)
+        queue = self.get_queue(guild_id)
+        
+        if voice_client is None or player is None or voice_client.source is not player:
+            embed = discord.Embed(
+                title="🎵 Nothing Playing",
+                description="Use `/play` to add some music! 🎶",
+                color=0xff69b4
+            )
+            return embed, False
+        
+        paused = voice_client.is_paused()
+        embed = discord.Embed(
+            title="⏸️ Paused" if paused else "🎵 Now Playing",
+            description=f"**{player.title}**",
+            color=0xffa500 if paused else 0xff69b4
+        )
+        if player.thumbnail:
+            embed.set_thumbnail(url=player.thumbnail)
+        
+        position = player.position
+        embed.add_field(
+            name="⏱️ Progress",
+            value=f"{progress_bar(position, player.duration)} `{format_duration(position)} / {format_duration(player.duration)}`",
+            inline=False
+        )
+        
+        if queue:
+            up_next = "\n".join(f"{i}. **{song['title']}**" for i, song in enumerate(queue[:5], 1))
+            if len(queue) > 5:
+                up_next += f"\n...and {len(queue) - 5} more"
+            embed.add_field(name="📝 Up Next", value=up_next[:1024], inline=False)
+        
+        embed.set_footer(text="Updates live, use the buttons to control the music 💕")
+        return embed, True
+    
+    async def now_playing_button(self, interaction, action):
+        """Handle a pause/resume, skip or stop button on a now playing message"""
+        guild = interaction.guild
+        if action == 'toggle':
+            done = self.pause_music(guild) or self.resume_music(guild)
+        elif action == 'skip':
+            done = self.skip_song(guild)
+        else:
+            done = self.stop_music(guild)
+        
+        if not done:
+            await interaction.response.send_message("❌ No music is currently playing!", ephemeral=True)
+        elif action == 'toggle':
+            # Answering the press with the edit costs no extra API call
+            embed, playing = self.now_playing_embed(guild.id)
+            await interaction.response.edit_message(embed=embed, view=self.now_playing_view if playing else None)
+            self.now_playing.edited(guild.id)
+        else:
+            # The next song starts asynchronously, the edit loop picks it up
+            await interaction.response.defer()
+    
     @app_commands.command(name="queue", description="View the music queue 📝")
     async def queue(self, interaction: discord.Interaction):
         """Show music queue"""
@@ -282,7 +907,8 @@ class MusicCog(commands.Cog):
         if queue:
             queue_text = ""
             for i, song in enumerate(queue[:10], 1):
-                queue_text += f"{i}. **{song['title']}** - {song['requester'].mention}\n"
+                requester = f" - <@{song['requester'].id}>" if song.get('requester') else ""
+                queue_text += f"{i}. **{song['title']}**{requester}\n"
             
             embed.add_field(
                 name="📝 Up Next",
@@ -310,10 +936,15 @@ class MusicCog(commands.Cog):
         voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
         
         if voice_client:
-            await voice_client.disconnect()
+            session = self.listen_links.get(interaction.guild.id)
+            if session:
+                self.leave_session(session, interaction.guild.id)
             self.music_queues[interaction.guild.id] = []
+            self.cancel_playlist_task(interaction.guild.id)
+            await voice_client.disconnect()
             if interaction.guild.id in self.current_players:
                 del self.current_players[interaction.guild.id]
+            self.now_playing.detach(interaction.guild.id)
             
             embed = discord.Embed(
                 title="👋 Left Voice Channel",
@@ -326,3 +957,175 @@ class MusicCog(commands.Cog):
                 "❌ I'm not in a voice channel!", 
                 ephemeral=True
             )
+    
+    async def connect_voice(self, interaction):
+        """Connect to, or move to, the caller's voice channel"""
+        voice_channel = interaction.user.voice.channel
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+        if not voice_client:
+            voice_client = await voice_channel.connect()
+        elif voice_client.channel != voice_channel:
+            await voice_client.move_to(voice_channel)
+        return voice_client
+    
+    def leave_session(self, session, guild_id):
+        """Take one guild out of a session, ending it if the guild is the host"""
+        if guild_id == session.host_id:
+            for member_id in list(session.guild_ids - {guild_id}):
+                self.leave_session(session, member_id)
+            # The host finishes the current song alone, then carries on with its queue
+            self.sessions.pop(session.code, None)
+        else:
+            guild = self.bot.get_guild(guild_id)
+            voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+            if voice_client and voice_client.source is not None:
+                voice_client.stop()
+            self.current_players.pop(guild_id, None)
+        session.guild_ids.discard(guild_id)
+        session.listening.discard(guild_id)
+        self.listen_links.pop(guild_id, None)
+    
+    @app_commands.command(name="listen_together", description="Start a session so your partner can listen along from their server 💞")
+    async def listen_together(self, interaction: discord.Interaction):
+        """Host a listen-together session for this server's queue"""
+        session = self.listen_links.get(interaction.guild.id)
+        if session and session.host_id != interaction.guild.id:
+            await interaction.response.send_message(
+                "❌ This server is already listening along with another one! Use `/listen_leave` first.", 
+                ephemeral=True
+            )
+            return
+        
+        if not interaction.user.voice:
+            await interaction.response.send_message(
+                "❌ You need to be in a voice channel to listen together! Join one and try again! 💕", 
+                ephemeral=True
+            )
+            return
+        
+        try:
+            await interaction.response.defer()
+            voice_client = await self.connect_voice(interaction)
+            
+            if session is None:
+                session = ListenSession(interaction.guild.id)
+                while session.code in self.sessions:
+                    session = ListenSession(interaction.guild.id)
+                self.sessions[session.code] = session
+                self.listen_links[interaction.guild.id] = session
+            
+            embed = discord.Embed(
+                title="💞 Listen Together",
+                description=f"Your partner can join with `/listen_join {session.code}` from a voice channel in their server!",
+                color=0xff69b4
+            )
+            embed.add_field(
+                name="🎧 Listening",
+                value=f"{len(session.guild_ids)} server(s)",
+                inline=True
+            )
+            if voice_client.is_playing() and session.stream is None:
+                embed.set_footer(text="Shared playback starts with the next song 💕")
+            else:
+                embed.set_footer(text="Songs you queue now play for both of you 💕")
+            
+            await interaction.followup.send(embed=embed)
+            
+        except Exception as e:
+            logger.error("Error in listen_together command: %s", e)
+            await interaction.followup.send(
+                "❌ Something went wrong while starting the session. Please try again! 💔"
+            )
+    
+    @app_commands.command(name="listen_join", description="Listen along with your partner's server 🎧")
+    @app_commands.describe(code="The code from your partner's /listen_together")
+    async def listen_join(self, interaction: discord.Interaction, code: str):
+        """Join another server's listen-together session"""
+        session = self.sessions.get(code.strip().upper())
+        if session is None:
+            await interaction.response.send_message(
+                "❌ There's no listening session with that code! 💔", 
+                ephemeral=True
+            )
+            return
+        
+        if interaction.guild.id in self.listen_links:
+            await interaction.response.send_message(
+                "❌ This server is already in a listening session! Use `/listen_leave` first.", 
+                ephemeral=True
+            )
+            return
+        
+        if not interaction.user.voice:
+            await interaction.response.send_message(
+                "❌ You need to be in a voice channel to listen together! Join one and try again! 💕", 
+                ephemeral=True
+            )
+            return
+        
+        try:
+            await interaction.response.defer()
+            voice_client = await self.connect_voice(interaction)
+            guild_id = interaction.guild.id
+            self.now_playing.attach(guild_id, interaction.channel)
+            
+            # This server's own music makes way for the shared queue
+            self.music_queues[guild_id] = []
+            self.cancel_playlist_task(guild_id)
+            if voice_client.source is not None:
+                voice_client.stop()
+            
+            session.guild_ids.add(guild_id)
+            self.listen_links[guild_id] = session
+            now_playing = None
+            if session.stream is not None:
+                now_playing = self.attach_listener(session, voice_client, guild_id).title
+            
+            embed = discord.Embed(
+                title="💞 Listening Together",
+                description="You're now hearing the same songs as your partner! `/play`, `/skip` and `/queue` share one queue.",
+                color=0xff69b4
+            )
+            if now_playing:
+                embed.add_field(
+                    name="🎵 Now Playing",
+                    value=f"**{now_playing}**",
+                    inline=False
+                )
+            embed.add_field(
+                name="🎧 Listening",
+                value=f"{len(session.guild_ids)} server(s)",
+                inline=True
+            )
+            
+            await interaction.followup.send(embed=embed)
+            
+        except Exception as e:
+            logger.error("Error in listen_join command: %s", e)
+            await interaction.followup.send(
+                "❌ Something went wrong while joining the session. Please try again! 💔"
+            )
+    
+    @app_commands.command(name="listen_leave", description="Stop listening together 👋")
+    async def listen_leave(self, interaction: discord.Interaction):
+        """Leave the session, or end it when this server hosts it"""
+        session = self.listen_links.get(interaction.guild.id)
+        if session is None:
+            await interaction.response.send_message(
+                "❌ This server isn't in a listening session!", 
+                ephemeral=True
+            )
+            return
+        
+        hosting = session.host_id == interaction.guild.id
+        self.leave_session(session, interaction.guild.id)
+        
+        embed = discord.Embed(
+            title="👋 Listening Session Ended" if hosting else "👋 Left Listening Session",
+            description="Music is back to just this server! 💕",
+            color=0xff69b4
+        )
+        await interaction.response.send_message(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(MusicCog(bot))
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+def progress_bar(position, duration, width=16):
+    """Text progress bar like ▬▬▬🔘▬▬▬▬"""
+    if not duration:
+        return "🔘" + "▬" * (width - 1)
+    filled = min(width - 1, int(position / duration * (width - 1)))
+    return "▬" * filled + "🔘" + "▬" * (width - 1 - filled)
+
+
+class NowPlayingView(discord.ui.View):
+    """Pause/skip/stop buttons, persistent so they keep working after a restart"""
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    async def press(self, interaction, action):
+        # Looked up on every press, so a reloaded MusicCog takes over
+        cog = interaction.client.get_cog('MusicCog')
+        if cog is None:
+            await interaction.response.send_message("❌ Music is reloading, try again in a moment!", ephemeral=True)
+            return
+        await cog.now_playing_button(interaction, action)
+
+    @discord.ui.button(emoji="⏯️", label="Pause/Resume", style=discord.ButtonStyle.secondary, custom_id="now_playing:toggle")
+    async def toggle(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.press(interaction, 'toggle')
+
+    @discord.ui.button(emoji="⏭️", label="Skip", style=discord.ButtonStyle.primary, custom_id="now_playing:skip")
+    async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.press(interaction, 'skip')
+
+    @discord.ui.button(emoji="⏹️", label="Stop", style=discord.ButtonStyle.danger, custom_id="now_playing:stop")
+    async def stop_music(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.press(interaction, 'stop')
+
+
+class _Board:
+    __slots__ = ('channel', 'message', 'dirty', 'playing', 'last_edit')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.message = None
+        self.dirty = True
+        self.playing = False
+        self.last_edit = 0.0
+
+
+class NowPlayingBoard:
+    """One live now-playing message per guild, kept up to date by a single edit loop.
+
+    Changes only mark a guild dirty. Every tick the loop edits at most
+    max_edits messages, each no more than once per min_interval seconds,
+    so bursts of skips and queue changes collapse into one edit. Progress
+    is refreshed every progress_interval seconds while a song plays, after
+    guilds with real changes.
+    """
+
+    def __init__(self, render, view, min_interval=5.0, progress_interval=15.0, max_edits=5, tick=1.0):
+        self.render = render
+        self.view = view
+        self.min_interval = min_interval
+        self.progress_interval = progress_interval
+        self.max_edits = max_edits
+        self.tick = tick
+        self.sends = 0
+        self.edits = 0
+        self._boards = {}
+        self._task = None
+
+    def start(self):
+        """Start the edit loop on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="now-playing-board")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def attach(self, guild_id, channel):
+        """Show the guild's now-playing message in channel (where music commands are used)"""
+        board = self._boards.get(guild_id)
+        if board is None:
+            self._boards[guild_id] = _Board(channel)
+        elif board.channel.id != channel.id:
+            # A fresh message in the new channel, the old one stays as it was
+            board.channel = channel
+            board.message = None
+            board.dirty = True
+
+    def touch(self, guild_id):
+        """Mark a guild's message as out of date"""
+        board = self._boards.get(guild_id)
+        if board is not None:
+            board.dirty = True
+
+    def detach(self, guild_id):
+        """Stop updating a guild's message, showing its final state once"""
+        board = self._boards.pop(guild_id, None)
+        if board is not None and board.message is not None:
+            asyncio.get_running_loop().create_task(self._publish(guild_id, board))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Error updating now playing messages: %s", e)
+
+    async def flush(self):
+        """Send the edits that are due this tick"""
+        now = time.monotonic()
+        changed, progress = [], []
+        for guild_id, board in self._boards.items():
+            since = now - board.last_edit
+            if board.dirty and since >= self.min_interval:
+                changed.append((board.last_edit, guild_id, board))
+            elif board.playing and since >= self.progress_interval:
+                progress.append((board.last_edit, guild_id, board))
+        # Oldest first, so with more guilds than max_edits everyone gets a turn
+        due = (sorted(changed, key=lambda item: item[0]) + sorted(progress, key=lambda item: item[0]))[:self.max_edits]
+        if due:
+            await asyncio.gather(*(self._publish(guild_id, board) for _, guild_id, board in due))
+
+    async def _publish(self, guild_id, board):
+        board.dirty = False
+        board.last_edit = time.monotonic()
+        embed, board.playing = self.render(guild_id)
+        view = self.view if board.playing else None
+        try:
+            if board.message is None:
+                board.message = await board.channel.send(embed=embed, view=view)
+                self.sends += 1
+            else:
+                await board.message.edit(embed=embed, view=view)
+                self.edits += 1
+        except discord.NotFound:
+            # Deleted by someone, post a new one next time
+            board.message = None
+            board.dirty = True
+        except discord.HTTPException as e:
+            logger.warning("Could not update now playing message in guild %s: %s", guild_id, e)
+
+    def edited(self, guild_id):
+        """Note an edit made some other way (a button response), so the loop doesn't repeat it"""
+        board = self._boards.get(guild_id)
+        if board is not None:
+            board.dirty = False
+            board.last_edit = time.monotonic()
@@ -0,0 +1,940 @@
+import logging
+import re
+from datetime import datetime, timedelta
+from bot.storage import (
+    StorageBackend, ARCHIVE_EVENT_FIELDS, DEFAULT_REMINDER_OFFSETS, build_reminder_rows, count_archived_by_couple,
+    iter_chunks, merge_upcoming_events, next_reminder_occurrence, pack_archive, plan_due_reminders, unpack_archive
+)
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+def build_tsquery(text):
+    """Turn free text into a tsquery matching every word as a prefix"""
+    words = re.findall(r'\w+', text.lower())
+    return ' & '.join(f'{word}:*' for word in words)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS calendar_events (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        channel_id BIGINT NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        event_date TIMESTAMP NOT NULL,
+        created_at TIMESTAMP DEFAULT now(),
+        recurrence TEXT,
+        search_vector TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+        ) STORED
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_calendar_events_guild_date ON calendar_events(guild_id, event_date)',
+    'CREATE INDEX IF NOT EXISTS idx_calendar_events_search ON calendar_events USING GIN(search_vector)',
+    '''
+    CREATE TABLE IF NOT EXISTS reminders (
+        id BIGSERIAL PRIMARY KEY,
+        event_id BIGINT NOT NULL REFERENCES calendar_events(id) ON DELETE CASCADE,
+        offset_minutes INTEGER NOT NULL,
+        occurrence_at TIMESTAMP NOT NULL,
+        fire_at TIMESTAMP NOT NULL,
+        UNIQUE(event_id, offset_minutes)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders(fire_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        reminder_id BIGINT,
+        event_id BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        channel_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        event_date TIMESTAMP NOT NULL,
+        offset_minutes INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL,
+        claimed_at TIMESTAMP,
+        sent_at TIMESTAMP,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT now(),
+        UNIQUE(event_id, offset_minutes, event_date)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_reminder_outbox_state ON reminder_outbox(state, next_attempt_at)',
+    # Leases for leader election between replicas, expiring on the server's clock
+    '''
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        token BIGINT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        preference_key TEXT NOT NULL,
+        preference_value TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT now(),
+        UNIQUE(guild_id, user_id, preference_key)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS couple_milestones (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user1_id BIGINT NOT NULL,
+        user2_id BIGINT NOT NULL,
+        milestone_type TEXT NOT NULL,
+        milestone_date TIMESTAMP NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT now(),
+        search_vector TSVECTOR GENERATED ALWAYS AS (
+            to_tsvector('simple', coalesce(description, ''))
+        ) STORED
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_couple_milestones_guild ON couple_milestones(guild_id, milestone_date)',
+    'CREATE INDEX IF NOT EXISTS idx_couple_milestones_search ON couple_milestones USING GIN(search_vector)',
+    # user1_id is always the smaller ID, so a pair has exactly one row
+    '''
+    CREATE TABLE IF NOT EXISTS couples (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user1_id BIGINT NOT NULL,
+        user2_id BIGINT NOT NULL,
+        created_at TIMESTAMP DEFAULT now(),
+        UNIQUE(guild_id, user1_id, user2_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_couples_user2 ON couples(guild_id, user2_id)',
+    'ALTER TABLE calendar_events ADD COLUMN IF NOT EXISTS couple_id BIGINT REFERENCES couples(id) ON DELETE SET NULL',
+    'ALTER TABLE couple_milestones ADD COLUMN IF NOT EXISTS couple_id BIGINT REFERENCES couples(id) ON DELETE CASCADE',
+    'CREATE INDEX IF NOT EXISTS idx_calendar_events_couple ON calendar_events(couple_id, event_date)',
+    'CREATE INDEX IF NOT EXISTS idx_couple_milestones_couple_date ON couple_milestones(couple_id, milestone_date)',
+    # Dates either partner planned before they became a couple count as the couple's
+    '''
+    CREATE OR REPLACE FUNCTION couples_attach_events() RETURNS trigger AS $$
+    BEGIN
+        UPDATE calendar_events SET couple_id = NEW.id
+        WHERE guild_id = NEW.guild_id AND couple_id IS NULL AND user_id IN (NEW.user1_id, NEW.user2_id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS couples_attach_events ON couples',
+    '''
+    CREATE TRIGGER couples_attach_events AFTER INSERT ON couples
+    FOR EACH ROW EXECUTE FUNCTION couples_attach_events()
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS track_metadata (
+        track_key TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        url TEXT NOT NULL,
+        duration INTEGER,
+        play_count INTEGER DEFAULT 0,
+        last_played_at TIMESTAMP DEFAULT now()
+    )
+    ''',
+    'ALTER TABLE track_metadata ADD COLUMN IF NOT EXISTS loudness_i DOUBLE PRECISION',
+    'ALTER TABLE track_metadata ADD COLUMN IF NOT EXISTS loudness_tp DOUBLE PRECISION',
+    'ALTER TABLE track_metadata ADD COLUMN IF NOT EXISTS loudness_lra DOUBLE PRECISION',
+    # Past one-off events moved out of calendar_events, as gzipped NDJSON per guild
+    '''
+    CREATE TABLE IF NOT EXISTS calendar_events_archive (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        event_count INTEGER NOT NULL,
+        first_event_date TIMESTAMP NOT NULL,
+        last_event_date TIMESTAMP NOT NULL,
+        payload BYTEA NOT NULL,
+        archived_at TIMESTAMP DEFAULT now()
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_calendar_events_archive_guild ON calendar_events_archive(guild_id, first_event_date)',
+    'CREATE INDEX IF NOT EXISTS idx_calendar_events_archivable ON calendar_events(event_date) WHERE recurrence IS NULL',
+    '''
+    CREATE TABLE IF NOT EXISTS couple_stats (
+        guild_id BIGINT NOT NULL,
+        user1_id BIGINT NOT NULL,
+        user2_id BIGINT NOT NULL,
+        anniversary_date TIMESTAMP,
+        milestone_count INTEGER NOT NULL DEFAULT 0,
+        events_total INTEGER NOT NULL DEFAULT 0,
+        events_attended INTEGER NOT NULL DEFAULT 0,
+        attended_through TIMESTAMP,
+        PRIMARY KEY (guild_id, user1_id, user2_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_couple_stats_user2 ON couple_stats(guild_id, user2_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS couple_milestone_counts (
+        guild_id BIGINT NOT NULL,
+        user1_id BIGINT NOT NULL,
+        user2_id BIGINT NOT NULL,
+        milestone_type TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user1_id, user2_id, milestone_type)
+    )
+    ''',
+    # Milestones create the couple's row; events count towards the couple they belong to
+    '''
+    CREATE OR REPLACE FUNCTION couple_stats_milestone() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO couple_stats (guild_id, user1_id, user2_id, events_total)
+            VALUES (
+                NEW.guild_id, LEAST(NEW.user1_id, NEW.user2_id), GREATEST(NEW.user1_id, NEW.user2_id),
+                (SELECT COUNT(*) FROM calendar_events WHERE couple_id = NEW.couple_id)
+            )
+            ON CONFLICT DO NOTHING;
+            UPDATE couple_stats SET
+                milestone_count = milestone_count + 1,
+                anniversary_date = CASE WHEN NEW.milestone_type = 'anniversary'
+                    THEN LEAST(anniversary_date, NEW.milestone_date) ELSE anniversary_date END
+            WHERE guild_id = NEW.guild_id
+              AND user1_id = LEAST(NEW.user1_id, NEW.user2_id) AND user2_id = GREATEST(NEW.user1_id, NEW.user2_id);
+            INSERT INTO couple_milestone_counts (guild_id, user1_id, user2_id, milestone_type, count)
+            VALUES (NEW.guild_id, LEAST(NEW.user1_id, NEW.user2_id), GREATEST(NEW.user1_id, NEW.user2_id), NEW.milestone_type, 1)
+            ON CONFLICT (guild_id, user1_id, user2_id, milestone_type) DO UPDATE SET count = couple_milestone_counts.count + 1;
+            RETURN NEW;
+        END IF;
+        UPDATE couple_stats SET
+            milestone_count = milestone_count - 1,
+            anniversary_date = CASE WHEN OLD.milestone_type = 'anniversary' THEN (
+                SELECT MIN(milestone_date) FROM couple_milestones
+                WHERE couple_id = OLD.couple_id AND milestone_type = 'anniversary'
+            ) ELSE anniversary_date END
+        WHERE guild_id = OLD.guild_id
+          AND user1_id = LEAST(OLD.user1_id, OLD.user2_id) AND user2_id = GREATEST(OLD.user1_id, OLD.user2_id);
+        UPDATE couple_milestone_counts SET count = count - 1
+        WHERE guild_id = OLD.guild_id AND milestone_type = OLD.milestone_type
+          AND user1_id = LEAST(OLD.user1_id, OLD.user2_id) AND user2_id = GREATEST(OLD.user1_id, OLD.user2_id);
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION couple_stats_event() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE couple_stats SET
+                events_total = events_total + 1,
+                events_attended = events_attended + (COALESCE(NEW.event_date <= attended_through, false))::int
+            WHERE (guild_id, user1_id, user2_id) = (
+                SELECT guild_id, user1_id, user2_id FROM couples WHERE id = NEW.couple_id
+            );
+            RETURN NEW;
+        END IF;
+        UPDATE couple_stats SET
+            events_total = events_total - 1,
+            events_attended = events_attended - (COALESCE(OLD.event_date <= attended_through, false))::int
+        WHERE (guild_id, user1_id, user2_id) = (
+            SELECT guild_id, user1_id, user2_id FROM couples WHERE id = OLD.couple_id
+        );
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS couple_milestones_stats ON couple_milestones',
+    '''
+    CREATE TRIGGER couple_milestones_stats AFTER INSERT OR DELETE ON couple_milestones
+    FOR EACH ROW EXECUTE FUNCTION couple_stats_milestone()
+    ''',
+    'DROP TRIGGER IF EXISTS calendar_events_stats ON calendar_events',
+    '''
+    CREATE TRIGGER calendar_events_stats AFTER INSERT OR DELETE ON calendar_events
+    FOR EACH ROW EXECUTE FUNCTION couple_stats_event()
+    '''
+]
+
+# Fills couple_stats from existing rows the first time the table is created
+STATS_BACKFILL = [
+    '''
+    INSERT INTO couple_stats (guild_id, user1_id, user2_id, anniversary_date, milestone_count)
+    SELECT guild_id, LEAST(user1_id, user2_id), GREATEST(user1_id, user2_id),
+           MIN(milestone_date) FILTER (WHERE milestone_type = 'anniversary'), COUNT(*)
+    FROM couple_milestones
+    GROUP BY 1, 2, 3
+    ''',
+    '''
+    INSERT INTO couple_milestone_counts (guild_id, user1_id, user2_id, milestone_type, count)
+    SELECT guild_id, LEAST(user1_id, user2_id), GREATEST(user1_id, user2_id), milestone_type, COUNT(*)
+    FROM couple_milestones
+    GROUP BY 1, 2, 3, 4
+    ''',
+    '''
+    UPDATE couple_stats SET events_total = (
+        SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+        WHERE c.guild_id = couple_stats.guild_id
+          AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+    )
+    '''
+]
+
+# Links existing milestones and events to couples the first time the table is created
+COUPLES_BACKFILL = [
+    '''
+    INSERT INTO couples (guild_id, user1_id, user2_id)
+    SELECT guild_id, LEAST(user1_id, user2_id), GREATEST(user1_id, user2_id)
+    FROM couple_milestones
+    GROUP BY 1, 2, 3
+    ORDER BY MIN(id)
+    ''',
+    '''
+    UPDATE couple_milestones m SET couple_id = c.id
+    FROM couples c
+    WHERE m.couple_id IS NULL AND c.guild_id = m.guild_id
+      AND c.user1_id = LEAST(m.user1_id, m.user2_id) AND c.user2_id = GREATEST(m.user1_id, m.user2_id)
+    ''',
+    # Stats used to match events by creator, recount them by couple
+    '''
+    UPDATE couple_stats SET
+        events_total = (
+            SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+            WHERE c.guild_id = couple_stats.guild_id
+              AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+        ),
+        events_attended = 0,
+        attended_through = NULL
+    ''',
+    'DROP INDEX IF EXISTS idx_calendar_events_guild_user',
+    'DROP INDEX IF EXISTS idx_couple_milestones_couple'
+]
+
+# A user's couples, one index seek per column (params: $1 guild_id, $2 user_id)
+USER_COUPLES_SQL = '''SELECT id FROM couples WHERE guild_id = $1 AND user1_id = $2
+                      UNION ALL
+                      SELECT id FROM couples WHERE guild_id = $1 AND user2_id = $2'''
+
+class PostgresDatabase(StorageBackend):
+    """PostgreSQL storage backend using an asyncpg connection pool.
+
+    asyncpg prepares every query once per connection and reuses the
+    prepared statement from its per-connection statement cache.
+    """
+
+    def __init__(self, dsn, min_size=2, max_size=10):
+        if asyncpg is None:
+            raise RuntimeError("The postgres backend needs asyncpg: pip install asyncpg")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def init_db(self):
+        """Create the connection pool and the required tables"""
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size
+            )
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Serialize schema changes between replicas starting together
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('couple_bot_schema'))")
+                couples_is_new = await conn.fetchval("SELECT to_regclass('couples') IS NULL")
+                stats_is_new = await conn.fetchval("SELECT to_regclass('couple_stats') IS NULL")
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+                if couples_is_new:
+                    for statement in COUPLES_BACKFILL:
+                        await conn.execute(statement)
+                if stats_is_new:
+                    for statement in STATS_BACKFILL:
+                        await conn.execute(statement)
+        logger.info("Database initialized successfully")
+
+    async def close(self):
+        """Close the connection pool"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def add_calendar_event(self, guild_id, user_id, channel_id, title, description, event_date, recurrence=None, reminder_offsets=None):
+        """Add a new calendar event, optionally repeating daily/weekly/monthly/yearly"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # New events belong to their creator's newest couple
+                event_id = await conn.fetchval(
+                    f'''INSERT INTO calendar_events
+                       (guild_id, user_id, channel_id, title, description, event_date, recurrence, couple_id)
+                       VALUES ($1, $2, $3, $4, $5, $6, $7, (SELECT MAX(id) FROM ({USER_COUPLES_SQL}) AS couple))
+                       RETURNING id''',
+                    guild_id, user_id, channel_id, title, description, event_date, recurrence
+                )
+                await conn.executemany(
+                    '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+                       VALUES ($1, $2, $3, $4)''',
+                    build_reminder_rows(event_id, event_date, recurrence, reminder_offsets or DEFAULT_REMINDER_OFFSETS, datetime.now())
+                )
+                return event_id
+
+    async def import_calendar(self, guild_id, user_id, channel_id, records, reminder_offsets=None, chunk_size=500):
+        """Bulk import event and milestone records in a single transaction"""
+        offsets = reminder_offsets or DEFAULT_REMINDER_OFFSETS
+        event_count = 0
+        milestone_count = 0
+        now = datetime.now()
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for chunk in iter_chunks(records, chunk_size):
+                    events = [record for record in chunk if record['type'] == 'event']
+                    milestones = [record for record in chunk if record['type'] == 'milestone']
+
+                    if events:
+                        # One round trip per chunk, returning the new IDs for the reminder rows
+                        inserted = await conn.fetch(
+                            f'''INSERT INTO calendar_events
+                               (guild_id, user_id, channel_id, title, description, event_date, recurrence, couple_id)
+                               SELECT $1, $2, $3, title, description, event_date, recurrence,
+                                      (SELECT MAX(id) FROM ({USER_COUPLES_SQL}) AS couple)
+                               FROM unnest($4::text[], $5::text[], $6::timestamp[], $7::text[])
+                                    AS rows(title, description, event_date, recurrence)
+                               RETURNING id, event_date, recurrence''',
+                            guild_id, user_id, channel_id,
+                            [event['title'] for event in events],
+                            [event['description'] for event in events],
+                            [event['event_date'] for event in events],
+                            [event['recurrence'] for event in events]
+                        )
+                        reminder_rows = []
+                        for row in inserted:
+                            reminder_rows.extend(build_reminder_rows(row['id'], row['event_date'], row['recurrence'], offsets, now))
+                        await conn.executemany(
+                            '''INSERT INTO reminders (event_id, offset_minutes, occurrence_at, fire_at)
+                               VALUES ($1, $2, $3, $4)''',
+                            reminder_rows
+                        )
+                        event_count += len(events)
+
+                    if milestones:
+                        couple_ids = {}
+                        for milestone in milestones:
+                            pair = (milestone['user1_id'], milestone['user2_id'])
+                            if pair not in couple_ids:
+                                couple_ids[pair] = await self._ensure_couple(conn, guild_id, *pair)
+                        await conn.executemany(
+                            '''INSERT INTO couple_milestones
+                               (guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id)
+                               VALUES ($1, $2, $3, $4, $5, $6, $7)''',
+                            [
+                                (guild_id, milestone['user1_id'], milestone['user2_id'], milestone['milestone_type'],
+                                 milestone['milestone_date'], milestone['description'],
+                                 couple_ids[(milestone['user1_id'], milestone['user2_id'])])
+                                for milestone in milestones
+                            ]
+                        )
+                        milestone_count += len(milestones)
+
+        return event_count, milestone_count
+
+    async def iter_calendar_export(self, guild_id):
+        """Yield a guild's events and milestones one row at a time"""
+        async with self.pool.acquire() as conn:
+            # Server-side cursors need a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    'SELECT payload FROM calendar_events_archive WHERE guild_id = $1 ORDER BY first_event_date ASC',
+                    guild_id, prefetch=10
+                ):
+                    for record in unpack_archive(row['payload']):
+                        yield {
+                            'type': 'event',
+                            'id': record['id'],
+                            'title': record['title'],
+                            'description': record['description'],
+                            'event_date': record['event_date'],
+                            'recurrence': None
+                        }
+
+                async for row in conn.cursor(
+                    '''SELECT id, title, description, event_date, recurrence FROM calendar_events
+                       WHERE guild_id = $1 ORDER BY event_date ASC''',
+                    guild_id, prefetch=500
+                ):
+                    yield {'type': 'event', **dict(row)}
+
+                async for row in conn.cursor(
+                    '''SELECT id, user1_id, user2_id, milestone_type, milestone_date, description FROM couple_milestones
+                       WHERE guild_id = $1 ORDER BY milestone_date ASC''',
+                    guild_id, prefetch=500
+                ):
+                    yield {'type': 'milestone', **dict(row)}
+
+    async def get_upcoming_events(self, guild_id, days_ahead=30):
+        """Get upcoming events for a guild, with repeating events expanded in the window"""
+        now = datetime.now()
+        window_end = now + timedelta(days=days_ahead)
+
+        async with self.pool.acquire() as conn:
+            one_off = await conn.fetch(
+                '''SELECT id, guild_id, user_id, channel_id, title, description, event_date, created_at, recurrence
+                   FROM calendar_events
+                   WHERE guild_id = $1 AND recurrence IS NULL
+                   AND event_date > $2 AND event_date <= $3
+                   ORDER BY event_date ASC''',
+                guild_id, now, window_end
+            )
+            recurring = await conn.fetch(
+                '''SELECT id, guild_id, user_id, channel_id, title, description, event_date, created_at, recurrence
+                   FROM calendar_events
+                   WHERE guild_id = $1 AND recurrence IS NOT NULL AND event_date <= $2''',
+                guild_id, window_end
+            )
+
+        return merge_upcoming_events(
+            [dict(row) for row in one_off],
+            [dict(row) for row in recurring],
+            now,
+            window_end
+        )
+
+    async def get_upcoming_reminders(self, limit=500):
+        """Get reminders that are due, oldest first"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                '''SELECT e.id, e.guild_id, e.user_id, e.channel_id, e.title, e.description,
+                          e.recurrence, r.id AS reminder_id, r.offset_minutes,
+                          r.occurrence_at AS event_date, r.fire_at AS reminder_date
+                   FROM reminders r
+                   JOIN calendar_events e ON e.id = r.event_id
+                   WHERE r.fire_at <= $1
+                   ORDER BY r.fire_at ASC
+                   LIMIT $2''',
+                datetime.now(), limit
+            )
+            return [dict(row) for row in rows]
+
+    async def mark_reminder_sent(self, reminder_id):
+        """Mark reminder as sent, moving repeating events on to their next occurrence"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    '''SELECT e.event_date, e.recurrence, r.offset_minutes, r.occurrence_at
+                       FROM reminders r JOIN calendar_events e ON e.id = r.event_id
+                       WHERE r.id = $1 FOR UPDATE OF r''',
+                    reminder_id
+                )
+                if row is None:
+                    return
+
+                upcoming = next_reminder_occurrence(
+                    row['event_date'], row['recurrence'], row['offset_minutes'], row['occurrence_at'], datetime.now()
+                )
+                if upcoming:
+                    await conn.execute(
+                        'UPDATE reminders SET occurrence_at = $1, fire_at = $2 WHERE id = $3',
+                        upcoming, upcoming - timedelta(minutes=row['offset_minutes']), reminder_id
+                    )
+                else:
+                    await conn.execute('DELETE FROM reminders WHERE id = $1', reminder_id)
+
+    async def enqueue_due_reminders(self, limit=500, lookahead=0):
+        """Move due reminders (and those due within lookahead seconds) into the outbox in one transaction"""
+        now = datetime.now()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # SKIP LOCKED lets several bot processes enqueue without blocking each other
+                rows = await conn.fetch(
+                    '''SELECT r.id AS reminder_id, r.offset_minutes, r.occurrence_at,
+                              e.id AS event_id, e.guild_id, e.channel_id, e.user_id,
+                              e.title, e.description, e.event_date, e.recurrence
+                       FROM reminders r
+                       JOIN calendar_events e ON e.id = r.event_id
+                       WHERE r.fire_at <= $1
+                       ORDER BY r.fire_at ASC
+                       LIMIT $2
+                       FOR UPDATE OF r SKIP LOCKED''',
+                    now + timedelta(seconds=lookahead), limit
+                )
+                outbox_rows, updates, deletes = plan_due_reminders(rows, now)
+
+                await conn.executemany(
+                    '''INSERT INTO reminder_outbox
+                       (reminder_id, event_id, guild_id, channel_id, user_id, title, description,
+                        event_date, offset_minutes, next_attempt_at)
+                       VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                       ON CONFLICT (event_id, offset_minutes, event_date) DO NOTHING''',
+                    outbox_rows
+                )
+                await conn.executemany(
+                    'UPDATE reminders SET occurrence_at = $1, fire_at = $2 WHERE id = $3',
+                    updates
+                )
+                await conn.executemany('DELETE FROM reminders WHERE id = $1', deletes)
+        return len(outbox_rows)
+
+    async def claim_outbox(self, limit=100, fence=None):
+        """Claim pending outbox entries that are ready to send"""
+        now = datetime.now()
+        fence_sql, fence_params = '', ()
+        if fence is not None:
+            fence_sql = 'AND EXISTS (SELECT 1 FROM leases WHERE name = $3 AND token = $4)'
+            fence_params = fence
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                f'''UPDATE reminder_outbox
+                   SET state = 'claimed', claimed_at = $1, attempts = attempts + 1
+                   WHERE id IN (
+                       SELECT id FROM reminder_outbox
+                       WHERE state = 'pending' AND next_attempt_at <= $1
+                       ORDER BY next_attempt_at ASC
+                       LIMIT $2
+                       FOR UPDATE SKIP LOCKED
+                   ) {fence_sql}
+                   RETURNING *''',
+                now, limit, *fence_params
+            )
+            return [dict(row) for row in rows]
+
+    async def acquire_lease(self, name, holder, ttl):
+        """Take or renew a lease for ttl seconds, returning its fencing token or None if someone else holds it"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                '''INSERT INTO leases (name, holder, token, expires_at)
+                   VALUES ($1, $2, 1, now() + make_interval(secs => $3))
+                   ON CONFLICT (name) DO UPDATE SET
+                       token = CASE WHEN leases.holder = EXCLUDED.holder THEN leases.token ELSE leases.token + 1 END,
+                       holder = EXCLUDED.holder,
+                       expires_at = EXCLUDED.expires_at
+                   WHERE leases.holder = EXCLUDED.holder OR leases.expires_at < now()
+                   RETURNING token''',
+                name, holder, float(ttl)
+            )
+
+    async def release_lease(self, name, holder):
+        """Let a lease expire now if holder still has it"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE leases SET expires_at = '-infinity' WHERE name = $1 AND holder = $2",
+                name, holder
+            )
+
+    async def complete_outbox(self, outbox_ids):
+        """Mark claimed outbox entries as sent"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''UPDATE reminder_outbox SET state = 'sent', sent_at = $1, last_error = NULL
+                   WHERE state = 'claimed' AND id = ANY($2::bigint[])''',
+                datetime.now(), list(outbox_ids)
+            )
+
+    async def retry_outbox(self, outbox_id, error, next_attempt_at):
+        """Put a claimed outbox entry back to pending for a later attempt"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''UPDATE reminder_outbox
+                   SET state = 'pending', next_attempt_at = $1, claimed_at = NULL, last_error = $2
+                   WHERE state = 'claimed' AND id = $3''',
+                next_attempt_at, error, outbox_id
+            )
+
+    async def fail_outbox(self, outbox_id, error):
+        """Give up on a claimed outbox entry"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''UPDATE reminder_outbox SET state = 'failed', last_error = $1
+                   WHERE state = 'claimed' AND id = $2''',
+                error, outbox_id
+            )
+
+    async def recover_outbox(self, stale_before, prune_before):
+        """Release claims left by a crashed dispatcher and prune old finished entries"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                result = await conn.execute(
+                    '''UPDATE reminder_outbox SET state = 'pending', claimed_at = NULL
+                       WHERE state = 'claimed' AND claimed_at < $1''',
+                    stale_before
+                )
+                await conn.execute(
+                    '''DELETE FROM reminder_outbox
+                       WHERE state IN ('sent', 'failed') AND COALESCE(sent_at, next_attempt_at) < $1''',
+                    prune_before
+                )
+            return int(result.split()[-1])
+
+    async def archive_past_events(self, before, limit=500):
+        """Move up to limit one-off events dated before a moment into the compressed archive"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    f'''DELETE FROM calendar_events
+                        WHERE id IN (
+                            SELECT id FROM calendar_events
+                            WHERE recurrence IS NULL AND event_date < $1
+                            ORDER BY event_date LIMIT $2
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING {', '.join(ARCHIVE_EVENT_FIELDS)}''',
+                    before, limit
+                )
+                if not rows:
+                    return 0
+                events = [dict(row) for row in rows]
+
+                await conn.executemany(
+                    '''INSERT INTO calendar_events_archive
+                       (guild_id, event_count, first_event_date, last_event_date, payload)
+                       VALUES ($1, $2, $3, $4, $5)''',
+                    pack_archive(events)
+                )
+                # Archived dates stay planned and count as attended, undoing the delete trigger
+                await conn.executemany(
+                    '''UPDATE couple_stats SET events_total = events_total + $1, events_attended = events_attended + $1
+                       WHERE (guild_id, user1_id, user2_id) = (SELECT guild_id, user1_id, user2_id FROM couples WHERE id = $2)''',
+                    count_archived_by_couple(events)
+                )
+        return len(events)
+
+    async def purge_guild(self, guild_id):
+        """Delete everything stored for a guild"""
+        # Reminders and milestones of the guild's couples go with them by cascade
+        tables = (
+            'calendar_events', 'couple_milestones', 'reminder_outbox', 'calendar_events_archive',
+            'couple_stats', 'couple_milestone_counts', 'couples', 'user_preferences'
+        )
+        deleted = 0
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for table in tables:
+                    result = await conn.execute(f'DELETE FROM {table} WHERE guild_id = $1', guild_id)
+                    deleted += int(result.split()[-1])
+        return deleted
+
+    async def delete_event(self, event_id, user_id):
+        """Delete an event (only by the creator)"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(
+                'DELETE FROM calendar_events WHERE id = $1 AND user_id = $2',
+                event_id, user_id
+            )
+            return result != 'DELETE 0'
+
+    async def set_user_preference(self, guild_id, user_id, key, value):
+        """Set a user preference"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''INSERT INTO user_preferences (guild_id, user_id, preference_key, preference_value)
+                   VALUES ($1, $2, $3, $4)
+                   ON CONFLICT (guild_id, user_id, preference_key) DO UPDATE SET
+                       preference_value = excluded.preference_value,
+                       updated_at = now()''',
+                guild_id, user_id, key, value
+            )
+
+    async def get_user_preference(self, guild_id, user_id, key, default=None):
+        """Get a user preference"""
+        async with self.pool.acquire() as conn:
+            value = await conn.fetchval(
+                '''SELECT preference_value FROM user_preferences
+                   WHERE guild_id = $1 AND user_id = $2 AND preference_key = $3''',
+                guild_id, user_id, key
+            )
+            return value if value is not None else default
+
+    async def _ensure_couple(self, conn, guild_id, user_a, user_b):
+        """Get the ID of a pair's couple row, creating it the first time"""
+        key = (guild_id, min(user_a, user_b), max(user_a, user_b))
+        couple_id = await conn.fetchval(
+            '''INSERT INTO couples (guild_id, user1_id, user2_id) VALUES ($1, $2, $3)
+               ON CONFLICT DO NOTHING RETURNING id''',
+            *key
+        )
+        if couple_id is None:
+            couple_id = await conn.fetchval(
+                'SELECT id FROM couples WHERE guild_id = $1 AND user1_id = $2 AND user2_id = $3',
+                *key
+            )
+        return couple_id
+
+    async def add_milestone(self, guild_id, user1_id, user2_id, milestone_type, milestone_date, description):
+        """Add a couple milestone"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                couple_id = await self._ensure_couple(conn, guild_id, user1_id, user2_id)
+                return await conn.fetchval(
+                    '''INSERT INTO couple_milestones
+                       (guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id)
+                       VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id''',
+                    guild_id, user1_id, user2_id, milestone_type, milestone_date, description, couple_id
+                )
+
+    async def get_milestones(self, guild_id, user_id):
+        """Get the milestones of every couple a user is in, newest first"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                f'''SELECT id, guild_id, user1_id, user2_id, milestone_type, milestone_date, description, created_at
+                    FROM couple_milestones
+                    WHERE couple_id IN ({USER_COUPLES_SQL})
+                    ORDER BY milestone_date DESC''',
+                guild_id, user_id
+            )
+            return [dict(row) for row in rows]
+
+    async def get_couple_stats(self, guild_id, user_id, partner_id=None):
+        """Get a couple's summary row, counting dates that happened since the last roll-up"""
+        now = datetime.now()
+        async with self.pool.acquire() as conn:
+            if partner_id is not None:
+                row = await conn.fetchrow(
+                    '''SELECT * FROM couple_stats
+                       WHERE guild_id = $1 AND user1_id = $2 AND user2_id = $3''',
+                    guild_id, min(user_id, partner_id), max(user_id, partner_id)
+                )
+            else:
+                row = await conn.fetchrow(
+                    '''SELECT * FROM couple_stats
+                       WHERE guild_id = $1 AND (user1_id = $2 OR user2_id = $2)
+                       ORDER BY milestone_count DESC LIMIT 1''',
+                    guild_id, user_id
+                )
+            if row is None:
+                return None
+            key = (row['guild_id'], row['user1_id'], row['user2_id'])
+
+            # Read-only: dates that passed since attended_through are added here,
+            # roll_up_attended_dates moves the watermark in the retention job
+            recent = await conn.fetchval(
+                '''SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                   WHERE c.guild_id = $1 AND c.user1_id = $2 AND c.user2_id = $3
+                     AND e.event_date > COALESCE($4, '-infinity'::timestamp) AND e.event_date <= $5''',
+                *key, row['attended_through'], now
+            )
+            counts = await conn.fetch(
+                '''SELECT milestone_type, count FROM couple_milestone_counts
+                   WHERE guild_id = $1 AND user1_id = $2 AND user2_id = $3 AND count > 0
+                   ORDER BY count DESC''',
+                *key
+            )
+        stats = dict(row)
+        stats['events_attended'] += recent
+        stats['milestone_counts'] = {record['milestone_type']: record['count'] for record in counts}
+        return stats
+
+    async def roll_up_attended_dates(self, now=None):
+        """Add dates that passed since each couple's attended_through to events_attended"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(
+                '''UPDATE couple_stats SET
+                       events_attended = events_attended + (
+                           SELECT COUNT(*) FROM calendar_events e JOIN couples c ON c.id = e.couple_id
+                           WHERE c.guild_id = couple_stats.guild_id
+                             AND c.user1_id = couple_stats.user1_id AND c.user2_id = couple_stats.user2_id
+                             AND e.event_date > COALESCE(couple_stats.attended_through, '-infinity')
+                             AND e.event_date <= $1
+                       ),
+                       attended_through = $1''',
+                now or datetime.now()
+            )
+        return int(result.split()[-1])
+
+    async def record_track_play(self, track_key, title, url, duration):
+        """Record that a track was played"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''INSERT INTO track_metadata (track_key, title, url, duration, play_count)
+                   VALUES ($1, $2, $3, $4, 1)
+                   ON CONFLICT (track_key) DO UPDATE SET
+                       title = excluded.title,
+                       url = excluded.url,
+                       duration = excluded.duration,
+                       play_count = track_metadata.play_count + 1,
+                       last_played_at = now()''',
+                track_key, title, url, duration
+            )
+
+    async def get_played_tracks(self, limit=5000):
+        """Get the most played tracks, with their measured loudness if known"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                '''SELECT track_key, title, url, duration, play_count, loudness_i, loudness_tp, loudness_lra
+                   FROM track_metadata WHERE play_count > 0
+                   ORDER BY play_count DESC, last_played_at DESC LIMIT $1''',
+                limit
+            )
+            return [dict(row) for row in rows]
+
+    async def get_track_loudness(self, track_key):
+        """Get a track's stored EBU R128 measurement, or None"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                '''SELECT loudness_i, loudness_tp, loudness_lra FROM track_metadata
+                   WHERE track_key = $1 AND loudness_i IS NOT NULL''',
+                track_key
+            )
+            return dict(row) if row else None
+
+    async def save_track_loudness(self, track_key, title, url, duration, loudness):
+        """Store a track's EBU R128 measurement, adding an unplayed row if needed"""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                '''INSERT INTO track_metadata (track_key, title, url, duration, loudness_i, loudness_tp, loudness_lra)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7)
+                   ON CONFLICT (track_key) DO UPDATE SET
+                       loudness_i = excluded.loudness_i,
+                       loudness_tp = excluded.loudness_tp,
+                       loudness_lra = excluded.loudness_lra''',
+                track_key, title, url, duration,
+                loudness['loudness_i'], loudness['loudness_tp'], loudness['loudness_lra']
+            )
+
+    async def search_dates(self, guild_id, text, limit=10, offset=0):
+        """Full-text search over a guild's events and milestones, best matches first"""
+        query = build_tsquery(text)
+        if not query:
+            return 0, []
+
+        async with self.pool.acquire() as conn:
+            total = await conn.fetchval(
+                '''SELECT
+                       (SELECT COUNT(*) FROM calendar_events
+                        WHERE guild_id = $1 AND search_vector @@ to_tsquery('simple', $2)) +
+                       (SELECT COUNT(*) FROM couple_milestones
+                        WHERE guild_id = $1 AND search_vector @@ to_tsquery('simple', $2))''',
+                guild_id, query
+            )
+
+            # Titles carry weight A, so they rank above description matches;
+            # headlines are only built for the rows on the requested page
+            rows = await conn.fetch(
+                '''SELECT kind, id, title,
+                          ts_headline('simple', body, to_tsquery('simple', $2),
+                                      'StartSel=**, StopSel=**, MaxWords=16') AS snippet,
+                          date, rank
+                   FROM (
+                       SELECT 'event' AS kind, id, title,
+                              title || ' ' || coalesce(description, '') AS body,
+                              event_date AS date, ts_rank(search_vector, to_tsquery('simple', $2)) AS rank
+                       FROM calendar_events
+                       WHERE guild_id = $1 AND search_vector @@ to_tsquery('simple', $2)
+                       UNION ALL
+                       SELECT 'milestone' AS kind, id, milestone_type AS title,
+                              coalesce(description, '') AS body,
+                              milestone_date AS date, ts_rank(search_vector, to_tsquery('simple', $2)) AS rank
+                       FROM couple_milestones
+                       WHERE guild_id = $1 AND search_vector @@ to_tsquery('simple', $2)
+                       ORDER BY rank DESC LIMIT $3 OFFSET $4
+                   ) matches
+                   ORDER BY rank DESC''',
+                guild_id, query, limit, offset
+            )
+            return total, [dict(row) for row in rows]
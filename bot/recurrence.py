@@ -0,0 +1,76 @@
+import calendar
+from datetime import datetime, timedelta
+
+# Supported subset of RRULE frequencies
+RECURRENCE_RULES = ('daily', 'weekly', 'monthly', 'yearly')
+
+
+def parse_datetime(value):
+    """Parse a datetime as stored by SQLite"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _add_months(start, months):
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    # Clamp to the month's last day (Jan 31 -> Feb 28)
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day)
+
+
+def nth_occurrence(start, rule, n):
+    """Get the n-th occurrence counted from the first one (n=0)"""
+    if rule == 'daily':
+        return start + timedelta(days=n)
+    if rule == 'weekly':
+        return start + timedelta(weeks=n)
+    if rule == 'monthly':
+        return _add_months(start, n)
+    if rule == 'yearly':
+        return _add_months(start, 12 * n)
+    raise ValueError(f"Unsupported recurrence rule: {rule}")
+
+
+def _estimate_index(start, rule, target):
+    """Index of an occurrence at or slightly before target"""
+    if target <= start:
+        return 0
+    if rule == 'daily':
+        return (target - start).days
+    if rule == 'weekly':
+        return (target - start).days // 7
+    months = (target.year - start.year) * 12 + target.month - start.month
+    if rule == 'monthly':
+        return max(months - 1, 0)
+    return max(months // 12 - 1, 0)
+
+
+def iter_occurrences(start, rule, window_start, window_end):
+    """Yield occurrences after window_start and up to window_end, in order.
+
+    Jumps straight to the window instead of walking from the first
+    occurrence, so old events cost the same as new ones.
+    """
+    if rule is None:
+        if window_start < start <= window_end:
+            yield start
+        return
+
+    n = _estimate_index(start, rule, window_start)
+    while True:
+        occurrence = nth_occurrence(start, rule, n)
+        if occurrence > window_end:
+            return
+        if occurrence > window_start:
+            yield occurrence
+        n += 1
+
+
+def next_occurrence(start, rule, after):
+    """Get the first occurrence strictly after a moment, or None"""
+    for occurrence in iter_occurrences(start, rule, after, datetime.max):
+        return occurrence
+    return None
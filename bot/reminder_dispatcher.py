@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Discord's limits for one embed
+MAX_EMBED_FIELDS = 25
+MAX_FIELD_NAME = 256
+MAX_FIELD_VALUE = 1024
+MAX_EMBED_CHARS = 6000
+
+
+def digest_field(entry):
+    """Embed field (name, value) for one reminder in a digest"""
+    timestamp = int(entry['event_date'].timestamp())
+    value = f"<t:{timestamp}:F> (<t:{timestamp}:R>) for <@{entry['user_id']}>"
+    if entry['description']:
+        value += f"\n{entry['description']}"
+    name = f"💕 {entry['title']}"
+    return name[:MAX_FIELD_NAME], value[:MAX_FIELD_VALUE]
+
+
+def build_digests(entries, max_fields=MAX_EMBED_FIELDS, max_chars=MAX_EMBED_CHARS - 500):
+    """Group outbox entries by channel, split where one embed would exceed Discord's limits"""
+    channels = defaultdict(list)
+    for entry in sorted(entries, key=lambda entry: entry['event_date']):
+        channels[(entry['guild_id'], entry['channel_id'])].append(entry)
+
+    digests = []
+    for channel_entries in channels.values():
+        digest, chars = [], 0
+        for entry in channel_entries:
+            size = sum(len(part) for part in digest_field(entry))
+            if digest and (len(digest) >= max_fields or chars + size > max_chars):
+                digests.append(digest)
+                digest, chars = [], 0
+            digest.append(entry)
+            chars += size
+        digests.append(digest)
+    return digests
+
+
+class PermanentDeliveryError(Exception):
+    """A reminder that can never be delivered (channel gone, no access)"""
+
+
+class ReminderDispatcher:
+    """Deliver reminders from the database outbox.
+
+    Due reminders are moved into the outbox in the same transaction that
+    advances them, so a crash can never lose or double-queue one. Each
+    entry is claimed before sending and only marked sent afterwards;
+    claims left behind by a crash are released on the next start. Sends
+    carry a nonce derived from the outbox ID, so Discord drops a repeat
+    of a send that succeeded right before a crash.
+
+    In digest mode (REMINDER_DIGEST, on by default) reminders due in the
+    same run, or within digest_window seconds after it, go out as one
+    message per channel instead of one message each. Those pulled in from
+    the window are sent up to digest_window seconds early, on purpose:
+    holding them back to their own time would split the digest again.
+    """
+
+    def __init__(self, bot, batch_size=50, concurrency=5, max_attempts=5,
+                 base_delay=30, max_delay=3600, claim_timeout=300, keep_days=7,
+                 digest=None, digest_window=60):
+        self.bot = bot
+        if digest is None:
+            digest = os.getenv("REMINDER_DIGEST", "1") != "0"
+        self.digest = digest
+        self.digest_window = digest_window if digest else 0
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.claim_timeout = claim_timeout
+        self.keep_days = keep_days
+        self.last_prune = None
+
+    async def recover(self):
+        """Release claims left by a previous run and prune old entries"""
+        now = datetime.now()
+        released = await self.bot.db.recover_outbox(
+            now - timedelta(seconds=self.claim_timeout),
+            now - timedelta(days=self.keep_days)
+        )
+        self.last_prune = now
+        if released:
+            logger.info("Released %s unfinished reminder(s) for redelivery", released)
+
+    async def run_once(self, fence=None):
+        """Queue due reminders and send everything that is ready.
+
+        fence is the leader lease's (name, token); claims stop as soon as
+        another process has taken the lease over.
+        """
+        # Held for the whole run so shutdown can wait for sends to finish
+        async with self.lock:
+            if self.last_prune is None or datetime.now() - self.last_prune > timedelta(hours=1):
+                await self.recover()
+            
+            await self.bot.db.enqueue_due_reminders(lookahead=self.digest_window)
+            
+            while True:
+                entries = await self.bot.db.claim_outbox(self.batch_size, fence)
+                if not entries:
+                    return
+                if self.digest:
+                    groups = build_digests(entries)
+                else:
+                    groups = [[entry] for entry in entries]
+                results = await asyncio.gather(*(self.deliver(group) for group in groups))
+                sent = [entry['id'] for group, ok in zip(groups, results) if ok for entry in group]
+                if sent:
+                    await self.bot.db.complete_outbox(sent)
+                if len(entries) < self.batch_size:
+                    return
+
+    async def deliver(self, entries):
+        """Send outbox entries for one channel as one message, returning whether it was sent"""
+        async with self.semaphore:
+            try:
+                if len(entries) == 1:
+                    await self.send_reminder(entries[0])
+                else:
+                    await self.send_digest(entries)
+                return True
+            except (PermanentDeliveryError, discord.Forbidden, discord.NotFound) as e:
+                for entry in entries:
+                    logger.warning("Dropping reminder %s: %s", entry['id'], e)
+                    await self.bot.db.fail_outbox(entry['id'], str(e))
+            except Exception as e:
+                for entry in entries:
+                    await self.give_up_or_retry(entry, e)
+            return False
+
+    async def give_up_or_retry(self, entry, error):
+        """Schedule another attempt for a failed entry, or fail it after max_attempts"""
+        if entry['attempts'] >= self.max_attempts:
+            logger.error("Giving up on reminder %s after %s attempts: %s", entry['id'], entry['attempts'], error)
+            await self.bot.db.fail_outbox(entry['id'], str(error))
+        else:
+            delay = self.retry_delay(entry['attempts'])
+            logger.warning("Reminder %s failed, retrying in %.0fs: %s", entry['id'], delay, error)
+            await self.bot.db.retry_outbox(entry['id'], str(error), datetime.now() + timedelta(seconds=delay))
+
+    def retry_delay(self, attempts):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+    def get_channel(self, entry):
+        """Find the channel an entry is posted in"""
+        guild = self.bot.get_guild(entry['guild_id'])
+        if guild is None:
+            raise PermanentDeliveryError("Guild not available")
+        channel = guild.get_channel(entry['channel_id'])
+        if channel is None or not hasattr(channel, 'send'):
+            raise PermanentDeliveryError("Channel not available")
+        return channel
+
+    async def send_reminder(self, entry):
+        """Post the reminder embed in the event's channel"""
+        channel = self.get_channel(entry)
+        
+        event_date = entry['event_date']
+        embed = discord.Embed(
+            title="💕 Reminder Alert!",
+            description=f"**{entry['title']}**\n\n{entry['description']}",
+            color=0xff69b4,
+            timestamp=event_date - timedelta(minutes=entry['offset_minutes'])
+        )
+        embed.add_field(
+            name="When",
+            value=f"<t:{int(event_date.timestamp())}:F> (<t:{int(event_date.timestamp())}:R>)",
+            inline=False
+        )
+        embed.set_footer(text="Don't forget! 💖")
+        
+        # Discord deduplicates messages with the same nonce for a few minutes
+        await channel.send(
+            f"<@{entry['user_id']}>",
+            embed=embed,
+            nonce=f"reminder-{entry['id']}"
+        )
+
+    async def send_digest(self, entries):
+        """Post several reminders for one channel as a single embed"""
+        channel = self.get_channel(entries[0])
+        
+        embed = discord.Embed(
+            title="💕 Reminder Digest!",
+            description=f"**{len(entries)}** dates coming up:",
+            color=0xff69b4,
+            timestamp=datetime.now()
+        )
+        for entry in entries:
+            name, value = digest_field(entry)
+            embed.add_field(name=name, value=value, inline=False)
+        embed.set_footer(text="Don't forget! 💖")
+        
+        # One ping per person, however many of their dates are in the digest
+        mentions = " ".join(dict.fromkeys(f"<@{entry['user_id']}>" for entry in entries))
+        await channel.send(
+            mentions,
+            embed=embed,
+            nonce=f"digest-{min(entry['id'] for entry in entries)}"
+        )
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """Archive one-off dates that are long past and give the freed pages back.
+
+    Events older than horizon_days move to the compressed archive table in
+    batches of batch_size, at most max_batches per run so one run never
+    holds the write lock for long. RETENTION_DAYS=0 turns archiving off.
+    """
+
+    def __init__(self, bot, horizon_days=None, batch_size=500, max_batches=20, vacuum_pages=2000):
+        self.bot = bot
+        if horizon_days is None:
+            horizon_days = int(os.getenv("RETENTION_DAYS", "365"))
+        self.horizon_days = horizon_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.vacuum_pages = vacuum_pages
+
+    async def run_once(self):
+        """Roll up attended dates, archive up to max_batches batches, then reclaim free pages"""
+        # Keeps the range of dates /couple_stats counts on every read short
+        await self.bot.db.roll_up_attended_dates()
+
+        if self.horizon_days <= 0:
+            return 0
+
+        before = datetime.now() - timedelta(days=self.horizon_days)
+        archived = 0
+        for _ in range(self.max_batches):
+            moved = await self.bot.db.archive_past_events(before, self.batch_size)
+            archived += moved
+            if moved < self.batch_size:
+                break
+            # Let commands waiting on the database in between batches
+            await asyncio.sleep(0.1)
+
+        freed = await self.bot.db.reclaim_space(self.vacuum_pages)
+        if archived or freed:
+            logger.info("Archived %s past event(s), reclaimed %s page(s)", archived, freed)
+        return archived
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase search words"""
+    return _WORD_PATTERN.findall(text.lower())
+
+
+class _TrieNode:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+
+
+class TitleIndex:
+    """In-memory prefix index over titles of previously played tracks"""
+
+    def __init__(self, max_prefix_length=20):
+        self.max_prefix_length = max_prefix_length
+        self._root = _TrieNode()
+        self._tracks = {}  # key -> {'title', 'url', 'play_count'}
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def play_count(self, key):
+        """Get how often a track was played"""
+        track = self._tracks.get(key)
+        return track['play_count'] if track else 0
+
+    def add(self, key, title, url, play_count=1):
+        """Add a track or update its play count"""
+        track = self._tracks.get(key)
+        if track is not None:
+            track['play_count'] = play_count
+            track['url'] = url
+            if track['title'] == title:
+                return
+            self._remove_words(key, track['title'])
+            track['title'] = title
+        else:
+            self._tracks[key] = {'title': title, 'url': url, 'play_count': play_count}
+
+        for word in set(tokenize(title)):
+            node = self._root
+            for char in word[:self.max_prefix_length]:
+                node = node.children.setdefault(char, _TrieNode())
+                node.keys.add(key)
+
+    def _remove_words(self, key, title):
+        for word in set(tokenize(title)):
+            node = self._root
+            for char in word[:self.max_prefix_length]:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                node.keys.discard(key)
+
+    def _lookup(self, prefix):
+        node = self._root
+        for char in prefix[:self.max_prefix_length]:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.keys
+
+    def search(self, text, limit=25):
+        """Find tracks whose title words start with every word in text"""
+        words = tokenize(text)
+        if not words:
+            return []
+
+        # Start from the rarest prefix so the intersection stays small
+        candidates = sorted((self._lookup(word) for word in words), key=len)
+        matches = set(candidates[0])
+        for keys in candidates[1:]:
+            matches &= keys
+            if not matches:
+                return []
+
+        ranked = sorted(matches, key=lambda key: self._tracks[key]['play_count'], reverse=True)
+        return [(self._tracks[key]['title'], self._tracks[key]['url']) for key in ranked[:limit]]
+
+
+class RemoteSearchCache:
+    """Debounced, cached wrapper around a slow remote search function"""
+
+    def __init__(self, search_func, *, debounce=0.35, ttl=600, max_entries=1000):
+        self.search_func = search_func
+        self.debounce = debounce
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results = {}  # query -> (expires_at, results)
+        self._inflight = {}
+        self._latest = {}
+
+    def get_cached(self, query):
+        entry = self._results.get(query)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def search(self, user_id, query, timeout):
+        """Search after the user stops typing; None if superseded or too slow"""
+        query = ' '.join(tokenize(query))
+        cached = self.get_cached(query)
+        if cached is not None:
+            return cached
+
+        marker = object()
+        self._latest[user_id] = marker
+        await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) is not marker:
+            # A newer keystroke from the same user replaced this one
+            return None
+        del self._latest[user_id]
+
+        task = self._inflight.get(query)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run(query))
+            self._inflight[query] = task
+
+        try:
+            # The search keeps running after a timeout so the next keystroke hits the cache
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _run(self, query):
+        try:
+            try:
+                results = await self.search_func(query)
+            except Exception as e:
+                logger.warning("Remote search failed for %r: %s", query, e)
+                return []
+            if len(self._results) >= self.max_entries:
+                # Drop the entry that expires first
+                oldest = min(self._results, key=lambda key: self._results[key][0])
+                del self._results[oldest]
+            self._results[query] = (time.monotonic() + self.ttl, results)
+            return results
+        finally:
+            self._inflight.pop(query, None)
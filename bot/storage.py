@@ -0,0 +1,276 @@
+import abc
+import gzip
+import heapq
+import itertools
+import json
+import os
+from collections import defaultdict
+from datetime import timedelta
+from bot.calendar_io import format_ndjson_record
+from bot.recurrence import iter_occurrences, next_occurrence, parse_datetime
+
+# 1 week, 1 day and 1 hour before, in minutes
+DEFAULT_REMINDER_OFFSETS = (10080, 1440, 60)
+
+def build_reminder_rows(event_id, event_date, recurrence, offsets, now):
+    """Build (event_id, offset, occurrence, fire_at) rows for reminders still ahead"""
+    rows = []
+    for offset_minutes in offsets:
+        offset = timedelta(minutes=offset_minutes)
+        if recurrence:
+            occurrence = next_occurrence(event_date, recurrence, now + offset)
+        else:
+            # A reminder that should already have fired is skipped
+            occurrence = event_date if event_date - offset > now else None
+        if occurrence:
+            rows.append((event_id, offset_minutes, occurrence, occurrence - offset))
+    return rows
+
+def next_reminder_occurrence(event_date, recurrence, offset_minutes, occurrence_at, now):
+    """Get the occurrence a sent reminder moves on to, or None if it is done"""
+    if not recurrence:
+        return None
+    # Skip occurrences whose reminder time already passed
+    after = max(parse_datetime(occurrence_at), now + timedelta(minutes=offset_minutes))
+    return next_occurrence(parse_datetime(event_date), recurrence, after)
+
+def plan_due_reminders(rows, now):
+    """Split due reminder rows into outbox entries and reminder row updates/deletes"""
+    outbox_rows = []
+    updates = []
+    deletes = []
+    for row in rows:
+        occurrence = parse_datetime(row['occurrence_at'])
+        # Reminders for dates that already happened (e.g. while offline) are dropped
+        if occurrence > now:
+            outbox_rows.append((
+                row['reminder_id'], row['event_id'], row['guild_id'], row['channel_id'], row['user_id'],
+                row['title'], row['description'], occurrence, row['offset_minutes'], now
+            ))
+        upcoming = next_reminder_occurrence(row['event_date'], row['recurrence'], row['offset_minutes'], occurrence, now)
+        if upcoming:
+            updates.append((upcoming, upcoming - timedelta(minutes=row['offset_minutes']), row['reminder_id']))
+        else:
+            deletes.append((row['reminder_id'],))
+    return outbox_rows, updates, deletes
+
+def iter_chunks(iterable, size):
+    """Yield lists of up to size items without reading the whole iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def merge_upcoming_events(one_off, recurring, now, window_end):
+    """Merge one-off events with repeating events expanded inside the window, by date"""
+    if not recurring:
+        return one_off
+
+    def expand(event):
+        # Only occurrences inside the window are ever generated
+        start = parse_datetime(event['event_date'])
+        for occurrence in iter_occurrences(start, event['recurrence'], now, window_end):
+            yield occurrence, event['id'], {**event, 'event_date': occurrence}
+
+    streams = [((parse_datetime(event['event_date']), event['id'], event) for event in one_off)]
+    streams.extend(expand(event) for event in recurring)
+    return [event for _, _, event in heapq.merge(*streams, key=lambda item: item[:2])]
+
+
+# Columns of an event kept in the archive, in /export's NDJSON shape plus ownership
+ARCHIVE_EVENT_FIELDS = ('id', 'guild_id', 'user_id', 'channel_id', 'couple_id', 'title', 'description', 'event_date', 'created_at')
+
+def pack_archive(events):
+    """Group archived events by guild as (guild_id, count, first date, last date, gzipped NDJSON)"""
+    by_guild = defaultdict(list)
+    for event in events:
+        by_guild[event['guild_id']].append(event)
+    batches = []
+    for guild_id, guild_events in by_guild.items():
+        payload = ''.join(format_ndjson_record({'type': 'event', **event}) for event in guild_events)
+        dates = [parse_datetime(event['event_date']) for event in guild_events]
+        batches.append((guild_id, len(guild_events), min(dates), max(dates), gzip.compress(payload.encode())))
+    return batches
+
+def unpack_archive(payload):
+    """Yield the event records stored in one archive batch"""
+    for line in gzip.decompress(payload).decode().splitlines():
+        record = json.loads(line)
+        record['event_date'] = parse_datetime(record['event_date'])
+        yield record
+
+def count_archived_by_couple(events):
+    """(count, couple_id) pairs for archived events that belong to a couple"""
+    counts = defaultdict(int)
+    for event in events:
+        if event['couple_id'] is not None:
+            counts[event['couple_id']] += 1
+    return [(count, couple_id) for couple_id, count in counts.items()]
+
+
+class StorageBackend(abc.ABC):
+    """Interface every database backend implements"""
+
+    @abc.abstractmethod
+    async def init_db(self):
+        """Create tables and run migrations"""
+
+    async def close(self):
+        """Release connections held by the backend"""
+
+    @abc.abstractmethod
+    async def add_calendar_event(self, guild_id, user_id, channel_id, title, description, event_date, recurrence=None, reminder_offsets=None):
+        """Add a new calendar event and its reminders, returning the event ID"""
+
+    @abc.abstractmethod
+    async def import_calendar(self, guild_id, user_id, channel_id, records, reminder_offsets=None, chunk_size=500):
+        """Bulk insert event and milestone records in one transaction, returning (events, milestones)"""
+
+    @abc.abstractmethod
+    def iter_calendar_export(self, guild_id):
+        """Asynchronously yield a guild's events (archived ones first) and then its milestones as records"""
+
+    @abc.abstractmethod
+    async def archive_past_events(self, before, limit=500):
+        """Move up to limit one-off events dated before a moment into the compressed archive.
+
+        Returns how many events were moved. Couple stats keep counting them.
+        """
+
+    async def reclaim_space(self, max_pages=1000):
+        """Return up to max_pages of free database pages to the OS, returning how many were freed"""
+        return 0
+
+    @abc.abstractmethod
+    async def purge_guild(self, guild_id):
+        """Delete everything stored for a guild, returning how many rows were removed"""
+
+    @abc.abstractmethod
+    async def get_upcoming_events(self, guild_id, days_ahead=30):
+        """Get upcoming events for a guild, with repeating events expanded in the window"""
+
+    @abc.abstractmethod
+    async def get_upcoming_reminders(self, limit=500):
+        """Get reminders that are due, oldest first"""
+
+    @abc.abstractmethod
+    async def mark_reminder_sent(self, reminder_id):
+        """Mark reminder as sent, moving repeating events on to their next occurrence"""
+
+    @abc.abstractmethod
+    async def enqueue_due_reminders(self, limit=500, lookahead=0):
+        """Move due reminders into the outbox in one transaction, returning how many were queued.
+
+        Reminders firing within lookahead seconds are queued early so they can share a digest,
+        and are ready to send right away, up to lookahead seconds before their fire time.
+        """
+
+    @abc.abstractmethod
+    async def claim_outbox(self, limit=100, fence=None):
+        """Claim pending outbox entries that are ready to send.
+
+        fence is an optional (lease name, token) pair: nothing is claimed once
+        another holder has taken the lease and bumped its token.
+        """
+
+    @abc.abstractmethod
+    async def acquire_lease(self, name, holder, ttl):
+        """Take or renew a lease for ttl seconds, returning its fencing token or None if someone else holds it.
+
+        The token goes up each time the lease changes hands.
+        """
+
+    @abc.abstractmethod
+    async def release_lease(self, name, holder):
+        """Let a lease expire now if holder still has it"""
+
+    @abc.abstractmethod
+    async def complete_outbox(self, outbox_ids):
+        """Mark claimed outbox entries as sent"""
+
+    @abc.abstractmethod
+    async def retry_outbox(self, outbox_id, error, next_attempt_at):
+        """Put a claimed outbox entry back to pending for a later attempt"""
+
+    @abc.abstractmethod
+    async def fail_outbox(self, outbox_id, error):
+        """Give up on a claimed outbox entry"""
+
+    @abc.abstractmethod
+    async def recover_outbox(self, stale_before, prune_before):
+        """Release claims older than stale_before and prune finished entries, returning released count"""
+
+    @abc.abstractmethod
+    async def delete_event(self, event_id, user_id):
+        """Delete an event (only by the creator), returning whether it existed"""
+
+    @abc.abstractmethod
+    async def set_user_preference(self, guild_id, user_id, key, value):
+        """Set a user preference"""
+
+    @abc.abstractmethod
+    async def get_user_preference(self, guild_id, user_id, key, default=None):
+        """Get a user preference"""
+
+    @abc.abstractmethod
+    async def add_milestone(self, guild_id, user1_id, user2_id, milestone_type, milestone_date, description):
+        """Add a couple milestone, returning its ID"""
+
+    @abc.abstractmethod
+    async def get_milestones(self, guild_id, user_id):
+        """Get the milestones of every couple a user is in, newest first"""
+
+    @abc.abstractmethod
+    async def get_couple_stats(self, guild_id, user_id, partner_id=None):
+        """Get a couple's summary stats and milestone counts by type, or None.
+
+        Without a partner, picks the user's couple with the most milestones.
+        """
+
+    @abc.abstractmethod
+    async def roll_up_attended_dates(self, now=None):
+        """Count dates that passed since each couple's attended_through into events_attended.
+
+        Reads add the dates since the watermark themselves, so this only
+        keeps that range short. Returns how many couples were updated.
+        """
+
+    @abc.abstractmethod
+    async def record_track_play(self, track_key, title, url, duration):
+        """Record that a track was played"""
+
+    @abc.abstractmethod
+    async def get_played_tracks(self, limit=5000):
+        """Get the most played tracks, with their measured loudness if known"""
+
+    @abc.abstractmethod
+    async def get_track_loudness(self, track_key):
+        """Get a track's stored EBU R128 measurement, or None"""
+
+    @abc.abstractmethod
+    async def save_track_loudness(self, track_key, title, url, duration, loudness):
+        """Store a track's EBU R128 measurement (loudness_i, loudness_tp, loudness_lra)"""
+
+    @abc.abstractmethod
+    async def search_dates(self, guild_id, text, limit=10, offset=0):
+        """Full-text search over a guild's events and milestones, returning (total, rows)"""
+
+
+def create_database():
+    """Create the storage backend selected by the DATABASE_BACKEND env var"""
+    backend = os.getenv("DATABASE_BACKEND", "sqlite").lower()
+
+    if backend == "sqlite":
+        from bot.database import Database
+        return Database(os.getenv("DATABASE_PATH", "couple_bot.db"))
+
+    if backend in ("postgres", "postgresql"):
+        from bot.postgres_database import PostgresDatabase
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            raise RuntimeError("DATABASE_URL must be set to use the postgres backend")
+        return PostgresDatabase(dsn)
+
+    raise RuntimeError(f"Unknown DATABASE_BACKEND: {backend}")
@@ -0,0 +1,55 @@
+from bot.memory import LOW_MEMORY
+
+# What the bot reads from yt-dlp's output: playback, the audio cache key,
+# embeds, and enough of the chosen format for yt-dlp to download it again
+TRACK_FIELDS = (
+    'id', 'title', 'url', 'webpage_url', 'original_url', 'duration', 'thumbnail', 'is_live',
+    'extractor', 'extractor_key', 'format_id', 'ext', 'protocol', 'acodec', 'vcodec', 'abr',
+    'http_headers'
+)
+
+
+class Track:
+    """The fields of one extracted track the bot uses, without the rest.
+
+    yt-dlp's info dicts carry every format, thumbnail and subtitle it found,
+    often hundreds of KB per track. A Track keeps TRACK_FIELDS in slots and
+    answers get(), [] and `in` like the dict it replaces, so queue entries,
+    players and the audio cache work with either.
+    """
+
+    __slots__ = TRACK_FIELDS
+
+    def __init__(self, **fields):
+        for name in TRACK_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_info(cls, info):
+        if isinstance(info, cls):
+            return info
+        return cls(**{name: info.get(name) for name in TRACK_FIELDS})
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in TRACK_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in TRACK_FIELDS and getattr(self, key) is not None
+
+    def keys(self):
+        """Fields that are set, so dict(track) gives yt-dlp a plain info dict"""
+        return [name for name in TRACK_FIELDS if getattr(self, name) is not None]
+
+    def __repr__(self):
+        return f"Track({self.title!r}, {self.webpage_url or self.url!r})"
+
+
+def track_info(info):
+    """Trim extractor output to a Track in low-memory mode, otherwise keep it as it is"""
+    return Track.from_info(info) if LOW_MEMORY else info
@@ -43,6 +43,34 @@ def parse_date_string(date_str):
     
     raise ValueError(f"Invalid date format: {date_str}")
 
+def parse_reminder_offsets(text):
+    """Parse reminder offsets like '1w, 1d, 1h, 30m' into minutes"""
+    units = {'m': 1, 'h': 60, 'd': 1440, 'w': 10080}
+    offsets = []
+    
+    for part in re.split(r'[,\s]+', text.strip().lower()):
+        if not part:
+            continue
+        match = re.match(r'^(\d+)([mhdw])$', part)
+        if not match:
+            raise ValueError(f"Invalid reminder offset: {part}")
+        minutes = int(match.group(1)) * units[match.group(2)]
+        if minutes <= 0:
+            raise ValueError(f"Reminder offset must be positive: {part}")
+        offsets.append(minutes)
+    
+    if not offsets:
+        raise ValueError("No reminder offsets given")
+    
+    return sorted(set(offsets), reverse=True)
+
+def format_reminder_offset(minutes):
+    """Format a reminder offset in minutes as text (e.g. '1 day')"""
+    for unit, size in (("week", 10080), ("day", 1440), ("hour", 60), ("minute", 1)):
+        if minutes % size == 0:
+            count = minutes // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+
 def create_error_embed(title, description, color=0xff4444):
     """Create a standardized error embed"""
     embed = discord.Embed(
@@ -87,6 +115,21 @@ def format_duration(seconds):
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
+def format_time_together(since, now=None):
+    """Format the time since a date as text (e.g. '2 years, 3 months, 5 days')"""
+    elapsed = (now or datetime.now()) - since
+    years = elapsed.days // 365
+    months = (elapsed.days % 365) // 30
+    days = elapsed.days % 30
+    
+    text = ""
+    if years > 0:
+        text += f"{years} year{'s' if years != 1 else ''}, "
+    if months > 0:
+        text += f"{months} month{'s' if months != 1 else ''}, "
+    text += f"{days} day{'s' if days != 1 else ''}"
+    return text
+
 def is_url(string):
     """Check if string is a valid URL"""
     url_pattern = re.compile(
@@ -141,10 +184,10 @@ def get_relative_time(target_date):
         else:
             return "now"
 
-def validate_guild_member(interaction, user_id):
-    """Validate that a user ID belongs to a guild member"""
+async def validate_guild_member(interaction, user_id):
+    """Validate that a user ID belongs to a guild member, using the bot's member cache"""
     try:
-        member = interaction.guild.get_member(user_id)
+        member = await interaction.client.member_cache.get_member(interaction.guild, user_id)
         return member is not None
     except:
         return False
@@ -1,16 +1,23 @@
 import os
 import discord
 from discord.ext import commands, tasks
+from discord import app_commands
 import asyncio
 import logging
-from bot.database import Database
-from bot.calendar_cog import CalendarCog
-from bot.music_cog import MusicCog
-from bot.couple_cog import CoupleCog
+import signal
+from bot.storage import create_database
+from bot.reminder_dispatcher import ReminderDispatcher
+from bot.retention import RetentionJob
+from bot.backup import BackupJob
+from bot.leader import LeaderElection
+from bot.member_cache import MemberCache
+from bot.diagnostics import LoopDiagnostics
+from bot.memory import client_options, start_tracing
+from bot.log_config import setup_logging, bind, bind_interaction
 from keep_alive import keep_alive
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (JSON lines written off the event loop by a listener thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Bot configuration
@@ -19,39 +26,142 @@ intents.voice_states = True
 intents.guilds = True
 # Removed privileged intents (message_content, members) for easier setup
 
+# Cogs are loaded as extensions so owners can hot reload them with /reload
+EXTENSIONS = (
+    'bot.calendar_cog',
+    'bot.music_cog',
+    'bot.couple_cog',
+    'bot.admin_cog'
+)
+
+class CoupleCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        """Runs in the task that handles the command, so log lines from it carry its IDs"""
+        bind_interaction(interaction)
+        bot = self.client
+        # Without the members intent, interactions are the cheapest source of members
+        bot.member_cache.remember(interaction)
+        
+        if bot.draining:
+            if interaction.type is discord.InteractionType.application_command:
+                await interaction.response.send_message(
+                    "🔄 I'm restarting! Try again in a few seconds 💕",
+                    ephemeral=True
+                )
+            return False
+        
+        # Shutdown waits for these tasks before closing the database
+        task = asyncio.current_task()
+        bot.inflight.add(task)
+        task.add_done_callback(bot.inflight.discard)
+        return True
+    
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        """Ignore the check failures from refusing commands while draining"""
+        if isinstance(error, app_commands.CheckFailure) and self.client.draining:
+            return
+        await super().on_error(interaction, error)
+
 class CoupleBot(commands.Bot):
     def __init__(self):
         super().__init__(
             command_prefix='!',
-            intents=intents,
-            help_command=None
+            help_command=None,
+            tree_cls=CoupleCommandTree,
+            # LOW_MEMORY=1 turns off the message cache, member caching and unused intents
+            **client_options(intents)
         )
-        self.db = Database()
+        self.db = create_database()
+        self.reminder_dispatcher = ReminderDispatcher(self)
+        self.retention = RetentionJob(self)
+        self.backup = BackupJob(self)
+        self.leader = LeaderElection(self.db)
+        self.member_cache = MemberCache()
+        self.diagnostics = None
+        self.music_handoff = None
+        self.inflight = set()
+        self.draining = False
         
     async def setup_hook(self):
         """Called when the bot is starting up"""
+        # Opt-in event loop diagnostics, started first so every task is timed
+        if os.getenv("DIAGNOSTICS"):
+            self.diagnostics = LoopDiagnostics(slow_threshold=int(os.getenv("DIAGNOSTICS_SLOW_MS", "100")) / 1000)
+            self.diagnostics.start(asyncio.get_running_loop())
+        
+        # Opt-in allocation tracing from the start, otherwise /memory starts it on first use
+        if os.getenv("TRACEMALLOC"):
+            start_tracing(int(os.getenv("TRACEMALLOC")))
+        
         # Initialize database
         await self.db.init_db()
         
         # Add cogs
-        await self.add_cog(CalendarCog(self))
-        await self.add_cog(MusicCog(self))
-        await self.add_cog(CoupleCog(self))
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
         
-        # Start background tasks
+        # Start background tasks, reminders and maintenance only run on the leader
+        self.leader_task.change_interval(seconds=self.leader.renew_interval)
+        self.leader_task.start()
         self.reminder_task.start()
+        self.retention_task.start()
+        self.backup_task.start()
+        
+        # A redeploy sends SIGTERM: finish what's running, save queues, then exit
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: self.loop.create_task(self.shutdown()))
+        except NotImplementedError:
+            logger.info("SIGTERM handling is not available on this platform")
         
         # Sync slash commands
         try:
             synced = await self.tree.sync()
-            logger.info(f"Synced {len(synced)} command(s)")
+            logger.info("Synced %s command(s)", len(synced))
         except Exception as e:
-            logger.error(f"Failed to sync commands: {e}")
+            logger.error("Failed to sync commands: %s", e)
+
+    async def shutdown(self, timeout=30):
+        """Drain in-flight commands, save music queues and close"""
+        if self.draining:
+            return
+        self.draining = True
+        logger.info("Shutting down, waiting for %s in-flight command(s)", len(self.inflight))
+        
+        if self.inflight:
+            await asyncio.wait(set(self.inflight), timeout=timeout)
+        
+        # Let a running reminder batch finish so nothing is left claimed
+        try:
+            await asyncio.wait_for(self.reminder_dispatcher.lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Reminder batch still running, it will be redelivered after restart")
+        self.reminder_task.cancel()
+        self.retention_task.cancel()
+        self.backup_task.cancel()
+        # Another replica can take over reminders without waiting for the lease to expire
+        self.leader_task.cancel()
+        await self.leader.release()
+        
+        music = self.get_cog('MusicCog')
+        if music:
+            try:
+                await music.save_state()
+            except Exception as e:
+                logger.error("Failed to save music state: %s", e)
+        
+        await self.close()
+
+    async def close(self):
+        """Close database connections when the bot shuts down"""
+        await super().close()
+        await self.db.close()
+        if self.diagnostics:
+            self.diagnostics.stop()
 
     async def on_ready(self):
         """Called when the bot is ready"""
-        logger.info(f'{self.user} has connected to Discord!')
-        logger.info(f'Bot is in {len(self.guilds)} guilds')
+        logger.info("%s has connected to Discord!", self.user)
+        logger.info("Bot is in %s guilds", len(self.guilds))
         
         # Set status
         activity = discord.Activity(
@@ -60,6 +170,15 @@ class CoupleBot(commands.Bot):
         )
         await self.change_presence(activity=activity)
 
+    async def on_guild_remove(self, guild):
+        """Forget a guild's data once the bot is removed from it"""
+        bind(guild_id=guild.id, job="guild_remove")
+        try:
+            deleted = await self.db.purge_guild(guild.id)
+            logger.info("Removed from guild %s, deleted %s row(s)", guild.id, deleted)
+        except Exception as e:
+            logger.error("Error purging guild %s: %s", guild.id, e)
+
     async def on_command_error(self, ctx, error):
         """Global error handler"""
         if isinstance(error, commands.CommandNotFound):
@@ -69,49 +188,72 @@ class CoupleBot(commands.Bot):
         elif isinstance(error, commands.CommandOnCooldown):
             await ctx.send(f"⏰ This command is on cooldown. Try again in {error.retry_after:.2f} seconds.")
         else:
-            logger.error(f"Unexpected error: {error}")
+            logger.error("Unexpected error: %s", error)
             await ctx.send("❌ Something went wrong! Please try again later.")
 
-    @tasks.loop(hours=1)
+    @tasks.loop(minutes=1)
     async def reminder_task(self):
-        """Check for upcoming reminders every hour"""
+        """Send reminders that are due"""
+        if not self.leader.is_leader:
+            return
+        bind(job="reminder_task")
         try:
-            upcoming_reminders = await self.db.get_upcoming_reminders()
-            
-            for reminder in upcoming_reminders:
-                guild = self.get_guild(reminder['guild_id'])
-                if guild:
-                    channel = guild.get_channel(reminder['channel_id'])
-                    if channel and hasattr(channel, 'send'):
-                        embed = discord.Embed(
-                            title="💕 Reminder Alert!",
-                            description=f"**{reminder['title']}**\n\n{reminder['description']}",
-                            color=0xff69b4,
-                            timestamp=reminder['reminder_date']
-                        )
-                        embed.add_field(
-                            name="When",
-                            value=f"<t:{int(reminder['event_date'].timestamp())}:F>",
-                            inline=False
-                        )
-                        embed.set_footer(text="Don't forget! 💖")
-                        
-                        await channel.send(
-                            f"<@{reminder['user_id']}>",
-                            embed=embed
-                        )
-                        
-                        # Mark reminder as sent
-                        await self.db.mark_reminder_sent(reminder['id'])
-                        
+            # The first run also redelivers what an earlier leader left claimed
+            await self.reminder_dispatcher.run_once(fence=self.leader.fence)
         except Exception as e:
-            logger.error(f"Error in reminder task: {e}")
+            logger.error("Error in reminder task: %s", e)
 
     @reminder_task.before_loop
     async def before_reminder_task(self):
         """Wait until bot is ready before starting reminder task"""
         await self.wait_until_ready()
 
+    @tasks.loop(hours=1)
+    async def retention_task(self):
+        """Archive long-past dates and reclaim database space"""
+        if not self.leader.is_leader:
+            return
+        bind(job="retention_task")
+        try:
+            await self.retention.run_once()
+        except Exception as e:
+            logger.error("Error in retention task: %s", e)
+
+    @retention_task.before_loop
+    async def before_retention_task(self):
+        """Wait until bot is ready before starting retention task"""
+        await self.wait_until_ready()
+
+    @tasks.loop(minutes=10)
+    async def backup_task(self):
+        """Back up the database while the bot keeps running, once the last backup is old enough"""
+        if not self.leader.is_leader:
+            return
+        bind(job="backup_task")
+        try:
+            await self.backup.run_once()
+        except Exception as e:
+            logger.error("Error in backup task: %s", e)
+
+    @backup_task.before_loop
+    async def before_backup_task(self):
+        """Wait until bot is ready before starting backup task"""
+        await self.wait_until_ready()
+
+    @tasks.loop(seconds=5)
+    async def leader_task(self):
+        """Take or renew the leader lease"""
+        bind(job="leader_task")
+        try:
+            await self.leader.run_once()
+        except Exception as e:
+            logger.error("Error in leader task: %s", e)
+
+    @leader_task.before_loop
+    async def before_leader_task(self):
+        """Only compete for leadership once connected, so the leader can send reminders"""
+        await self.wait_until_ready()
+
 # Bot instance
 bot = CoupleBot()
 
@@ -128,6 +270,7 @@ if __name__ == "__main__":
         exit(1)
     
     try:
-        bot.run(token)
+        # discord.py would otherwise add its own synchronous stderr handler
+        bot.run(token, log_handler=None)
     except Exception as e:
-        logger.error(f"Failed to start bot: {e}")
+        logger.error("Failed to start bot: %s", e)
@@ -0,0 +1,61 @@
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from bot.backup import create_backup, restore_backup
+
+
+def make_database(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('CREATE TABLE notes (body TEXT)')
+    connection.executemany('INSERT INTO notes VALUES (?)', [(f'backup {i}',) for i in range(rows)])
+    connection.commit()
+    connection.close()
+
+
+def crash_after_writes(path, rows):
+    """Write rows in another process that dies before they are checkpointed, leaving a -wal behind"""
+    script = (
+        "import os, sqlite3, sys\n"
+        "connection = sqlite3.connect(sys.argv[1])\n"
+        "connection.execute('PRAGMA wal_autocheckpoint = 0')\n"
+        "connection.executemany('INSERT INTO notes VALUES (?)', [('live',)] * int(sys.argv[2]))\n"
+        "connection.commit()\n"
+        "os._exit(0)\n"
+    )
+    subprocess.run([sys.executable, '-c', script, str(path), str(rows)], check=True)
+
+
+def bodies(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute('SELECT body FROM notes')]
+    finally:
+        connection.close()
+
+
+def test_restore_refuses_over_a_leftover_wal(tmp_path):
+    database = tmp_path / 'couple_bot.db'
+    make_database(database, 10)
+    backup, _ = create_backup(str(database), str(tmp_path / 'backups'), step_sleep=0)
+    crash_after_writes(database, 50)
+    assert (tmp_path / 'couple_bot.db-wal').exists()
+
+    with pytest.raises(FileExistsError):
+        restore_backup(backup, str(database))
+    # Nothing was touched, the live rows are still there
+    assert bodies(database).count('live') == 50
+
+
+def test_forced_restore_discards_the_wal(tmp_path):
+    database = tmp_path / 'couple_bot.db'
+    make_database(database, 10)
+    backup, _ = create_backup(str(database), str(tmp_path / 'backups'), step_sleep=0)
+    crash_after_writes(database, 50)
+
+    restore_backup(backup, str(database), force=True)
+    assert not (tmp_path / 'couple_bot.db-wal').exists()
+    assert bodies(database) == [f'backup {i}' for i in range(10)]
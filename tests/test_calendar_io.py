@@ -0,0 +1,100 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from bot.calendar_io import (
+    format_ndjson_record, iter_ics_header, iter_ics_record, iter_ics_records, iter_ndjson_records,
+    ICS_FOOTER
+)
+
+
+@pytest.fixture
+def berlin(monkeypatch):
+    """Run with a local timezone that is two hours ahead of UTC in summer"""
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def export_ics(*records):
+    lines = list(iter_ics_header())
+    for record in records:
+        lines.extend(iter_ics_record(record, 1001, '20300101T000000Z'))
+    lines.append(ICS_FOOTER)
+    return ''.join(lines).splitlines(keepends=True)
+
+
+def event(**fields):
+    record = {
+        'type': 'event', 'id': 1, 'title': 'Dinner', 'description': None,
+        'event_date': '2030-07-01T19:30:00', 'recurrence': None
+    }
+    record.update(fields)
+    return record
+
+
+def test_ics_round_trip_keeps_escaped_text():
+    title = 'Dinner; wine, then dessert'
+    description = 'Bring the file from C:\\new\\notes\nand a second line'
+    errors = []
+    records = list(iter_ics_records(export_ics(event(title=title, description=description)), errors))
+
+    assert errors == []
+    assert records[0]['title'] == title
+    assert records[0]['description'] == description
+    assert records[0]['event_date'] == datetime(2030, 7, 1, 19, 30)
+
+
+def test_ics_utc_time_matches_ndjson_offset(berlin):
+    ics = [
+        'BEGIN:VEVENT\r\n', 'SUMMARY:Call\r\n', 'DTSTART:20300701T120000Z\r\n', 'END:VEVENT\r\n'
+    ]
+    ndjson = ['{"title": "Call", "event_date": "2030-07-01T16:00:00+02:00"}\n']
+    errors = []
+
+    from_ics = list(iter_ics_records(ics, errors))
+    from_ndjson = list(iter_ndjson_records(ndjson, errors))
+
+    assert errors == []
+    assert from_ics[0]['event_date'] == datetime(2030, 7, 1, 14, 0)
+    assert from_ndjson[0]['event_date'] == datetime(2030, 7, 1, 16, 0)
+
+
+def test_ndjson_offset_is_converted_to_local_time(berlin):
+    errors = []
+    records = list(iter_ndjson_records(['{"title": "Call", "event_date": "2030-07-01T12:00:00Z"}'], errors))
+
+    assert records[0]['event_date'] == datetime(2030, 7, 1, 14, 0)
+
+
+def test_ics_rrule_with_count_is_skipped_and_reported():
+    ics = export_ics(event(recurrence='weekly'))
+    ics = [line.replace('RRULE:FREQ=WEEKLY', 'RRULE:FREQ=WEEKLY;COUNT=4') for line in ics]
+    errors = []
+
+    assert list(iter_ics_records(ics, errors)) == []
+    assert len(errors) == 1
+    assert 'Unsupported RRULE: FREQ=WEEKLY;COUNT=4' in errors[0]
+
+
+def test_ics_plain_rrule_round_trips():
+    errors = []
+    records = list(iter_ics_records(export_ics(event(recurrence='monthly')), errors))
+
+    assert errors == []
+    assert records[0]['recurrence'] == 'monthly'
+
+
+def test_ndjson_round_trip():
+    exported = event(title='Trip "north"', description='Line one\nLine two', recurrence='yearly')
+    errors = []
+    records = list(iter_ndjson_records([format_ndjson_record(exported)], errors))
+
+    assert errors == []
+    assert records[0] == {
+        'type': 'event', 'title': 'Trip "north"', 'description': 'Line one\nLine two',
+        'event_date': datetime(2030, 7, 1, 19, 30), 'recurrence': 'yearly'
+    }
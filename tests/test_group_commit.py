@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from bot.group_commit import GroupCommitWriter
+
+
+async def insert(db, value):
+    cursor = await db.execute('INSERT INTO notes VALUES (?)', (value,))
+    return cursor.lastrowid
+
+
+async def create_table(db):
+    await db.execute('CREATE TABLE IF NOT EXISTS notes (value INTEGER)')
+
+
+def test_concurrent_writes_share_commits(tmp_path):
+    async def main():
+        writer = GroupCommitWriter(str(tmp_path / 'notes.db'))
+        await writer.submit(create_table)
+
+        async def failing(db):
+            await insert(db, 0)
+            raise ValueError("bad write")
+
+        results = await asyncio.gather(
+            *(writer.submit(lambda db, value=value: insert(db, value)) for value in range(1, 51)),
+            writer.submit(failing),
+            return_exceptions=True
+        )
+        count = await writer.submit(lambda db: db.execute_fetchall('SELECT COUNT(*) FROM notes'))
+        await writer.close()
+        return writer, results, count
+
+    writer, results, count = asyncio.run(main())
+    assert isinstance(results[-1], ValueError)
+    # Only the failing write was rolled back
+    assert sorted(results[:-1]) == list(range(1, 51))
+    assert count == [(50,)]
+    assert writer.commits < writer.writes
+
+
+def test_writes_fail_instead_of_hanging_when_the_writer_dies(tmp_path):
+    async def main():
+        writer = GroupCommitWriter(str(tmp_path / 'missing' / 'notes.db'))
+        results = await asyncio.wait_for(
+            asyncio.gather(*(writer.submit(create_table) for _ in range(5)), return_exceptions=True),
+            timeout=5
+        )
+        # The next submit starts a new writer, which works once the directory exists
+        (tmp_path / 'missing').mkdir()
+        await asyncio.wait_for(writer.submit(create_table), timeout=5)
+        value = await writer.submit(lambda db: insert(db, 7))
+        await writer.close()
+        return results, value
+
+    results, value = asyncio.run(main())
+    assert len(results) == 5
+    assert all(isinstance(result, Exception) for result in results)
+    assert value == 1
+
+
+def test_cancelled_writer_cancels_queued_writes(tmp_path):
+    async def main():
+        writer = GroupCommitWriter(str(tmp_path / 'notes.db'))
+        await writer.submit(create_table)
+
+        async def slow(db):
+            await asyncio.sleep(10)
+
+        first = asyncio.ensure_future(writer.submit(slow))
+        await asyncio.sleep(0.1)
+        queued = asyncio.ensure_future(writer.submit(lambda db: insert(db, 1)))
+        await asyncio.sleep(0)
+        writer._task.cancel()
+        for future in (first, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(future, timeout=5)
+
+    asyncio.run(main())
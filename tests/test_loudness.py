@@ -0,0 +1,63 @@
+import asyncio
+
+from bot.audio_cache import AudioCache
+from bot.loudness import LoudnessAnalyzer
+
+
+class FakeDatabase:
+    """track_metadata loudness columns, by track key"""
+
+    def __init__(self):
+        self.stored = {}
+
+    async def get_track_loudness(self, track_key):
+        return self.stored.get(track_key)
+
+
+class FakeCache:
+    def is_cacheable(self, data):
+        return True
+
+    def get(self, data):
+        return None
+
+
+def track(number):
+    return {'extractor_key': 'Youtube', 'id': f"video{number}", 'title': f"Song {number}"}
+
+
+def loudness(number):
+    return {'loudness_i': -10.0 - number, 'loudness_tp': -3.0, 'loudness_lra': 5.0}
+
+
+def test_measured_keeps_only_the_most_recently_used_tracks():
+    analyzer = LoudnessAnalyzer(FakeDatabase(), FakeCache(), target=-14.0, max_entries=2)
+    # Most played first, as get_played_tracks returns them
+    analyzer.load([{'track_key': AudioCache.cache_key(track(number)), **loudness(number)} for number in range(3)])
+
+    assert list(analyzer.measured) == [AudioCache.cache_key(track(1)), AudioCache.cache_key(track(0))]
+
+    # Playing track 1 makes track 0 the next one to go
+    assert analyzer.gain(track(1)) == -3.0
+    analyzer._remember(AudioCache.cache_key(track(4)), loudness(4))
+
+    assert len(analyzer.measured) == 2
+    assert analyzer.gain(track(0)) is None
+    assert analyzer.gain(track(1)) == -3.0
+
+
+def test_evicted_track_is_reloaded_from_the_database():
+    async def scenario():
+        db = FakeDatabase()
+        analyzer = LoudnessAnalyzer(db, FakeCache(), target=-14.0, max_entries=1)
+        for number in range(2):
+            db.stored[AudioCache.cache_key(track(number))] = loudness(number)
+            await analyzer.schedule(track(number))
+
+        assert analyzer.gain(track(0)) is None
+        await analyzer.schedule(track(0))
+
+        assert analyzer.gain(track(0)) == -4.0
+        assert analyzer.gain(track(1)) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+
+from bot.member_cache import MemberCache
+
+
+class FakeGuild:
+    """Guild with an empty gateway cache that counts fetch_member calls"""
+
+    def __init__(self, guild_id=1001):
+        self.id = guild_id
+        self.fetched = []
+
+    def get_member(self, user_id):
+        return None
+
+    async def fetch_member(self, user_id):
+        self.fetched.append(user_id)
+        return f"member-{user_id}"
+
+
+def test_hits_keep_members_from_being_evicted():
+    async def scenario():
+        guild = FakeGuild()
+        cache = MemberCache(max_entries=2)
+        cache.put(guild.id, 1, "member-1")
+        cache.put(guild.id, 2, "member-2")
+
+        # 1 was added first but used last, so 2 is the one to go
+        assert await cache.get_member(guild, 1) == "member-1"
+        cache.put(guild.id, 3, "member-3")
+
+        assert len(cache) == 2
+        assert await cache.get_member(guild, 1) == "member-1"
+        assert await cache.get_member(guild, 2) == "member-2"
+        assert guild.fetched == [2]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_lookups_share_one_fetch():
+    async def scenario():
+        guild = FakeGuild()
+        cache = MemberCache()
+        members = await asyncio.gather(*(cache.get_member(guild, 7) for _ in range(5)))
+
+        assert members == ["member-7"] * 5
+        assert guild.fetched == [7]
+        assert cache.stats()['entries'] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from bot import recurrence
+from bot.recurrence import RECURRENCE_RULES, iter_occurrences, next_occurrence, nth_occurrence
+
+
+def walk_next(start, rule, after):
+    """next_occurrence without the skip-ahead, one occurrence at a time"""
+    n = 0
+    while nth_occurrence(start, rule, n) <= after:
+        n += 1
+    return nth_occurrence(start, rule, n)
+
+
+def test_monthly_from_january_31_clamps_to_month_end():
+    start = datetime(2024, 1, 31, 9, 0)
+
+    assert [nth_occurrence(start, 'monthly', n) for n in range(5)] == [
+        datetime(2024, 1, 31, 9, 0),
+        datetime(2024, 2, 29, 9, 0),
+        datetime(2024, 3, 31, 9, 0),
+        datetime(2024, 4, 30, 9, 0),
+        datetime(2024, 5, 31, 9, 0)
+    ]
+    # Clamping one month doesn't carry over to the next
+    assert next_occurrence(start, 'monthly', datetime(2025, 2, 28, 9, 0)) == datetime(2025, 3, 31, 9, 0)
+
+
+def test_yearly_from_february_29_falls_back_to_february_28():
+    start = datetime(2024, 2, 29, 20, 0)
+
+    assert [nth_occurrence(start, 'yearly', n) for n in range(5)] == [
+        datetime(2024, 2, 29, 20, 0),
+        datetime(2025, 2, 28, 20, 0),
+        datetime(2026, 2, 28, 20, 0),
+        datetime(2027, 2, 28, 20, 0),
+        datetime(2028, 2, 29, 20, 0)
+    ]
+    assert next_occurrence(start, 'yearly', datetime(2027, 3, 1)) == datetime(2028, 2, 29, 20, 0)
+
+
+@pytest.mark.parametrize('rule', RECURRENCE_RULES)
+@pytest.mark.parametrize('start', [datetime(2024, 1, 31, 9, 0), datetime(2024, 2, 29, 23, 59)])
+@pytest.mark.parametrize('after', [
+    datetime(2524, 3, 1),
+    datetime(2524, 2, 29, 23, 59),
+    datetime(2299, 12, 31, 23, 59, 59)
+])
+def test_next_occurrence_far_ahead_matches_walking(start, rule, after):
+    assert next_occurrence(start, rule, after) == walk_next(start, rule, after)
+
+
+@pytest.mark.parametrize('rule', RECURRENCE_RULES)
+def test_next_occurrence_far_ahead_skips_to_the_window(monkeypatch, rule):
+    calls = []
+
+    def counting(start, rule, n):
+        calls.append(n)
+        return nth_occurrence(start, rule, n)
+
+    monkeypatch.setattr(recurrence, 'nth_occurrence', counting)
+    next_occurrence(datetime(2024, 1, 31, 9, 0), rule, datetime(2524, 3, 1))
+
+    assert len(calls) <= 3
+
+
+def test_one_off_event_only_inside_window():
+    start = datetime(2030, 7, 1, 19, 30)
+
+    assert list(iter_occurrences(start, None, datetime(2030, 7, 1), datetime(2030, 7, 2))) == [start]
+    assert list(iter_occurrences(start, None, start, datetime(2030, 7, 2))) == []
+    assert next_occurrence(start, None, datetime(2031, 1, 1)) is None
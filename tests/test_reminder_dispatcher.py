@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import discord
+
+from bot.reminder_dispatcher import MAX_EMBED_CHARS, MAX_EMBED_FIELDS, build_digests, digest_field
+
+START = datetime(2030, 7, 1, 12, 0)
+
+
+def outbox_entry(number, channel_id=55, title='Dinner', description=''):
+    return {
+        'id': number, 'guild_id': 1001, 'channel_id': channel_id, 'user_id': 101 + number % 3,
+        'title': title, 'description': description, 'event_date': START + timedelta(seconds=number)
+    }
+
+
+def digest_embed(entries):
+    """The embed send_digest would post for these entries"""
+    embed = discord.Embed(title="💕 Reminder Digest!", description=f"**{len(entries)}** dates coming up:")
+    for entry in entries:
+        name, value = digest_field(entry)
+        embed.add_field(name=name, value=value, inline=False)
+    embed.set_footer(text="Don't forget! 💖")
+    return embed
+
+
+def test_digest_splits_after_25_fields():
+    entries = [outbox_entry(number) for number in range(26)]
+    digests = build_digests(entries)
+
+    assert [len(digest) for digest in digests] == [MAX_EMBED_FIELDS, 1]
+    assert [entry['id'] for digest in digests for entry in digest] == list(range(26))
+
+
+def test_digest_splits_before_embed_size_limit():
+    # Each field is 1099 characters, so five fit in the 5500 budget and six don't
+    entries = [outbox_entry(number, title='T' * 100, description='d' * 950) for number in range(12)]
+    digests = build_digests(entries)
+
+    assert [len(digest) for digest in digests] == [5, 5, 2]
+    for digest in digests:
+        embed = digest_embed(digest)
+        assert len(embed) <= MAX_EMBED_CHARS
+
+
+def test_capped_fields_still_fit_one_embed():
+    # Longest possible name and value for every field
+    entries = [outbox_entry(number, title='T' * 300, description='d' * 2000) for number in range(30)]
+    digests = build_digests(entries)
+
+    for digest in digests:
+        embed = digest_embed(digest)
+        assert len(embed.fields) <= MAX_EMBED_FIELDS
+        assert len(embed) <= MAX_EMBED_CHARS
+        assert all(len(field.name) <= 256 and len(field.value) <= 1024 for field in embed.fields)
+
+
+def test_single_oversized_entry_still_gets_its_own_digest():
+    entries = [outbox_entry(number, description='d' * 5000) for number in range(3)]
+    digests = build_digests(entries, max_chars=1000)
+
+    assert [len(digest) for digest in digests] == [1, 1, 1]
+
+
+def test_digests_are_per_channel_and_in_date_order():
+    entries = [outbox_entry(3, channel_id=56), outbox_entry(2), outbox_entry(1, channel_id=56), outbox_entry(0)]
+    digests = build_digests(entries)
+
+    assert [[entry['id'] for entry in digest] for digest in digests] == [[0, 2], [1, 3]]
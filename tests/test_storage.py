@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from bot.storage import build_reminder_rows, plan_due_reminders
+
+NOW = datetime(2030, 7, 1, 12, 0)
+
+
+def due_row(occurrence_at, recurrence=None, offset_minutes=60, event_date=None):
+    """A reminder row as the due-reminders query returns it, dates as SQLite stores them"""
+    return {
+        'reminder_id': 7, 'event_id': 3, 'guild_id': 1001, 'channel_id': 55, 'user_id': 101,
+        'title': 'Dinner', 'description': 'Booked for two',
+        'event_date': (event_date or occurrence_at).isoformat(), 'recurrence': recurrence,
+        'occurrence_at': occurrence_at.isoformat(), 'offset_minutes': offset_minutes
+    }
+
+
+def test_past_one_off_reminder_is_skipped():
+    event_date = NOW + timedelta(minutes=30)
+
+    # The hour-before reminder is already late, the ten-minutes-before one isn't
+    assert build_reminder_rows(3, event_date, None, [60, 10], NOW) == [
+        (3, 10, event_date, event_date - timedelta(minutes=10))
+    ]
+    assert build_reminder_rows(3, NOW - timedelta(days=1), None, [0], NOW) == []
+
+
+def test_recurring_reminder_starts_after_now_plus_offset():
+    # Weekly on Mondays at 12:30; NOW is Monday 12:00
+    event_date = datetime(2030, 6, 3, 12, 30)
+
+    assert build_reminder_rows(3, event_date, 'weekly', [10, 60], NOW) == [
+        (3, 10, datetime(2030, 7, 1, 12, 30), datetime(2030, 7, 1, 12, 20)),
+        (3, 60, datetime(2030, 7, 8, 12, 30), datetime(2030, 7, 8, 11, 30))
+    ]
+
+
+def test_due_one_off_reminder_is_sent_and_deleted():
+    occurrence = NOW + timedelta(minutes=60)
+    outbox, updates, deletes = plan_due_reminders([due_row(occurrence)], NOW)
+
+    assert outbox == [(7, 3, 1001, 55, 101, 'Dinner', 'Booked for two', occurrence, 60, NOW)]
+    assert updates == []
+    assert deletes == [(7,)]
+
+
+def test_due_recurring_reminder_moves_past_now_plus_offset():
+    occurrence = NOW + timedelta(minutes=30)
+    row = due_row(occurrence, recurrence='daily', offset_minutes=24 * 60 + 60,
+                  event_date=occurrence - timedelta(days=10))
+    outbox, updates, deletes = plan_due_reminders([row], NOW)
+
+    # Tomorrow's reminder time is already behind us too, so it goes to the day after
+    upcoming = occurrence + timedelta(days=2)
+    assert [entry[7] for entry in outbox] == [occurrence]
+    assert updates == [(upcoming, upcoming - timedelta(minutes=24 * 60 + 60), 7)]
+    assert deletes == []
+
+
+def test_occurrence_already_past_is_dropped():
+    one_off = due_row(NOW - timedelta(hours=2))
+    recurring = due_row(NOW - timedelta(hours=2), recurrence='weekly', offset_minutes=15)
+    recurring['reminder_id'] = 8
+    outbox, updates, deletes = plan_due_reminders([one_off, recurring], NOW)
+
+    upcoming = NOW - timedelta(hours=2) + timedelta(weeks=1)
+    assert outbox == []
+    assert updates == [(upcoming, upcoming - timedelta(minutes=15), 8)]
+    assert deletes == [(7,)]
@@ -0,0 +1,437 @@
+"""Behaviour every StorageBackend must share.
+
+Every test runs against SQLite in a temporary file and against Postgres in
+a database of its own, created for the test and dropped afterwards. The
+Postgres server is DATABASE_URL when it is set (the role needs CREATEDB),
+otherwise a throwaway one started for the session with pgserver
+(pip install pgserver) or with initdb and pg_ctl from PATH.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+from bot.database import Database
+from bot.recurrence import parse_datetime
+
+BACKENDS = ['sqlite', 'postgres']
+
+GUILD, OTHER_GUILD = 1001, 1002
+# Discord snowflakes fit in a BIGINT, so do these
+USER, PARTNER, OTHER = 101, 202, 303
+
+
+def start_initdb_server(directory):
+    """Start a Postgres server in directory with initdb and pg_ctl, returning (dsn, stop)"""
+    if shutil.which('initdb') is None or shutil.which('pg_ctl') is None:
+        pytest.skip('No Postgres server: set DATABASE_URL, pip install pgserver or put initdb on PATH')
+    if os.geteuid() == 0:
+        pytest.skip('initdb refuses to run as root: set DATABASE_URL or pip install pgserver')
+    data = directory / 'data'
+    subprocess.run(['initdb', '-D', str(data), '-A', 'trust', '-U', 'postgres'], check=True, capture_output=True)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    subprocess.run(
+        ['pg_ctl', '-D', str(data), '-l', str(directory / 'log'), '-w', 'start',
+         '-o', f"-p {port} -k {directory} -c listen_addresses=''"],
+        check=True, capture_output=True
+    )
+
+    def stop():
+        subprocess.run(['pg_ctl', '-D', str(data), '-m', 'immediate', 'stop'], capture_output=True)
+
+    return f"postgresql://postgres@/postgres?host={directory}&port={port}", stop
+
+
+@pytest.fixture(scope='session')
+def postgres_server(tmp_path_factory):
+    """DSN of a Postgres server the tests can create databases on"""
+    pytest.importorskip('asyncpg')
+    dsn = os.getenv('DATABASE_URL')
+    if dsn:
+        yield dsn
+        return
+    try:
+        import pgserver
+    except ImportError:
+        pgserver = None
+    directory = tmp_path_factory.mktemp('postgres')
+    if pgserver is not None:
+        server = pgserver.get_server(directory, cleanup_mode='delete')
+        yield server.get_uri()
+        server.cleanup()
+    else:
+        dsn, stop = start_initdb_server(directory)
+        yield dsn
+        stop()
+
+
+async def execute_on(dsn, statement):
+    import asyncpg
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(statement)
+    finally:
+        await conn.close()
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmp_path):
+    """A function returning a fresh, uninitialized backend of each kind"""
+    if request.param == 'sqlite':
+        yield lambda: Database(str(tmp_path / 'couple_bot.db'))
+        return
+
+    from bot.postgres_database import PostgresDatabase
+    server = request.getfixturevalue('postgres_server')
+    name = f"contract_{secrets.token_hex(6)}"
+    asyncio.run(execute_on(server, f'CREATE DATABASE {name}'))
+    dsn = urlunsplit(urlsplit(server)._replace(path=f'/{name}'))
+    yield lambda: PostgresDatabase(dsn, min_size=1, max_size=2)
+    asyncio.run(execute_on(server, f'DROP DATABASE {name}'))
+
+
+def run(backend, scenario):
+    """Run scenario(db) on an initialized backend and close it"""
+    async def main():
+        db = backend()
+        await db.init_db()
+        try:
+            await scenario(db)
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+
+def later(**delta):
+    # Whole seconds, both backends round-trip these unchanged
+    return datetime.now().replace(microsecond=0) + timedelta(**delta)
+
+
+def test_init_db_is_idempotent(backend):
+    async def scenario(db):
+        await db.init_db()
+        assert await db.get_upcoming_events(GUILD) == []
+
+    run(backend, scenario)
+
+
+def test_upcoming_events(backend):
+    async def scenario(db):
+        soon = await db.add_calendar_event(GUILD, USER, 1, 'Picnic', 'In the park', later(days=2))
+        await db.add_calendar_event(GUILD, USER, 1, 'Far off', None, later(days=60))
+        await db.add_calendar_event(GUILD, USER, 1, 'Gone', None, later(days=-2))
+        weekly = await db.add_calendar_event(GUILD, USER, 1, 'Movie night', None, later(days=-1), recurrence='weekly')
+        await db.add_calendar_event(OTHER_GUILD, USER, 1, 'Elsewhere', None, later(days=1))
+
+        events = await db.get_upcoming_events(GUILD, days_ahead=30)
+        titles = [event['title'] for event in events]
+        assert titles.count('Picnic') == 1
+        assert [event['id'] for event in events if event['title'] == 'Picnic'] == [soon]
+        assert not {'Far off', 'Gone', 'Elsewhere'} & set(titles)
+        # A weekly event shows up once per week in the window, all in the future
+        repeats = [event for event in events if event['id'] == weekly]
+        assert 4 <= len(repeats) <= 5
+        assert all(event['event_date'] > datetime.now() for event in repeats)
+        dates = [parse_datetime(event['event_date']) for event in events]
+        assert dates == sorted(dates)
+
+    run(backend, scenario)
+
+
+def test_delete_event_only_by_creator(backend):
+    async def scenario(db):
+        event_id = await db.add_calendar_event(GUILD, USER, 1, 'Dinner', None, later(days=1))
+        assert await db.delete_event(event_id, OTHER) is False
+        assert await db.delete_event(event_id, USER) is True
+        assert await db.delete_event(event_id, USER) is False
+        assert await db.get_upcoming_events(GUILD) == []
+
+    run(backend, scenario)
+
+
+def test_due_reminders(backend):
+    async def scenario(db):
+        # Reminders an hour ahead of dates an hour and a second away
+        soon = datetime.now() + timedelta(hours=1, seconds=1)
+        once = await db.add_calendar_event(GUILD, USER, 1, 'Once', None, soon, reminder_offsets=[60])
+        daily = await db.add_calendar_event(GUILD, USER, 1, 'Daily', None, soon, recurrence='daily', reminder_offsets=[60])
+        assert await db.get_upcoming_reminders() == []
+        await asyncio.sleep(1.2)
+
+        due = await db.get_upcoming_reminders()
+        assert sorted(reminder['id'] for reminder in due) == sorted([once, daily])
+        assert all(abs(parse_datetime(reminder['event_date']) - soon) < timedelta(seconds=1) for reminder in due)
+        for reminder in due:
+            await db.mark_reminder_sent(reminder['reminder_id'])
+        # The one-off reminder is done, the daily one moved on to tomorrow
+        assert await db.get_upcoming_reminders() == []
+        assert len([event for event in await db.get_upcoming_events(GUILD) if event['id'] == daily]) >= 29
+
+    run(backend, scenario)
+
+
+def test_user_preferences(backend):
+    async def scenario(db):
+        assert await db.get_user_preference(GUILD, USER, 'timezone', 'UTC') == 'UTC'
+        await db.set_user_preference(GUILD, USER, 'timezone', 'Europe/Paris')
+        await db.set_user_preference(GUILD, USER, 'timezone', 'Asia/Tokyo')
+        assert await db.get_user_preference(GUILD, USER, 'timezone') == 'Asia/Tokyo'
+        assert await db.get_user_preference(GUILD, PARTNER, 'timezone') is None
+
+    run(backend, scenario)
+
+
+def test_milestones(backend):
+    async def scenario(db):
+        await db.add_milestone(GUILD, USER, PARTNER, 'anniversary', later(days=-400), 'Where it started')
+        await db.add_milestone(GUILD, PARTNER, USER, 'trip', later(days=-30), 'Lisbon')
+        await db.add_milestone(GUILD, OTHER, OTHER + 1, 'trip', later(days=-10), 'Not their couple')
+        await db.add_milestone(OTHER_GUILD, USER, PARTNER, 'trip', later(days=-5), 'Elsewhere')
+
+        # Every couple the user is in, whichever way round the pair was given
+        milestones = await db.get_milestones(GUILD, PARTNER)
+        assert [milestone['description'] for milestone in milestones] == ['Lisbon', 'Where it started']
+
+    run(backend, scenario)
+
+
+def test_search_dates(backend):
+    async def scenario(db):
+        await db.add_calendar_event(GUILD, USER, 1, 'Sushi dinner', 'At the harbour', later(days=5))
+        await db.add_calendar_event(GUILD, USER, 1, 'Cinema', 'Then sushi nearby', later(days=6))
+        await db.add_calendar_event(OTHER_GUILD, USER, 1, 'Sushi elsewhere', None, later(days=6))
+        await db.add_milestone(GUILD, USER, PARTNER, 'trip', later(days=-5), 'Sushi class in Osaka')
+
+        total, rows = await db.search_dates(GUILD, 'sushi')
+        assert total == 3
+        assert {row['kind'] for row in rows} == {'event', 'milestone'}
+        # A title match ranks above a description match
+        titles = [row['title'] for row in rows if row['kind'] == 'event']
+        assert titles == ['Sushi dinner', 'Cinema']
+
+        total, page = await db.search_dates(GUILD, 'sushi', limit=1, offset=1)
+        assert total == 3 and len(page) == 1
+        assert await db.search_dates(GUILD, '   ') == (0, [])
+
+    run(backend, scenario)
+
+
+def test_played_tracks(backend):
+    async def scenario(db):
+        await db.record_track_play('youtube:a', 'Song A', 'https://example.com/a', 180)
+        await db.record_track_play('youtube:b', 'Song B', 'https://example.com/b', 200)
+        await db.record_track_play('youtube:b', 'Song B', 'https://example.com/b', 200)
+
+        played = await db.get_played_tracks()
+        assert [(track['track_key'], track['play_count']) for track in played] == [('youtube:b', 2), ('youtube:a', 1)]
+        assert [track['track_key'] for track in await db.get_played_tracks(limit=1)] == ['youtube:b']
+
+    run(backend, scenario)
+
+
+def test_import_and_export_calendar(backend):
+    async def scenario(db):
+        when = later(days=3)
+        records = [
+            {'type': 'event', 'title': 'Imported', 'description': 'From a file', 'event_date': when, 'recurrence': None},
+            {'type': 'event', 'title': 'Weekly', 'description': 'Repeats', 'event_date': later(days=-3), 'recurrence': 'weekly'},
+            {'type': 'milestone', 'user1_id': USER, 'user2_id': PARTNER, 'milestone_type': 'trip',
+             'milestone_date': later(days=-3), 'description': 'Imported trip'}
+        ]
+        assert await db.import_calendar(GUILD, USER, 1, records, chunk_size=1) == (2, 1)
+        assert 'Imported' in [event['title'] for event in await db.get_upcoming_events(GUILD)]
+        assert [milestone['description'] for milestone in await db.get_milestones(GUILD, USER)] == ['Imported trip']
+
+        exported = [record async for record in db.iter_calendar_export(GUILD)]
+        assert [(record['type'], record.get('title') or record['description']) for record in exported] == [
+            ('event', 'Weekly'), ('event', 'Imported'), ('milestone', 'Imported trip')
+        ]
+        assert parse_datetime(exported[1]['event_date']) == when
+        assert exported[0]['recurrence'] == 'weekly'
+
+    run(backend, scenario)
+
+
+async def claim(db, fence=None):
+    return await db.claim_outbox(limit=1000, fence=fence)
+
+
+def test_reminder_outbox(backend):
+    async def scenario(db):
+        # The 1h reminder fires in a minute, the 2h one in an hour
+        event_id = await db.add_calendar_event(
+            GUILD, USER, 1, 'Call mum', None, later(minutes=61), reminder_offsets=[60, 120]
+        )
+        assert await db.enqueue_due_reminders(lookahead=120) == 1
+        assert await db.enqueue_due_reminders(lookahead=120) == 0
+
+        claimed = await claim(db)
+        assert [(row['event_id'], row['offset_minutes']) for row in claimed] == [(event_id, 60)]
+        assert isinstance(claimed[0]['event_date'], datetime)
+        # Claimed entries aren't handed out twice
+        assert await claim(db) == []
+
+        await db.retry_outbox(claimed[0]['id'], 'Missing Access', datetime.now() - timedelta(seconds=1))
+        retried = await claim(db)
+        assert [row['id'] for row in retried] == [claimed[0]['id']]
+        assert retried[0]['attempts'] == 2
+
+        await db.complete_outbox([claimed[0]['id']])
+        await db.recover_outbox(datetime.now() + timedelta(minutes=1), datetime.now() - timedelta(days=1))
+        assert await claim(db) == []
+
+    run(backend, scenario)
+
+
+def test_recover_outbox_releases_stale_claims(backend):
+    async def scenario(db):
+        await db.add_calendar_event(GUILD, USER, 1, 'Stale', None, later(minutes=61), reminder_offsets=[60])
+        await db.enqueue_due_reminders(lookahead=120)
+        claimed = await claim(db)
+        assert len(claimed) == 1
+
+        # Claims older than stale_before go back to pending
+        assert await db.recover_outbox(datetime.now() + timedelta(seconds=1), datetime.now() - timedelta(days=1)) == 1
+        again = await claim(db)
+        assert [row['id'] for row in again] == [claimed[0]['id']]
+        await db.fail_outbox(again[0]['id'], 'Unknown Channel')
+        await db.recover_outbox(datetime.now() + timedelta(seconds=1), datetime.now() - timedelta(days=1))
+        assert await claim(db) == []
+
+    run(backend, scenario)
+
+
+def test_couple_stats(backend):
+    async def scenario(db):
+        assert await db.get_couple_stats(GUILD, USER) is None
+        await db.add_milestone(GUILD, USER, PARTNER, 'anniversary', later(days=-400), 'Where it started')
+        await db.add_milestone(GUILD, PARTNER, USER, 'trip', later(days=-30), 'Lisbon')
+        await db.add_milestone(GUILD, USER, OTHER, 'trip', later(days=-10), 'Another couple')
+
+        stats = await db.get_couple_stats(GUILD, PARTNER, USER)
+        assert stats['milestone_count'] == 2
+        assert stats['milestone_counts'] == {'anniversary': 1, 'trip': 1}
+        # Without a partner, the couple with the most milestones
+        assert (await db.get_couple_stats(GUILD, USER))['milestone_count'] == 2
+
+    run(backend, scenario)
+
+
+def test_couple_stats_count_attended_dates_without_writing(backend):
+    async def scenario(db):
+        await db.add_milestone(GUILD, USER, PARTNER, 'first_date', later(days=-100), None)
+        await db.add_calendar_event(GUILD, USER, 1, 'Done', None, later(days=-3))
+        await db.add_calendar_event(GUILD, PARTNER, 1, 'Also done', None, later(days=-1))
+        await db.add_calendar_event(GUILD, USER, 1, 'Still to come', None, later(days=3))
+
+        before = await db.get_couple_stats(GUILD, USER, PARTNER)
+        assert before['events_total'] == 3
+        assert before['events_attended'] == 2
+        # Reading again moves nothing, and a roll-up doesn't change the answer
+        assert (await db.get_couple_stats(GUILD, USER, PARTNER))['events_attended'] == 2
+        assert await db.roll_up_attended_dates() == 1
+        assert (await db.get_couple_stats(GUILD, USER, PARTNER))['events_attended'] == 2
+
+    run(backend, scenario)
+
+
+def test_archive_past_events(backend):
+    async def scenario(db):
+        await db.add_milestone(GUILD, USER, PARTNER, 'first_date', later(days=-100), None)
+        await db.add_calendar_event(GUILD, USER, 1, 'Old', None, later(days=-50))
+        await db.add_calendar_event(GUILD, USER, 1, 'New', None, later(days=5))
+
+        assert await db.archive_past_events(datetime.now() - timedelta(days=1)) == 1
+        assert await db.archive_past_events(datetime.now() - timedelta(days=1)) == 0
+        # Archived dates still count as attended and still export, first
+        stats = await db.get_couple_stats(GUILD, USER, PARTNER)
+        assert (stats['events_total'], stats['events_attended']) == (2, 1)
+        records = [record async for record in db.iter_calendar_export(GUILD)]
+        assert [record['title'] for record in records if record['type'] == 'event'] == ['Old', 'New']
+        assert await db.reclaim_space() >= 0
+
+    run(backend, scenario)
+
+
+def test_purge_guild(backend):
+    async def scenario(db):
+        await db.add_calendar_event(GUILD, USER, 1, 'Dinner', None, later(days=1))
+        await db.add_calendar_event(GUILD, USER, 1, 'Lunch', None, later(days=-40))
+        await db.add_milestone(GUILD, USER, PARTNER, 'trip', later(days=-1), 'Rome')
+        await db.set_user_preference(GUILD, USER, 'timezone', 'UTC')
+        await db.archive_past_events(datetime.now() - timedelta(days=1))
+        await db.add_calendar_event(OTHER_GUILD, USER, 1, 'Dinner', None, later(days=1))
+
+        assert await db.purge_guild(GUILD) > 0
+        assert await db.get_upcoming_events(GUILD) == []
+        assert await db.get_milestones(GUILD, USER) == []
+        assert await db.get_couple_stats(GUILD, USER) is None
+        assert await db.get_user_preference(GUILD, USER, 'timezone') is None
+        assert await db.search_dates(GUILD, 'dinner') == (0, [])
+        assert [record async for record in db.iter_calendar_export(GUILD)] == []
+        assert await db.purge_guild(GUILD) == 0
+        assert len(await db.get_upcoming_events(OTHER_GUILD)) == 1
+
+    run(backend, scenario)
+
+
+def test_track_loudness(backend):
+    async def scenario(db):
+        loudness = {'loudness_i': -14.2, 'loudness_tp': -1.0, 'loudness_lra': 6.5}
+        assert await db.get_track_loudness('youtube:a') is None
+        # Measured before it was ever played
+        await db.save_track_loudness('youtube:a', 'Song A', 'https://example.com/a', 180, loudness)
+        assert await db.get_played_tracks() == []
+        await db.record_track_play('youtube:a', 'Song A', 'https://example.com/a', 180)
+
+        assert await db.get_track_loudness('youtube:a') == pytest.approx(loudness)
+        [played] = await db.get_played_tracks()
+        assert played['play_count'] == 1
+        assert played['loudness_i'] == pytest.approx(-14.2)
+
+    run(backend, scenario)
+
+
+def test_leases_and_fencing(backend):
+    async def scenario(db):
+        token = await db.acquire_lease('leader', 'a', 30)
+        assert token is not None
+        assert await db.acquire_lease('leader', 'b', 30) is None
+        # Renewing keeps the token
+        assert await db.acquire_lease('leader', 'a', 30) == token
+
+        # Only the holder can release a lease
+        await db.release_lease('leader', 'b')
+        assert await db.acquire_lease('leader', 'b', 30) is None
+        await db.release_lease('leader', 'a')
+        taken = await db.acquire_lease('leader', 'b', 30)
+        assert taken > token
+
+        # A claim fenced with the old holder's token gets nothing
+        await db.add_calendar_event(GUILD, USER, 1, 'Fenced', None, later(minutes=61), reminder_offsets=[60])
+        await db.enqueue_due_reminders(lookahead=120)
+        assert await claim(db, fence=('leader', token)) == []
+        assert len(await claim(db, fence=('leader', taken))) == 1
+
+    run(backend, scenario)
+
+
+def test_expired_lease_changes_hands(backend):
+    async def scenario(db):
+        token = await db.acquire_lease('leader', 'a', 0.5)
+        await asyncio.sleep(0.6)
+        assert await db.acquire_lease('leader', 'b', 30) == token + 1
+        assert await db.acquire_lease('leader', 'a', 30) is None
+
+    run(backend, scenario)